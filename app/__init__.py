@@ -1,8 +1,61 @@
 # __init__.py
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from .models.tables import Base
+import threading
 
-engine = create_engine("sqlite:///health_fitness_app.db")
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Created on first use by init_app, so importing the package (or just the
+# models) never opens the database
+_engine = None
+_session_factory = None
+_init_lock = threading.Lock()
+
+
+def init_app(url=None, profile=None, create_schema=True):
+    """Create the engine and session factory, and the schema if it is missing.
+
+    Calling it again returns the existing session factory.
+
+    Args:
+        url (str): Database URL, defaults to $HEALTH_APP_DATABASE_URL
+        profile (str): Engine profile, see app.engine.PROFILES
+        create_schema (bool): Create the tables unless the schema version matches
+
+    Returns:
+        sessionmaker: Session factory bound to the engine
+    """
+    global _engine, _session_factory
+    with _init_lock:
+        if _session_factory is None:
+            from sqlalchemy.orm import sessionmaker
+            from .engine import create_app_engine
+            from .migrations import ensure_schema
+            from .rollups import install_rollup_hooks
+
+            engine = create_app_engine(url, profile)
+            if create_schema:
+                ensure_schema(engine)
+            session_factory = sessionmaker(bind=engine)
+            install_rollup_hooks(session_factory)
+            _engine, _session_factory = engine, session_factory
+    return _session_factory
+
+
+def get_engine():
+    """Return the app engine, initializing the app if needed."""
+    init_app()
+    return _engine
+
+
+def get_sessionmaker():
+    """Return the app session factory, initializing the app if needed."""
+    return init_app()
+
+
+def get_session():
+    """Open a new session on the app database."""
+    return get_sessionmaker()()
+
+
+def __getattr__(name):
+    # Keeps `from app import Session` working without initializing on import
+    if name == "Session":
+        return get_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,357 @@
+# analytics.py
+import itertools
+import json
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import Date, Float, bindparam, cast, func, select
+from app.downsampling import TIERS
+from app.fast_reads import driver_cursor, epoch_seconds
+from app.models.tables import (
+    HealthMetrics,
+    HeartRateLog,
+    NutritionLog,
+    SleepLog,
+    WaterIntakeLog,
+    WeightLog,
+    WorkoutLog,
+)
+
+SECONDS_PER_DAY = 86400
+
+# Metric name -> (time column, value column). Dates are taken as midnight.
+METRICS = {
+    "weight": (WeightLog.date_recorded, WeightLog.weight),  # kg
+    "calories": (NutritionLog.date, NutritionLog.calories),  # per meal
+    "water": (WaterIntakeLog.date, WaterIntakeLog.water_intake),  # ml
+    "sleep": (SleepLog.start_time, SleepLog.duration),  # minutes per night
+    "workout_minutes": (WorkoutLog.date, WorkoutLog.duration),
+    "heart_rate": (HeartRateLog.time_recorded, HeartRateLog.heart_rate),
+    "resting_heart_rate": (HealthMetrics.date, HealthMetrics.resting_heart_rate),
+}
+
+# Arrays of float64 Unix epoch seconds (times.astype("datetime64[s]") turns
+# them into datetimes) and float64 values, oldest first
+Series = namedtuple("Series", ["times", "values"])
+# The same for many users, ordered by user and then time
+CohortSeries = namedtuple("CohortSeries", ["user_ids", "times", "values"])
+HeartRateBuckets = namedtuple(
+    "HeartRateBuckets", ["times", "min", "max", "mean", "count"]
+)
+Correlation = namedtuple("Correlation", ["r", "days"])
+
+
+def _series_statement(metric, cohort):
+    time_column, value_column = METRICS[metric]
+    user_id = time_column.class_.user_id
+    columns = [epoch_seconds(time_column), cast(value_column, Float)]
+    if cohort:
+        # One JSON parameter instead of an expanding IN, so the statement
+        # compiles once like the other prebuilt statements
+        requested = func.json_each(bindparam("user_ids")).table_valued("value")
+        columns.insert(0, user_id)
+        condition = user_id.in_(select(requested.c.value))
+    else:
+        condition = user_id == bindparam("user_id")
+    statement = (
+        select(*columns)
+        .where(condition)
+        .where(time_column >= bindparam("start_time"))
+        .where(time_column < bindparam("end_time"))
+        .where(value_column.isnot(None))
+    )
+    order = [time_column.asc()]
+    return statement.order_by(*([user_id] if cohort else []) + order)
+
+
+SERIES_STATEMENTS = {
+    (metric, cohort): _series_statement(metric, cohort)
+    for metric in METRICS
+    for cohort in (False, True)
+}
+HEART_RATE_BUCKETS = {
+    tier.name: (
+        select(
+            epoch_seconds(tier.model.bucket),
+            tier.model.min_heart_rate,
+            tier.model.max_heart_rate,
+            tier.model.heart_rate_sum * 1.0 / tier.model.heart_rate_count,
+            tier.model.heart_rate_count,
+        )
+        .where(tier.model.user_id == bindparam("user_id"))
+        .where(tier.model.bucket >= bindparam("start_time"))
+        .where(tier.model.bucket < bindparam("end_time"))
+        .order_by(tier.model.bucket)
+    )
+    for tier in TIERS
+}
+
+
+def _stored_bound(value, column, default):
+    """Format a range bound as the column's stored text, so SQLite compares text.
+
+    A date column holds midnights, so a bound inside a day moves to the next
+    midnight.
+    """
+    if value is None:
+        value = default
+    if isinstance(column.type, Date):
+        if isinstance(value, datetime):
+            day = value.date()
+            if value != datetime.combine(day, datetime.min.time()):
+                day += timedelta(days=1)
+            value = day
+        return value.isoformat()
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return value.isoformat(" ", "microseconds")
+
+
+def _bounds(column, start_time, end_time):
+    return {
+        "start_time": _stored_bound(start_time, column, datetime.min),
+        "end_time": _stored_bound(end_time, column, date.max),
+    }
+
+
+def _fetch_columns(session, statement, parameters, width):
+    """Run a statement and return its numeric columns as float64 arrays."""
+    cursor = driver_cursor(session, statement, parameters)
+    try:
+        flat = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.float64)
+    finally:
+        cursor.close()
+    return flat.reshape(-1, width).T.copy()
+
+
+def load_series(session, user_id, metric, start_time=None, end_time=None):
+    """Load one metric of a user into NumPy arrays, straight from the cursor.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        metric (str): One of METRICS
+        start_time (date or datetime): Start of the range, defaults to all
+        end_time (date or datetime): End of the range, excluded
+
+    Returns:
+        Series: Epoch seconds and values, oldest first
+    """
+    parameters = {"user_id": user_id}
+    parameters.update(_bounds(METRICS[metric][0], start_time, end_time))
+    statement = SERIES_STATEMENTS[(metric, False)]
+    times, values = _fetch_columns(session, statement, parameters, 2)
+    return Series(times, values)
+
+
+def load_cohort_series(session, user_ids, metric, start_time=None, end_time=None):
+    """Load one metric of many users into NumPy arrays with one statement.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users
+        metric (str): One of METRICS
+        start_time (date or datetime): Start of the range, defaults to all
+        end_time (date or datetime): End of the range, excluded
+
+    Returns:
+        CohortSeries: int64 user IDs, epoch seconds and values
+    """
+    parameters = {"user_ids": json.dumps([int(user_id) for user_id in user_ids])}
+    parameters.update(_bounds(METRICS[metric][0], start_time, end_time))
+    statement = SERIES_STATEMENTS[(metric, True)]
+    ids, times, values = _fetch_columns(session, statement, parameters, 3)
+    return CohortSeries(ids.astype(np.int64), times, values)
+
+
+def load_heart_rate_buckets(session, user_id, start_time, end_time, tier="day"):
+    """Load a user's downsampled heart rate from one tier of app.downsampling.
+
+    Years of per-second samples come back as a few thousand buckets, in
+    milliseconds, and without the raw samples the retention job pruned.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        start_time (datetime): Start of the range
+        end_time (datetime): End of the range, excluded
+        tier (str): "minute", "hour" or "day"
+
+    Returns:
+        HeartRateBuckets: Bucket start epoch seconds, min, max, mean and count
+    """
+    parameters = {
+        "user_id": user_id,
+        "start_time": _stored_bound(start_time, HeartRateLog.time_recorded, None),
+        "end_time": _stored_bound(end_time, HeartRateLog.time_recorded, None),
+    }
+    columns = _fetch_columns(session, HEART_RATE_BUCKETS[tier], parameters, 5)
+    return HeartRateBuckets(*columns[:4], columns[4].astype(np.int64))
+
+
+def split_by_user(cohort):
+    """Split a CohortSeries into a dict of user ID to Series, without copying."""
+    if not len(cohort.user_ids):
+        return {}
+    starts = np.flatnonzero(np.r_[True, cohort.user_ids[1:] != cohort.user_ids[:-1]])
+    ends = np.r_[starts[1:], len(cohort.user_ids)]
+    return {
+        int(cohort.user_ids[start]): Series(
+            cohort.times[start:end], cohort.values[start:end]
+        )
+        for start, end in zip(starts, ends)
+    }
+
+
+def rolling_mean(values, window):
+    """Mean of every window consecutive values, ending at each value.
+
+    Returns:
+        numpy.ndarray: Same length as values, NaN until a full window
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.r_[0.0, values])
+        result[window - 1 :] = (sums[window:] - sums[:-window]) / window
+    return result
+
+
+def rolling_mean_by_time(times, values, seconds):
+    """Mean of the values in the trailing (t - seconds, t] of each sample.
+
+    Suits irregular samples, where a window of n values spans varying time.
+    times must be sorted.
+
+    Returns:
+        numpy.ndarray: Same length as values
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    first = np.searchsorted(times, times - seconds, side="right")
+    last = np.arange(1, len(times) + 1)
+    sums = np.cumsum(np.r_[0.0, values])
+    return (sums[last] - sums[first]) / (last - first)
+
+
+def trend_slope(times, values, per=SECONDS_PER_DAY):
+    """Least-squares slope of values over time, in value units per `per` seconds.
+
+    Returns:
+        float: NaN with fewer than two distinct times
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(times) < 2:
+        return float("nan")
+    # Centered, so squared epoch seconds don't swamp the float64 precision
+    offsets = times - times.mean()
+    spread = np.dot(offsets, offsets)
+    if spread == 0:
+        return float("nan")
+    return float(np.dot(offsets, values - values.mean()) / spread * per)
+
+
+def trend_slopes_by_user(cohort, per=SECONDS_PER_DAY):
+    """trend_slope of every user of a CohortSeries at once, with bincount.
+
+    Returns:
+        dict: Mapping of user ID to slope, NaN for users with a single time
+    """
+    users, groups = np.unique(cohort.user_ids, return_inverse=True)
+    counts = np.bincount(groups)
+    times = cohort.times - (np.bincount(groups, cohort.times) / counts)[groups]
+    values = cohort.values - (np.bincount(groups, cohort.values) / counts)[groups]
+    spread = np.bincount(groups, times * times, minlength=len(users))
+    covariance = np.bincount(groups, times * values, minlength=len(users))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = np.where(spread > 0, covariance / spread * per, np.nan)
+    return dict(zip(users.tolist(), slopes.tolist()))
+
+
+_REDUCERS = {
+    "sum": np.add.reduceat,
+    "min": np.minimum.reduceat,
+    "max": np.maximum.reduceat,
+}
+
+
+def resample_daily(times, values, how="mean", fill=False):
+    """Aggregate samples per UTC day.
+
+    Args:
+        times (array): Epoch seconds
+        values (array): Values of the samples
+        how (str): "mean", "sum", "min", "max" or "count"
+        fill (bool): Also return the days without samples between the first
+            and last one, as NaN (0 for "count" and "sum")
+
+    Returns:
+        Series: Epoch seconds of each day's midnight and the aggregates
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(times):
+        return Series(np.empty(0), np.empty(0))
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+    # Binary search for each midnight instead of a pass over every sample
+    first_day, last_day = times[[0, -1]] // SECONDS_PER_DAY
+    day_numbers = np.arange(first_day, last_day + 1)
+    starts = np.searchsorted(times, day_numbers * SECONDS_PER_DAY)
+    has_samples = np.diff(np.r_[starts, len(times)]) > 0
+    day_numbers, starts = day_numbers[has_samples], starts[has_samples]
+    counts = np.diff(np.r_[starts, len(times)])
+    if how == "mean":
+        aggregates = np.add.reduceat(values, starts) / counts
+    elif how == "count":
+        aggregates = counts.astype(np.float64)
+    elif how in _REDUCERS:
+        aggregates = _REDUCERS[how](values, starts)
+    else:
+        raise ValueError(f"Unknown aggregate {how!r}")
+    if fill:
+        every_day = np.arange(day_numbers[0], day_numbers[-1] + 1)
+        filled = np.full(len(every_day), 0.0 if how in ("count", "sum") else np.nan)
+        filled[(day_numbers - day_numbers[0]).astype(np.int64)] = aggregates
+        day_numbers, aggregates = every_day, filled
+    return Series(day_numbers * SECONDS_PER_DAY, aggregates)
+
+
+def daily_correlation(first, second, lag_days=0, how=("mean", "mean")):
+    """Pearson correlation of two series resampled to days.
+
+    Args:
+        first (Series): e.g. sleep duration
+        second (Series): e.g. resting heart rate
+        lag_days (int): Pair each day of first with this many days later of
+            second
+        how (tuple): Daily aggregate of first and of second, see resample_daily
+
+    Returns:
+        Correlation: r, NaN with fewer than two shared days or no variance,
+        and the number of days paired
+    """
+    first_days, first_values = resample_daily(*first, how=how[0])
+    second_days, second_values = resample_daily(*second, how=how[1])
+    second_days = second_days - lag_days * SECONDS_PER_DAY
+    _, first_index, second_index = np.intersect1d(
+        first_days, second_days, assume_unique=True, return_indices=True
+    )
+    x, y = first_values[first_index], second_values[second_index]
+    if len(x) < 2 or x.std() == 0 or y.std() == 0:
+        return Correlation(float("nan"), len(x))
+    return Correlation(float(np.corrcoef(x, y)[0, 1]), len(x))
+
+
+def sleep_vs_resting_heart_rate(session, user_id, start_time=None, end_time=None):
+    """Correlate a user's nightly sleep with the next day's resting heart rate.
+
+    Returns:
+        Correlation: Negative r when longer nights come before a lower
+        resting heart rate
+    """
+    sleep = load_series(session, user_id, "sleep", start_time, end_time)
+    resting = load_series(session, user_id, "resting_heart_rate", start_time, end_time)
+    return daily_correlation(sleep, resting, lag_days=1, how=("sum", "mean"))
@@ -0,0 +1,392 @@
+# cache.py
+import functools
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from types import SimpleNamespace
+from sqlalchemy import event, select, inspect as sa_inspect
+from app import queries
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 300.0
+
+_ROLLUP = "daily_user_stats"
+
+# Query function -> tables it reads. Writes to any of them for one of the
+# function's users drop its cached results.
+QUERY_TABLES = {
+    "get_user_total_workout_duration": {"workout_logs", _ROLLUP},
+    "get_user_avg_daily_caloric_intake": {"nutrition_logs", _ROLLUP},
+    "get_user_avg_sleep_duration": {"sleep_logs", _ROLLUP},
+    "get_user_weight_records": {"weight_logs"},
+    "get_users_not_meeting_sleep_goals": {
+        "users",
+        "sleep_logs",
+        "user_fitness_goals",
+        "user_fitness_goal_targets",
+    },
+    "get_user_daily_water_intake": {"water_intake_logs", _ROLLUP},
+    "get_user_recent_blood_pressure": {"health_metrics"},
+    "get_user_avg_heart_rate_during_workouts": {
+        "heart_rate_logs",
+        "workout_logs",
+        _ROLLUP,
+        "workout_heart_rate_summaries",
+    },
+    "get_user_heart_rate_by_exercise_type": {"workout_heart_rate_summaries"},
+    "get_users_total_workout_duration": {"workout_logs"},
+    "get_users_avg_daily_caloric_intake": {"nutrition_logs"},
+    "get_users_avg_sleep_duration": {"sleep_logs"},
+    "get_users_weight_records": {"weight_logs"},
+    "get_users_daily_water_intake": {"water_intake_logs"},
+    "get_users_recent_blood_pressure": {"health_metrics"},
+    "get_users_avg_heart_rate_during_workouts": {
+        "heart_rate_logs",
+        "workout_logs",
+        "workout_heart_rate_summaries",
+    },
+}
+# The summary combines every single-user query
+QUERY_TABLES["get_user_summary"] = set().union(
+    *(tables for name, tables in QUERY_TABLES.items() if name.startswith("get_user_"))
+)
+
+# Captures the table name, without a schema prefix like the "main." that
+# parallel_populate writes
+_DML = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+    r"\s+(?:\"?\w+\"?\.)?\"?(\w+)",
+    re.IGNORECASE,
+)
+
+
+def _freeze(value):
+    """Turn query arguments into a hashable cache key part."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset, range)):
+        items = [_freeze(item) for item in value]
+        return tuple(sorted(items) if isinstance(value, (set, frozenset)) else items)
+    return value
+
+
+class _Entry:
+    __slots__ = ("data", "size", "expires_at", "tables", "user_ids")
+
+    def __init__(self, data, expires_at, tables, user_ids):
+        self.data = data
+        self.size = len(data)
+        self.expires_at = expires_at
+        self.tables = tables
+        self.user_ids = user_ids
+
+
+class QueryCache:
+    """Process-local LRU cache of query results with a TTL and a memory budget.
+
+    Results are stored pickled, so their size is known and callers can't
+    mutate a cached value. Entries are dropped when a committed write touches
+    one of the tables they read for one of their users (see install), when
+    they expire, or when the entry or byte budget is exceeded.
+
+    Args:
+        max_entries (int): Maximum number of cached results
+        max_bytes (int): Maximum total size of the pickled results
+        ttl_seconds (float): Time after which a result is recomputed, also
+            bounding staleness from writes the cache can't see (other processes)
+        clock (callable): Returns the current time in seconds
+    """
+
+    def __init__(
+        self,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        max_bytes=DEFAULT_MAX_BYTES,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.size = 0
+        # Bumped by every invalidation; results read in a transaction that
+        # began before the last invalidation may be stale and are not stored
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_classes = ()
+        self._engines = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return the hit, miss, eviction and invalidation counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+
+    def get(self, key):
+        """Return (True, value) for a live entry, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            data = entry.data
+        return True, pickle.loads(data)
+
+    def set(self, key, value, tables, user_ids=None, generation=None):
+        """Store a result unless an invalidation happened since generation.
+
+        Args:
+            key (hashable): Cache key
+            value (object): Picklable result
+            tables (set of str): Tables the result was read from
+            user_ids (frozenset of int): Users it covers, None for all users
+            generation (int): self.generation when the reading transaction began
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            entry = _Entry(data, self.clock() + self.ttl_seconds, tables, user_ids)
+            self._entries[key] = entry
+            self.size += entry.size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, touched):
+        """Drop the results that read a touched table for a touched user.
+
+        Args:
+            touched (dict): Mapping of table name to a set of user IDs, where a
+                None user ID stands for every user
+
+        Returns:
+            int: Number of entries dropped
+        """
+        with self._lock:
+            self.generation += 1
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if any(
+                    table in entry.tables
+                    and (
+                        None in user_ids
+                        or entry.user_ids is None
+                        or not entry.user_ids.isdisjoint(user_ids)
+                    )
+                    for table, user_ids in touched.items()
+                )
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.size = 0
+
+    def wrap(self, function, tables=None):
+        """Cache a query function whose first argument after session is the user.
+
+        The user argument is a user ID or, for the get_users_* functions, a list
+        of user IDs or None for all users. get_users_not_meeting_sleep_goals
+        takes no user and its results are dropped on any write to its tables.
+
+        Args:
+            function (callable): Query function taking session first
+            tables (set of str): Tables it reads, defaults to QUERY_TABLES
+
+        Returns:
+            callable: Function with the same signature
+        """
+        name = function.__name__
+        tables = frozenset(tables or QUERY_TABLES[name])
+        per_user = name.startswith(("get_user_", "get_users_")) and name != (
+            "get_users_not_meeting_sleep_goals"
+        )
+
+        @functools.wraps(function)
+        def wrapper(session, *args, **kwargs):
+            if not self._can_cache(session):
+                return function(session, *args, **kwargs)
+            user_ids = None
+            if per_user and args:
+                users = args[0]
+                if isinstance(users, int):
+                    user_ids = frozenset([users])
+                elif users is not None:
+                    user_ids = frozenset(users)
+            key = (id(session.get_bind()), name, _freeze(args), _freeze(kwargs))
+            hit, value = self.get(key)
+            if hit:
+                return value
+            value = function(session, *args, **kwargs)
+            # Read after the call, which began the transaction if needed
+            generation = session.info.get("query_cache_generation")
+            self.set(key, value, tables, user_ids, generation)
+            return value
+
+        return wrapper
+
+    def _can_cache(self, session):
+        # Only sessions whose writes are tracked, and only while they have no
+        # uncommitted writes of their own that could still be rolled back
+        if not isinstance(session, self._session_classes):
+            return False
+        if session.new or session.dirty or session.deleted:
+            return False
+        if session.info.get("query_cache_touched"):
+            return False
+        if session.in_transaction():
+            connection = session.connection()
+            if connection.info.get("query_cache_tables"):
+                return False
+        return True
+
+    def install(self, session_factory, engine=None):
+        """Track the writes of a session factory and invalidate on commit.
+
+        ORM flushes are tracked per (table, user), other INSERT/UPDATE/DELETE
+        statements on the engine per table. Writes by other engines or
+        processes are only bounded by the TTL.
+
+        Args:
+            session_factory (sessionmaker): Factory whose sessions use the cache
+            engine (Engine): Engine to watch, defaults to the factory's bind
+        """
+        session_class = session_factory.class_
+        if session_class in self._session_classes:
+            return
+        self._session_classes += (session_class,)
+        event.listen(session_class, "after_begin", self._after_begin)
+        event.listen(session_class, "before_flush", self._before_flush)
+        event.listen(session_class, "after_flush", self._after_flush)
+        event.listen(session_class, "after_flush_postexec", self._after_flush_postexec)
+        event.listen(session_class, "after_commit", self._after_commit)
+        event.listen(session_class, "after_soft_rollback", self._after_rollback)
+
+        engine = engine or session_factory.kw.get("bind")
+        if engine is not None and engine not in self._engines:
+            self._engines.append(engine)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+            event.listen(engine, "commit", self._engine_commit)
+            event.listen(engine, "rollback", self._engine_rollback)
+
+    def _after_begin(self, session, transaction, connection):
+        session.info["query_cache_generation"] = self.generation
+
+    def _before_flush(self, session, flush_context, instances):
+        # Record the owners of changed and deleted rows as stored, before the
+        # flush can move a row to another user
+        connection = session.connection()
+        connection.info["query_cache_in_flush"] = True
+        touched = session.info.setdefault("query_cache_touched", {})
+        stored = defaultdict(list)
+        for obj in list(session.dirty) + list(session.deleted):
+            state = sa_inspect(obj)
+            if state.identity is not None:
+                stored[state.mapper.local_table].append(state.identity[0])
+        for table, ids in stored.items():
+            user_ids = touched.setdefault(table.name, set())
+            if table.name == "users":
+                user_ids.update(ids)
+            elif "user_id" in table.c and "id" in table.c:
+                owners = select(table.c.user_id).where(table.c.id.in_(ids))
+                user_ids.update(connection.execute(owners).scalars())
+            else:
+                user_ids.add(None)
+
+    def _after_flush(self, session, flush_context):
+        touched = session.info.setdefault("query_cache_touched", {})
+        for obj in list(session.new) + list(session.dirty):
+            state = sa_inspect(obj)
+            table = state.mapper.local_table
+            user_ids = touched.setdefault(table.name, set())
+            if table.name == "users":
+                user_ids.add(obj.id)
+            elif "user_id" in table.c:
+                user_ids.add(obj.user_id)
+            else:
+                user_ids.add(None)
+
+    def _after_flush_postexec(self, session, flush_context):
+        session.connection().info.pop("query_cache_in_flush", None)
+
+    def _after_commit(self, session):
+        touched = session.info.pop("query_cache_touched", None)
+        if touched:
+            self.invalidate(touched)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop("query_cache_touched", None)
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if conn.info.get("query_cache_in_flush"):
+            return
+        match = _DML.match(statement)
+        if match:
+            conn.info.setdefault("query_cache_tables", set()).add(match.group(1))
+
+    def _engine_commit(self, conn):
+        tables = conn.info.pop("query_cache_tables", None)
+        if tables:
+            self.invalidate({table: {None} for table in tables})
+
+    def _engine_rollback(self, conn):
+        conn.info.pop("query_cache_tables", None)
+        conn.info.pop("query_cache_in_flush", None)
+
+
+def cached_queries(cache, module=queries):
+    """Return the query functions of a module wrapped by a cache.
+
+    Args:
+        cache (QueryCache): Cache holding the results
+        module (module): Module with the functions named in QUERY_TABLES
+
+    Returns:
+        SimpleNamespace: Cached functions under their original names
+    """
+    return SimpleNamespace(
+        **{name: cache.wrap(getattr(module, name)) for name in QUERY_TABLES}
+    )
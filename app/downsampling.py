@@ -0,0 +1,498 @@
+# downsampling.py
+import argparse
+import math
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, delete, func, literal_column, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+from app.models.tables import (
+    DownsampleState,
+    HeartRateDayStats,
+    HeartRateHourStats,
+    HeartRateLog,
+    HeartRateMinuteStats,
+    User,
+)
+from app.retry import default_retry_policy
+
+# heart_rate_logs ids rolled into the tiers per statement
+DOWNSAMPLE_BATCH_SIZE = 50000
+# Rows deleted per statement by the retention job
+PRUNE_BATCH_SIZE = 10000
+# Buckets a series returns at most, unless the caller asks otherwise
+DEFAULT_MAX_POINTS = 1000
+# How long each source keeps its rows, None keeps them forever
+DEFAULT_RETENTION = {
+    "raw": timedelta(days=90),
+    "minute": timedelta(days=365),
+    "hour": None,
+    "day": None,
+}
+
+HeartRateTier = namedtuple("HeartRateTier", ["name", "model", "width", "format"])
+
+# Finest first. Buckets are stored as the text SQLAlchemy's SQLite DateTime
+# writes, so they compare equal to bound datetimes
+TIERS = (
+    HeartRateTier(
+        "minute", HeartRateMinuteStats, timedelta(minutes=1), "%Y-%m-%d %H:%M:00.000000"
+    ),
+    HeartRateTier(
+        "hour", HeartRateHourStats, timedelta(hours=1), "%Y-%m-%d %H:00:00.000000"
+    ),
+    HeartRateTier(
+        "day", HeartRateDayStats, timedelta(days=1), "%Y-%m-%d 00:00:00.000000"
+    ),
+)
+
+HeartRateBucket = namedtuple(
+    "HeartRateBucket",
+    ["bucket", "min_heart_rate", "max_heart_rate", "avg_heart_rate", "count"],
+)
+HeartRateStats = namedtuple(
+    "HeartRateStats", ["min_heart_rate", "max_heart_rate", "avg_heart_rate", "count"]
+)
+
+_RAW = HeartRateLog.__table__
+_ROWID = literal_column("rowid")
+
+
+def _floor(value, tier):
+    return datetime.min + (value - datetime.min) // tier.width * tier.width
+
+
+def _ceil(value, tier):
+    floor = _floor(value, tier)
+    return floor if floor == value else floor + tier.width
+
+
+def _state(connection, source):
+    """Return the (last_id, pruned_before) recorded for a source table."""
+    table = DownsampleState.__table__
+    row = connection.execute(
+        select(table.c.last_id, table.c.pruned_before).where(table.c.source == source)
+    ).first()
+    return tuple(row) if row else (None, None)
+
+
+def _set_state(connection, source, **values):
+    table = DownsampleState.__table__
+    statement = insert(table).values(source=source, **values)
+    connection.execute(
+        statement.on_conflict_do_update(index_elements=[table.c.source], set_=values)
+    )
+
+
+def _downsample_range(connection, after_id, last_id):
+    """Add the heart_rate_logs rows with after_id < id <= last_id to every tier."""
+    heart_rate = _RAW.c.heart_rate
+    for tier in TIERS:
+        table = tier.model.__table__
+        bucket = func.strftime(tier.format, _RAW.c.time_recorded)
+        rows = (
+            select(
+                _RAW.c.user_id,
+                bucket,
+                func.min(heart_rate),
+                func.max(heart_rate),
+                func.sum(heart_rate),
+                func.count(heart_rate),
+            )
+            .where(_RAW.c.id > after_id, _RAW.c.id <= last_id)
+            .where(
+                _RAW.c.user_id.isnot(None),
+                _RAW.c.time_recorded.isnot(None),
+                heart_rate.isnot(None),
+            )
+            .group_by(_RAW.c.user_id, bucket)
+        )
+        statement = insert(table).from_select(
+            [
+                "user_id",
+                "bucket",
+                "min_heart_rate",
+                "max_heart_rate",
+                "heart_rate_sum",
+                "heart_rate_count",
+            ],
+            rows,
+        )
+        excluded = statement.excluded
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.bucket],
+                set_={
+                    "min_heart_rate": func.min(
+                        table.c.min_heart_rate, excluded.min_heart_rate
+                    ),
+                    "max_heart_rate": func.max(
+                        table.c.max_heart_rate, excluded.max_heart_rate
+                    ),
+                    "heart_rate_sum": table.c.heart_rate_sum + excluded.heart_rate_sum,
+                    "heart_rate_count": table.c.heart_rate_count
+                    + excluded.heart_rate_count,
+                },
+            )
+        )
+
+
+def _downsample(connection, batch_size, max_batches=None):
+    last_id = _state(connection, _RAW.name)[0] or 0
+    newest = connection.execute(select(func.max(_RAW.c.id))).scalar() or 0
+    samples = batches = 0
+    while last_id < newest and (max_batches is None or batches < max_batches):
+        batch_end = min(last_id + batch_size, newest)
+        samples += connection.execute(
+            select(func.count()).where(_RAW.c.id > last_id, _RAW.c.id <= batch_end)
+        ).scalar()
+        _downsample_range(connection, last_id, batch_end)
+        last_id = batch_end
+        batches += 1
+    if batches:
+        _set_state(connection, _RAW.name, last_id=last_id)
+    return samples, last_id >= newest
+
+
+def downsample_heart_rates(
+    connection, batch_size=DOWNSAMPLE_BATCH_SIZE, max_batches=None
+):
+    """Roll the heart_rate_logs rows added since the last run into the tiers.
+
+    The rows are found by id, past the last id the previous run recorded in
+    downsample_state: ids are handed out in commit order, so a run sees every
+    row committed before it. Samples edited or deleted after they were rolled
+    in stay in the tiers as they were; rebuild the tiers after such changes.
+
+    Args:
+        connection (Connection): Connection in the transaction to run in
+        batch_size (int): Ids aggregated per statement
+        max_batches (int): Stop after this many batches and leave the rest to
+            a later run, defaults to all
+
+    Returns:
+        int: Number of samples rolled in
+    """
+    return _downsample(connection, batch_size, max_batches)[0]
+
+
+def catch_up_heart_rate_tiers(session, batch_size=DOWNSAMPLE_BATCH_SIZE):
+    """Roll every pending heart_rate_logs row into the tiers, one transaction per batch.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        batch_size (int): Ids aggregated per transaction
+
+    Returns:
+        int: Number of samples rolled in
+    """
+
+    def run_batch():
+        try:
+            result = _downsample(session.connection(), batch_size, max_batches=1)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+
+    total = 0
+    while True:
+        samples, finished = default_retry_policy.call(run_batch)
+        total += samples
+        if finished:
+            return total
+
+
+def rebuild_heart_rate_tiers(session, batch_size=DOWNSAMPLE_BATCH_SIZE):
+    """Recompute the tiers from heart_rate_logs.
+
+    Used to backfill an existing database, or after raw samples were edited.
+    Buckets older than the raw retention are lost, as their samples are gone.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        batch_size (int): Ids aggregated per transaction
+
+    Returns:
+        int: Number of samples rolled in
+    """
+    for tier in TIERS:
+        session.execute(delete(tier.model.__table__))
+    _set_state(session.connection(), _RAW.name, last_id=0)
+    session.commit()
+    return catch_up_heart_rate_tiers(session, batch_size)
+
+
+def _prune(session, table, time_column, cutoff, conditions, batch_size):
+    """Delete the rows older than cutoff user by user, through the user index."""
+    doomed = (
+        select(_ROWID)
+        .select_from(table)
+        .where(table.c.user_id == bindparam("prune_user_id"), time_column < cutoff)
+        .where(*conditions)
+        .limit(batch_size)
+        .correlate(None)
+        .scalar_subquery()
+    )
+    statement = delete(table).where(_ROWID.in_(doomed))
+
+    def delete_batch(user_id):
+        try:
+            deleted = session.execute(statement, {"prune_user_id": user_id}).rowcount
+            session.commit()
+            return deleted
+        except Exception:
+            session.rollback()
+            raise
+
+    total = 0
+    for user_id in session.scalars(select(User.id)).all():
+        while True:
+            deleted = default_retry_policy.call(delete_batch, user_id)
+            total += deleted
+            if deleted < batch_size:
+                break
+    return total
+
+
+def prune_heart_rate_data(
+    session,
+    retention=None,
+    now=None,
+    keep_workout_samples=True,
+    batch_size=PRUNE_BATCH_SIZE,
+):
+    """Delete raw samples and tier buckets past their retention.
+
+    Pending samples are rolled into the tiers first, and raw samples are only
+    deleted once they are, so the coarser tiers keep their history.
+    daily_user_stats isn't touched either; don't rebuild it after pruning.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        retention (dict): Mapping of "raw" or a tier name to a timedelta, or None
+            to keep that source forever, overriding DEFAULT_RETENTION
+        now (datetime): Naive UTC time the retention counts back from
+        keep_workout_samples (bool): Keep raw samples linked to a workout, which
+            the per-workout heart rate queries read
+        batch_size (int): Rows deleted per transaction
+
+    Returns:
+        dict: Mapping of source name to the number of rows deleted
+    """
+    retention = {**DEFAULT_RETENTION, **(retention or {})}
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    catch_up_heart_rate_tiers(session)
+
+    connection = session.connection()
+    last_id = _state(connection, _RAW.name)[0] or 0
+    newest = connection.execute(select(func.max(_RAW.c.id))).scalar() or 0
+    # Keeping the newest row stops SQLite from handing out its id, or a lower
+    # one, again, which the next downsampling run would skip
+    raw_conditions = [_RAW.c.id <= last_id, _RAW.c.id < newest]
+    if keep_workout_samples:
+        raw_conditions.append(_RAW.c.workout_log_id.is_(None))
+    sources = [("raw", _RAW, _RAW.c.time_recorded, raw_conditions)] + [
+        (tier.name, tier.model.__table__, tier.model.__table__.c.bucket, [])
+        for tier in TIERS
+    ]
+
+    deleted = {}
+    for name, table, time_column, conditions in sources:
+        if retention[name] is None:
+            continue
+        cutoff = now - retention[name]
+        deleted[name] = _prune(
+            session, table, time_column, cutoff, conditions, batch_size
+        )
+        pruned_before = _state(session.connection(), table.name)[1]
+        if pruned_before is None or pruned_before < cutoff:
+            _set_state(session.connection(), table.name, pruned_before=cutoff)
+            session.commit()
+    return deleted
+
+
+def select_tier(session, start_time, end_time, max_points=DEFAULT_MAX_POINTS):
+    """Pick the tier a series over [start_time, end_time) is read from.
+
+    That is the finest tier giving at most max_points buckets over the range,
+    skipping tiers already pruned at start_time, and the day tier otherwise.
+
+    Returns:
+        HeartRateTier: The chosen tier
+    """
+    connection = session.connection()
+    for tier in TIERS:
+        pruned_before = _state(connection, tier.model.__tablename__)[1]
+        if pruned_before is not None and start_time < pruned_before:
+            continue
+        buckets = math.ceil((end_time - _floor(start_time, tier)) / tier.width)
+        if buckets <= max_points:
+            return tier
+    return TIERS[-1]
+
+
+def get_user_heart_rate_series(
+    session, user_id, start_time, end_time, max_points=DEFAULT_MAX_POINTS
+):
+    """Compute a user's heart rate over time from the tier select_tier picks.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        start_time (datetime): Start of the range, rounded down to a bucket
+        end_time (datetime): End of the range, excluded
+        max_points (int): Buckets returned at most, unless even days give more
+
+    Returns:
+        list of HeartRateBucket: The buckets holding samples, in time order
+    """
+    tier = select_tier(session, start_time, end_time, max_points)
+    table = tier.model.__table__
+    rows = session.execute(
+        select(
+            table.c.bucket,
+            table.c.min_heart_rate,
+            table.c.max_heart_rate,
+            table.c.heart_rate_sum,
+            table.c.heart_rate_count,
+        )
+        .where(
+            table.c.user_id == user_id,
+            table.c.bucket >= _floor(start_time, tier),
+            table.c.bucket < end_time,
+        )
+        .order_by(table.c.bucket)
+    )
+    return [
+        HeartRateBucket(bucket, low, high, total / count, count)
+        for bucket, low, high, total, count in rows
+    ]
+
+
+def _cover(start_time, end_time, level=len(TIERS) - 1):
+    """Split [start_time, end_time) into the fewest tier and raw segments.
+
+    The whole buckets of the coarsest tier fill the middle, and the ends left
+    over are covered by finer tiers, down to raw samples for the seconds.
+
+    Returns:
+        list: (tier, or None for raw samples, start, end) tuples
+    """
+    if start_time >= end_time:
+        return []
+    if level < 0:
+        return [(None, start_time, end_time)]
+    tier = TIERS[level]
+    first, last = _ceil(start_time, tier), _floor(end_time, tier)
+    if first >= last:
+        return _cover(start_time, end_time, level - 1)
+    return (
+        _cover(start_time, first, level - 1)
+        + [(tier, first, last)]
+        + _cover(last, end_time, level - 1)
+    )
+
+
+def get_user_heart_rate_stats(session, user_id, start_time, end_time):
+    """Compute a user's heart rate min, max, average and count over a range.
+
+    Whole days are read from the day tier, and only the partial hours, minutes
+    and seconds at the ends from finer tiers and raw samples, so the cost
+    doesn't grow with the samples in the range. Samples not rolled in yet, or
+    pruned from the tier a segment reads, aren't counted.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        start_time (datetime): Start of the range
+        end_time (datetime): End of the range, excluded
+
+    Returns:
+        HeartRateStats: Averages and extremes are None without samples
+    """
+    segments = []
+    for tier, start, end in _cover(start_time, end_time):
+        if tier is None:
+            heart_rate = _RAW.c.heart_rate
+            segment = select(
+                func.min(heart_rate).label("low"),
+                func.max(heart_rate).label("high"),
+                func.sum(heart_rate).label("total"),
+                func.count(heart_rate).label("count"),
+            ).where(
+                _RAW.c.user_id == user_id,
+                _RAW.c.time_recorded >= start,
+                _RAW.c.time_recorded < end,
+            )
+        else:
+            table = tier.model.__table__
+            segment = select(
+                func.min(table.c.min_heart_rate).label("low"),
+                func.max(table.c.max_heart_rate).label("high"),
+                func.sum(table.c.heart_rate_sum).label("total"),
+                func.sum(table.c.heart_rate_count).label("count"),
+            ).where(
+                table.c.user_id == user_id,
+                table.c.bucket >= start,
+                table.c.bucket < end,
+            )
+        segments.append(segment)
+    if not segments:
+        return HeartRateStats(None, None, None, 0)
+
+    parts = union_all(*segments).subquery()
+    low, high, total, count = session.execute(
+        select(
+            func.min(parts.c.low),
+            func.max(parts.c.high),
+            func.sum(parts.c.total),
+            func.sum(parts.c.count),
+        )
+    ).one()
+    if not count:
+        return HeartRateStats(None, None, None, 0)
+    return HeartRateStats(low, high, total / count, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Downsample heart rate samples and prune old ones."
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="recompute the tiers from scratch"
+    )
+    parser.add_argument(
+        "--prune", action="store_true", help="delete data past its retention"
+    )
+    for source, keep in DEFAULT_RETENTION.items():
+        parser.add_argument(
+            f"--{source}-days",
+            type=int,
+            help=f"days of {source} data kept, {keep.days if keep else 'all'} by default",
+        )
+    args = parser.parse_args()
+
+    from app import get_session
+
+    session = get_session()
+    try:
+        if args.rebuild:
+            samples = rebuild_heart_rate_tiers(session)
+        else:
+            samples = catch_up_heart_rate_tiers(session)
+        print(f"Downsampled {samples} heart rate samples.")
+        if args.prune:
+            retention = {
+                source: timedelta(days=getattr(args, f"{source}_days"))
+                for source in DEFAULT_RETENTION
+                if getattr(args, f"{source}_days") is not None
+            }
+            for source, count in prune_heart_rate_data(session, retention).items():
+                print(f"Pruned {count} {source} rows.")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
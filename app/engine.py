@@ -0,0 +1,169 @@
+# engine.py
+import os
+import re
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = "sqlite:///health_fitness_app.db"
+
+# Environment variables read by create_app_engine
+DATABASE_URL_ENV = "HEALTH_APP_DATABASE_URL"
+PROFILE_ENV = "HEALTH_APP_DB_PROFILE"
+PRAGMA_ENV_PREFIX = "HEALTH_APP_PRAGMA_"
+
+# Pragmas that can be configured and reported, applied in this order. cache_size
+# is in KiB when negative, mmap_size in bytes and busy_timeout in milliseconds.
+PRAGMA_NAMES = [
+    "journal_mode",
+    "synchronous",
+    "cache_size",
+    "mmap_size",
+    "temp_store",
+    "busy_timeout",
+    "foreign_keys",
+]
+
+PROFILES = {
+    # WAL lets readers run alongside the writer, and with WAL synchronous=NORMAL
+    # only gives up durability of the last commits on power loss, not integrity
+    "default": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -64000,
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+        "pool": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30},
+    },
+    # Seeding a database that can be regenerated: no fsyncs, a bigger cache and
+    # a single connection since SQLite only has one writer anyway
+    "bulk_load": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "cache_size": -512000,
+            "mmap_size": 1073741824,
+            "temp_store": "MEMORY",
+            "busy_timeout": 30000,
+        },
+        "pool": {"pool_size": 1, "max_overflow": 0, "pool_timeout": 60},
+    },
+}
+
+# How SQLite reports the enumerated pragmas
+_PRAGMA_LEVELS = {
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+}
+
+
+def _env_pragmas(environ):
+    pragmas = {}
+    for name in PRAGMA_NAMES:
+        value = environ.get(PRAGMA_ENV_PREFIX + name.upper())
+        if value is not None:
+            pragmas[name] = int(value) if value.lstrip("-").isdigit() else value
+    return pragmas
+
+
+def resolve_settings(url=None, profile=None, pragmas=None, environ=None):
+    """Work out the database URL, pragmas and pool settings to use.
+
+    Explicit arguments win over environment variables, which win over the
+    profile defaults.
+
+    Args:
+        url (str): Database URL, defaults to $HEALTH_APP_DATABASE_URL
+        profile (str): Name of an entry of PROFILES, defaults to $HEALTH_APP_DB_PROFILE
+        pragmas (dict): Pragma overrides, a value of None drops the pragma
+        environ (dict): Environment to read, defaults to os.environ
+
+    Returns:
+        tuple: (url, dict of pragmas, dict of pool settings)
+    """
+    environ = os.environ if environ is None else environ
+    url = url or environ.get(DATABASE_URL_ENV) or DEFAULT_DATABASE_URL
+    profile = profile or environ.get(PROFILE_ENV) or "default"
+    if profile not in PROFILES:
+        raise ValueError(
+            f"Unknown database profile {profile!r}, expected one of {sorted(PROFILES)}"
+        )
+
+    settings = PROFILES[profile]
+    resolved = {**settings["pragmas"], **_env_pragmas(environ), **(pragmas or {})}
+    resolved = {name: value for name, value in resolved.items() if value is not None}
+    for name, value in resolved.items():
+        if name not in PRAGMA_NAMES:
+            raise ValueError(f"Unsupported pragma {name!r}")
+        # Values end up in the PRAGMA statement text, so only allow plain words
+        if not re.fullmatch(r"-?\w+", str(value)):
+            raise ValueError(f"Invalid value {value!r} for pragma {name!r}")
+    return url, resolved, dict(settings["pool"])
+
+
+def _is_memory_database(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a raw DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name in PRAGMA_NAMES:
+            if name in pragmas:
+                cursor.execute(f"PRAGMA {name} = {pragmas[name]}")
+    finally:
+        cursor.close()
+
+
+def create_app_engine(url=None, profile=None, pragmas=None, **engine_kwargs):
+    """Create an engine that applies the profile's pragmas to every connection.
+
+    Args:
+        url (str): Database URL, defaults to $HEALTH_APP_DATABASE_URL
+        profile (str): "default" or "bulk_load", defaults to $HEALTH_APP_DB_PROFILE
+        pragmas (dict): Pragma overrides, e.g. {"synchronous": "FULL"}
+        **engine_kwargs: Passed on to sqlalchemy.create_engine
+
+    Returns:
+        Engine: SQLAlchemy engine
+    """
+    url, pragmas, pool = resolve_settings(url, profile, pragmas)
+    if _is_memory_database(url):
+        # In-memory databases live in a single connection, so there is no pool
+        # to size and no journal worth tuning
+        pool = {}
+        pragmas.pop("journal_mode", None)
+    engine = create_engine(url, **{**pool, **engine_kwargs})
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+def get_active_pragmas(connection):
+    """Read the pragmas SQLite is actually using on a connection.
+
+    Args:
+        connection (Connection or Session): Open SQLAlchemy connection or session
+
+    Returns:
+        dict: Mapping of pragma name to its current value, with synchronous and
+        temp_store reported by name and journal_mode in upper case
+    """
+    if hasattr(connection, "connection") and callable(connection.connection):
+        connection = connection.connection()
+    active = {}
+    for name in PRAGMA_NAMES:
+        value = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        if name in _PRAGMA_LEVELS:
+            value = _PRAGMA_LEVELS[name].get(value, value)
+        elif name == "journal_mode":
+            value = value.upper()
+        active[name] = value
+    return active
@@ -0,0 +1,336 @@
+# export.py
+import argparse
+import csv
+import gzip
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from sqlalchemy import JSON, func, select
+from app.engine import create_app_engine
+from app.models.tables import User
+from app.parallel_populate import split_user_ids
+
+EXPORT_FORMATS = ("jsonl", "csv")
+DEFAULT_EXPORT_BATCH_SIZE = 1000
+
+# The users table and every table behind a relationship of User, in the order
+# they are written
+EXPORT_TABLES = [User.__table__] + [
+    relationship.mapper.local_table for relationship in User.__mapper__.relationships
+]
+
+
+def _user_column(table):
+    return table.c.id if table is User.__table__ else table.c.user_id
+
+
+def _export_order(table):
+    """ORDER BY of a table's export: the columns of its index on the user column.
+
+    Rows come out in (user, index columns, id) order straight from the index,
+    the rowid being the last column of every index, so SQLite doesn't sort a
+    user's whole history before returning the first row.
+    """
+    user_column = _user_column(table)
+    if user_column.primary_key:
+        return [user_column]
+    indexes = [
+        index for index in table.indexes if list(index.columns)[0] is user_column
+    ]
+    index = min(indexes, key=lambda index: len(index.expressions))
+    return [*index.expressions, *table.primary_key]
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(column, value):
+    if value is None:
+        return ""
+    if isinstance(column.type, JSON):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def export_path(directory, table, export_format, compress, part=None):
+    """Path of the file a table is exported to.
+
+    Args:
+        directory (str): Output directory
+        table (Table): Exported table
+        export_format (str): "jsonl" or "csv"
+        compress (bool): Whether the file is gzip-compressed
+        part (int): Index of the part in a whole-database export
+
+    Returns:
+        str: Path of the export file
+    """
+    name = table.name if part is None else f"{table.name}.part-{part:04d}"
+    suffix = ".gz" if compress else ""
+    return os.path.join(directory, f"{name}.{export_format}{suffix}")
+
+
+def _open(path, compress):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def export_statement(table, where):
+    """SELECT of the rows of a table matching where, in export order."""
+    return select(table).where(where).order_by(*_export_order(table))
+
+
+def stream_table(connection, table, where, batch_size=DEFAULT_EXPORT_BATCH_SIZE):
+    """Yield the rows of a table matching where, batch_size at a time.
+
+    The rows are read with yield_per, so only one batch is held in memory.
+
+    Args:
+        connection (Connection): SQLAlchemy connection
+        table (Table): Table to read
+        where (ColumnElement): Filter on the rows
+        batch_size (int): Rows fetched from the cursor at a time
+
+    Yields:
+        list of Row: One batch of rows, ordered by user and the columns of the
+        table's index on the user, e.g. (user_id, date, duration, id)
+    """
+    result = connection.execution_options(
+        stream_results=True, yield_per=batch_size
+    ).execute(export_statement(table, where))
+    try:
+        yield from result.partitions(batch_size)
+    finally:
+        result.close()
+
+
+def write_table(
+    connection,
+    table,
+    where,
+    path,
+    export_format="jsonl",
+    compress=False,
+    batch_size=DEFAULT_EXPORT_BATCH_SIZE,
+):
+    """Stream the matching rows of one table into a JSONL or CSV file.
+
+    Returns:
+        int: Number of rows written
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown export format {export_format!r}, expected one of {EXPORT_FORMATS}"
+        )
+    columns = list(table.columns)
+    names = [column.name for column in columns]
+    count = 0
+    with _open(path, compress) as file:
+        if export_format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(names)
+        for batch in stream_table(connection, table, where, batch_size):
+            if export_format == "csv":
+                writer.writerows(
+                    [_csv_value(column, value) for column, value in zip(columns, row)]
+                    for row in batch
+                )
+            else:
+                file.writelines(
+                    json.dumps(
+                        dict(zip(names, row)),
+                        default=_json_default,
+                        separators=(",", ":"),
+                    )
+                    + "\n"
+                    for row in batch
+                )
+            count += len(batch)
+    return count
+
+
+def export_user(
+    session,
+    user_id,
+    directory,
+    export_format="jsonl",
+    compress=False,
+    batch_size=DEFAULT_EXPORT_BATCH_SIZE,
+):
+    """Export all of a user's data, one file per table.
+
+    Every table in EXPORT_TABLES is streamed from the database in batches, so
+    memory use doesn't depend on the length of the user's history, unlike
+    loading it through the User relationships.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        directory (str): Output directory, created if missing
+        export_format (str): "jsonl" or "csv"
+        compress (bool): gzip-compress the files
+        batch_size (int): Rows fetched from the database at a time
+
+    Returns:
+        dict: Mapping of table name to the number of exported rows
+    """
+    os.makedirs(directory, exist_ok=True)
+    connection = session.connection()
+    return {
+        table.name: write_table(
+            connection,
+            table,
+            _user_column(table) == user_id,
+            export_path(directory, table, export_format, compress),
+            export_format,
+            compress,
+            batch_size,
+        )
+        for table in EXPORT_TABLES
+    }
+
+
+def export_part(url, part, user_ids, directory, export_format, compress, batch_size):
+    """Export the data of a contiguous range of users into part files.
+
+    Runs inside a worker process with its own engine.
+
+    Returns:
+        dict: Mapping of table name to the number of exported rows
+    """
+    engine = create_app_engine(url)
+    try:
+        with engine.connect() as connection:
+            return {
+                table.name: write_table(
+                    connection,
+                    table,
+                    _user_column(table).between(user_ids.start, user_ids.stop - 1),
+                    export_path(directory, table, export_format, compress, part),
+                    export_format,
+                    compress,
+                    batch_size,
+                )
+                for table in EXPORT_TABLES
+            }
+    finally:
+        engine.dispose()
+
+
+def export_database(
+    session,
+    directory,
+    export_format="jsonl",
+    compress=False,
+    num_workers=None,
+    batch_size=DEFAULT_EXPORT_BATCH_SIZE,
+):
+    """Export the data of every user from a process pool.
+
+    The user ID range is split into one part per worker. Each worker streams
+    its users table by table into its own part files, e.g.
+    ``workout_logs.part-0003.jsonl``, so the peak memory of every process is
+    bounded by batch_size whatever the size of the database.
+
+    Args:
+        session (db session): SQLAlchemy session bound to a file database
+        directory (str): Output directory, created if missing
+        export_format (str): "jsonl" or "csv"
+        compress (bool): gzip-compress the files
+        num_workers (int): Number of worker processes, defaults to the CPU count
+        batch_size (int): Rows fetched from the database at a time
+
+    Returns:
+        dict: Mapping of table name to the number of exported rows
+    """
+    engine = session.get_bind()
+    if engine.url.database in (None, "", ":memory:"):
+        raise ValueError("export_database requires a file database")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown export format {export_format!r}, expected one of {EXPORT_FORMATS}"
+        )
+
+    first_id, last_id = session.execute(
+        select(func.min(User.id), func.max(User.id))
+    ).one()
+    session.commit()
+    os.makedirs(directory, exist_ok=True)
+    totals = {table.name: 0 for table in EXPORT_TABLES}
+    if first_id is None:
+        return totals
+
+    num_workers = num_workers or os.cpu_count() or 1
+    user_id_ranges = split_user_ids(first_id, last_id - first_id + 1, num_workers)
+    url = engine.url.render_as_string(hide_password=False)
+    with ProcessPoolExecutor(max_workers=len(user_id_ranges)) as executor:
+        futures = [
+            executor.submit(
+                export_part,
+                url,
+                part,
+                user_ids,
+                directory,
+                export_format,
+                compress,
+                batch_size,
+            )
+            for part, user_ids in enumerate(user_id_ranges)
+        ]
+        for future in futures:
+            for name, count in future.result().items():
+                totals[name] += count
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export user data as JSONL or CSV files, one per table."
+    )
+    parser.add_argument("directory", help="output directory")
+    parser.add_argument(
+        "--user-id", type=int, help="only export this user, in this process"
+    )
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+    parser.add_argument("--gzip", action="store_true", help="gzip the files")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import get_session
+
+    session = get_session()
+    try:
+        if args.user_id is not None:
+            counts = export_user(
+                session,
+                args.user_id,
+                args.directory,
+                args.format,
+                args.gzip,
+                args.batch_size,
+            )
+        else:
+            counts = export_database(
+                session,
+                args.directory,
+                args.format,
+                args.gzip,
+                args.workers,
+                args.batch_size,
+            )
+    finally:
+        session.close()
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# fake_batches.py
+import json
+from datetime import datetime
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from app.populate_db import BULK_TABLES, EXERCISE_TYPES, FOOD_ITEMS, GOAL_STATUSES
+
+
+def _pick(rng, choices, size):
+    return np.asarray(choices)[rng.integers(0, len(choices), size)]
+
+
+def _dates(rng, first_day, num_days, size):
+    """Uniform dates in [first_day, first_day + num_days) as datetime64[D]."""
+    return first_day + rng.integers(0, num_days, size).astype("timedelta64[D]")
+
+
+def _datetimes(rng, start, span_us, size):
+    """Uniform datetimes in [start, start + span_us) as datetime64[us]."""
+    offsets = (rng.random(size) * span_us).astype(np.int64)
+    return start + offsets.astype("timedelta64[us]")
+
+
+def sqlite_dates(values):
+    """Format datetime64 values the way SQLAlchemy stores Date columns in SQLite."""
+    return np.datetime_as_string(values.astype("datetime64[D]"), unit="D")
+
+
+def sqlite_datetimes(values):
+    """Format datetime64 values the way SQLAlchemy stores DateTime columns in SQLite."""
+    return np.char.replace(
+        np.datetime_as_string(values.astype("datetime64[us]"), unit="us"), "T", " "
+    )
+
+
+def _row_ids(first_id, user_index, rows_per_user, row_index):
+    return first_id + user_index * rows_per_user + row_index
+
+
+def generate_fake_batch(
+    rng,
+    user_ids,
+    first_ids,
+    num_logs_per_user,
+    meal_type_ids,
+    goal_type_ids,
+    reference_time=None,
+):
+    """Generate a column-oriented batch of fake users and logs with NumPy.
+
+    Produces the same value ranges as the ``fake_*_values`` factories in
+    populate_db and the same primary key layout as create_fake_rows, but draws
+    each column for the whole batch in one call instead of row by row.
+
+    Args:
+        rng (numpy.random.Generator): Source of randomness
+        user_ids (range): Contiguous IDs of the users to generate
+        first_ids (dict): Id of the first row of each table, see get_next_ids
+        num_logs_per_user (int): Number of rows per log table for each user
+        meal_type_ids (list of int): Existing meal type IDs
+        goal_type_ids (list of int): Existing fitness goal type IDs
+        reference_time (datetime): Latest generated datetime, defaults to now
+
+    Returns:
+        dict: Mapping of table name to a dict of column name to NumPy array
+    """
+    reference_time = reference_time or datetime.now()
+    window_start = reference_time - relativedelta(years=10)
+    first_day = np.datetime64(window_start.date(), "D")
+    num_days = (reference_time.date() - window_start.date()).days + 1
+    first_moment = np.datetime64(window_start, "us")
+    span_us = (reference_time - window_start).total_seconds() * 1e6
+
+    user_ids = np.arange(user_ids.start, user_ids.stop, dtype=np.int64)
+    num_users = len(user_ids)
+    user_index = user_ids - first_ids["users"]
+    num_logs = num_users * num_logs_per_user
+    log_user_ids = np.repeat(user_ids, num_logs_per_user)
+    log_index = np.tile(np.arange(num_logs_per_user), num_users)
+
+    def log_ids(table_name):
+        return _row_ids(
+            first_ids[table_name],
+            np.repeat(user_index, num_logs_per_user),
+            num_logs_per_user,
+            log_index,
+        )
+
+    names = user_ids.astype(str)
+    batch = {
+        "users": {
+            "id": user_ids,
+            "username": np.char.add("user_", names),
+            "age": rng.integers(18, 81, num_users),
+            "email": np.char.add(np.char.add("user_", names), "@example.com"),
+        }
+    }
+
+    # Every user picks 1..len(goal_type_ids) distinct goal types
+    num_goal_types = len(goal_type_ids)
+    goals_per_user = rng.integers(1, num_goal_types + 1, num_users)
+    goal_order = rng.random((num_users, num_goal_types)).argsort(axis=1)
+    goal_mask = np.arange(num_goal_types) < goals_per_user[:, None]
+    goal_user, goal_slot = np.nonzero(goal_mask)
+    num_goals = len(goal_user)
+    goal_start = _dates(rng, first_day, num_days, num_goals)
+    days_left = (np.datetime64(reference_time.date(), "D") - goal_start).astype(
+        np.int64
+    )
+    goal_end = goal_start + (rng.random(num_goals) * (days_left + 1)).astype(
+        "timedelta64[D]"
+    )
+    goal_ids = _row_ids(
+        first_ids["user_fitness_goals"],
+        user_index[goal_user],
+        num_goal_types,
+        goal_slot,
+    )
+    target_weight = rng.uniform(50, 100, num_goals)
+    target_body_fat = rng.uniform(10, 30, num_goals)
+    targets = [
+        json.dumps({"weight": weight, "body_fat_percentage": body_fat})
+        for weight, body_fat in zip(target_weight.tolist(), target_body_fat.tolist())
+    ]
+    batch["user_fitness_goals"] = {
+        "id": goal_ids,
+        "user_id": user_ids[goal_user],
+        "goal_type_id": np.asarray(goal_type_ids)[goal_order[goal_user, goal_slot]],
+        "target": np.asarray(targets),
+        "start_date": goal_start,
+        "end_date": goal_end,
+        "status": _pick(rng, GOAL_STATUSES, num_goals),
+    }
+    batch["user_fitness_goal_targets"] = {
+        "goal_id": np.concatenate([goal_ids, goal_ids]),
+        "metric": np.repeat(["weight", "body_fat_percentage"], num_goals),
+        "user_id": np.concatenate([user_ids[goal_user]] * 2),
+        "value": np.concatenate([target_weight, target_body_fat]),
+    }
+
+    batch["height_logs"] = {
+        "id": log_ids("height_logs"),
+        "user_id": log_user_ids,
+        "date_recorded": _dates(rng, first_day, num_days, num_logs),
+        "height": rng.uniform(150.0, 200.0, num_logs),
+    }
+    batch["weight_logs"] = {
+        "id": log_ids("weight_logs"),
+        "user_id": log_user_ids,
+        "date_recorded": _dates(rng, first_day, num_days, num_logs),
+        "weight": rng.uniform(50.0, 100.0, num_logs),
+    }
+    workout_log_ids = log_ids("workout_logs")
+    batch["workout_logs"] = {
+        "id": workout_log_ids,
+        "user_id": log_user_ids,
+        "date": _dates(rng, first_day, num_days, num_logs),
+        "exercise_type": _pick(rng, EXERCISE_TYPES, num_logs),
+        "duration": rng.uniform(30.0, 120.0, num_logs),
+    }
+    batch["nutrition_logs"] = {
+        "id": log_ids("nutrition_logs"),
+        "user_id": log_user_ids,
+        "date": _dates(rng, first_day, num_days, num_logs),
+        "food": _pick(rng, FOOD_ITEMS, num_logs),
+        "calories": rng.integers(100, 1001, num_logs),
+        "meal_type_id": _pick(rng, meal_type_ids, num_logs),
+    }
+    sleep_start = _datetimes(rng, first_moment, span_us, num_logs)
+    sleep_hours = rng.integers(6, 11, num_logs)
+    batch["sleep_logs"] = {
+        "id": log_ids("sleep_logs"),
+        "user_id": log_user_ids,
+        "start_time": sleep_start,
+        "end_time": sleep_start + sleep_hours.astype("timedelta64[h]"),
+        "duration": sleep_hours * 60.0,
+    }
+    systolic = rng.integers(70, 121, num_logs).astype(str)
+    diastolic = rng.integers(40, 81, num_logs).astype(str)
+    batch["health_metrics"] = {
+        "id": log_ids("health_metrics"),
+        "user_id": log_user_ids,
+        "date": _dates(rng, first_day, num_days, num_logs),
+        "blood_pressure": np.char.add(np.char.add(systolic, "/"), diastolic),
+        "resting_heart_rate": rng.integers(50, 81, num_logs),
+        "blood_oxygen_level": rng.integers(95, 101, num_logs),
+        "blood_sugar_level": rng.integers(70, 121, num_logs),
+    }
+    batch["heart_rate_logs"] = {
+        "id": log_ids("heart_rate_logs"),
+        "user_id": log_user_ids,
+        "workout_log_id": workout_log_ids,
+        "time_recorded": _datetimes(rng, first_moment, span_us, num_logs),
+        "heart_rate": rng.integers(60, 181, num_logs),
+    }
+    batch["water_intake_logs"] = {
+        "id": log_ids("water_intake_logs"),
+        "user_id": log_user_ids,
+        "date": _dates(rng, first_day, num_days, num_logs),
+        "water_intake": rng.integers(1, 5001, num_logs),
+    }
+    return batch
+
+
+def _column_values(values):
+    if values.dtype.kind == "M":
+        if values.dtype == np.dtype("datetime64[D]"):
+            return sqlite_dates(values).tolist()
+        return sqlite_datetimes(values).tolist()
+    return values.tolist()
+
+
+def insert_fake_batch(session, batch):
+    """Insert a batch from generate_fake_batch with one executemany per table.
+
+    Columns are converted to the storage format SQLAlchemy uses for SQLite in
+    one vectorized step and sent straight to the driver.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        batch (dict): Mapping of table name to a dict of column name to array
+    """
+    connection = session.connection()
+    for table in BULK_TABLES:
+        columns = batch.get(table.name)
+        if not columns:
+            continue
+        names = list(columns)
+        rows = list(zip(*(_column_values(columns[name]) for name in names)))
+        if not rows:
+            continue
+        connection.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' for _ in names)})",
+            rows,
+        )
@@ -0,0 +1,231 @@
+# fanout.py
+import threading
+from concurrent.futures import (
+    FIRST_EXCEPTION,
+    CancelledError,
+    ThreadPoolExecutor,
+    wait,
+)
+from app import queries
+from app.queries import UserSummary
+
+# At most the connections of the default engine pool (pool_size)
+DEFAULT_MAX_WORKERS = 5
+
+
+class _Call:
+    """One query call of a request and the connection it is running on."""
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        self.connection = None  # DBAPI connection while the call runs
+
+
+class FanoutRequest:
+    """A set of query calls running on a ConcurrentQueries pool."""
+
+    def __init__(self, executor, session_factory, calls):
+        self._lock = threading.Lock()
+        self._calls = {name: _Call(call[0], call[1:]) for name, call in calls.items()}
+        self._futures = {
+            name: executor.submit(self._run, session_factory, call)
+            for name, call in self._calls.items()
+        }
+
+    def _run(self, session_factory, call):
+        session = session_factory()
+        try:
+            connection = session.connection().connection.driver_connection
+            with self._lock:
+                if call.cancelled:
+                    raise CancelledError()
+                call.connection = connection
+            try:
+                return call.function(session, *call.args)
+            finally:
+                with self._lock:
+                    call.connection = None
+        finally:
+            session.close()
+
+    def cancel(self):
+        """Cancel the calls that haven't finished.
+
+        Calls still queued never start, and the SQL statements of running ones
+        are interrupted with sqlite3_interrupt, which makes them raise.
+        """
+        with self._lock:
+            for name, call in self._calls.items():
+                call.cancelled = True
+                self._futures[name].cancel()
+                if call.connection is not None:
+                    call.connection.interrupt()
+
+    def result(self, timeout=None):
+        """Wait for every call and return their results together.
+
+        Args:
+            timeout (float): Longest wait in seconds for the whole request
+
+        Returns:
+            dict: Mapping of call name to its result
+
+        Raises:
+            TimeoutError: Some calls didn't finish in time; they are cancelled
+            Exception: The first error raised by a call; the others are cancelled
+        """
+        done, not_done = wait(
+            self._futures.values(), timeout=timeout, return_when=FIRST_EXCEPTION
+        )
+        for future in done:
+            if not future.cancelled() and future.exception() is not None:
+                self.cancel()
+                raise future.exception()
+        if not_done:
+            self.cancel()
+            pending = sorted(
+                name for name, future in self._futures.items() if future in not_done
+            )
+            raise TimeoutError(f"Query calls timed out after {timeout}s: {pending}")
+        return {name: future.result() for name, future in self._futures.items()}
+
+
+class ConcurrentQueries:
+    """Run independent read queries in parallel, each on its own session.
+
+    On a WAL database readers don't block each other, and the sqlite3 driver
+    releases the GIL while a statement runs, so a request takes about as long
+    as its slowest query instead of the sum of all of them.
+
+    Args:
+        session_factory (sessionmaker): Creates the session of every call; it
+            must not be bound to an in-memory database
+        max_workers (int): Threads, and so connections, used at most; keep it
+            within the engine's pool size
+    """
+
+    def __init__(self, session_factory, max_workers=DEFAULT_MAX_WORKERS):
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="query-fanout"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self, calls):
+        """Start a set of query calls without waiting for them.
+
+        Args:
+            calls (dict): Mapping of a name to a tuple (function, *args), the
+                function is called as function(session, *args)
+
+        Returns:
+            FanoutRequest: Handle to wait for or cancel the calls
+        """
+        return FanoutRequest(self._executor, self.session_factory, calls)
+
+    def run(self, calls, timeout=None):
+        """Run a set of query calls and return their results together.
+
+        Args:
+            calls (dict): Mapping of a name to a tuple (function, *args)
+            timeout (float): Longest wait in seconds for all of them
+
+        Returns:
+            dict: Mapping of call name to its result
+        """
+        return self.start(calls).result(timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def dashboard_calls(
+    user_id, start_date, end_date, specific_date, number_of_records=5, use_rollup=False
+):
+    """The single-user queries behind a dashboard, keyed by UserSummary field."""
+    return {
+        "total_workout_duration": (
+            queries.get_user_total_workout_duration,
+            user_id,
+            start_date,
+            end_date,
+            use_rollup,
+        ),
+        "avg_daily_caloric_intake": (
+            queries.get_user_avg_daily_caloric_intake,
+            user_id,
+            use_rollup,
+        ),
+        "avg_sleep_duration": (
+            queries.get_user_avg_sleep_duration,
+            user_id,
+            use_rollup,
+        ),
+        "weight_records": (queries.get_user_weight_records, user_id),
+        "daily_water_intake": (
+            queries.get_user_daily_water_intake,
+            user_id,
+            specific_date,
+            use_rollup,
+        ),
+        "recent_blood_pressure": (
+            queries.get_user_recent_blood_pressure,
+            user_id,
+            number_of_records,
+        ),
+        "avg_heart_rate_during_workouts": (
+            queries.get_user_avg_heart_rate_during_workouts,
+            user_id,
+            use_rollup,
+        ),
+    }
+
+
+def get_user_dashboard(
+    fanout,
+    user_id,
+    start_date,
+    end_date,
+    specific_date,
+    number_of_records=5,
+    use_rollup=False,
+    timeout=None,
+):
+    """Compute a user's dashboard with the queries running concurrently.
+
+    Args:
+        fanout (ConcurrentQueries): Pool running the queries
+        user_id (int): ID of the user
+        start_date (date): Start date of the workout duration period
+        end_date (date): End date of the workout duration period
+        specific_date (date): The date for which water intake is calculated
+        number_of_records (int): Number of recent blood pressure readings
+        use_rollup (bool): Read the aggregates from daily_user_stats, which leaves
+            out logs without a date
+        timeout (float): Longest wait in seconds for the whole dashboard
+
+    Returns:
+        UserSummary: The same values as get_user_summary
+    """
+    calls = dashboard_calls(
+        user_id, start_date, end_date, specific_date, number_of_records, use_rollup
+    )
+    results = fanout.run(calls, timeout)
+    return UserSummary(
+        user_id=user_id,
+        **{
+            **results,
+            # Plain tuples like get_user_summary, not Row objects
+            "weight_records": [tuple(row) for row in results["weight_records"]],
+            "recent_blood_pressure": [
+                tuple(row) for row in results["recent_blood_pressure"]
+            ],
+        },
+    )
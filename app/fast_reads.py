@@ -0,0 +1,166 @@
+# fast_reads.py
+from array import array
+from collections import namedtuple
+from sqlalchemy import Float, Integer, bindparam, cast, func, select
+from app.models.tables import HealthMetrics, HeartRateLog, WeightLog
+from app.queries import _date
+
+# Column-oriented results: dates as proleptic Gregorian ordinals
+# (date.fromordinal turns them back into dates), times as Unix epoch seconds
+WeightSeries = namedtuple("WeightSeries", ["days", "weights"])
+HeartRateSeries = namedtuple("HeartRateSeries", ["times", "heart_rates"])
+
+# julianday() of 0001-01-01, which is ordinal 1, and of 1970-01-01
+_JULIAN_DAY_OF_ORDINAL_ZERO = 1721424.5
+_JULIAN_DAY_OF_EPOCH = 2440587.5
+
+_weight_logs = WeightLog.__table__
+_health_metrics = HealthMetrics.__table__
+_heart_rate_logs = HeartRateLog.__table__
+
+
+def day_ordinal(column):
+    """SQL expression of a date or datetime column as a proleptic Gregorian ordinal."""
+    return cast(func.julianday(column) - _JULIAN_DAY_OF_ORDINAL_ZERO, Integer)
+
+
+def epoch_seconds(column):
+    """SQL expression of a date or datetime column as Unix epoch seconds."""
+    return cast((func.julianday(column) - _JULIAN_DAY_OF_EPOCH) * 86400.0, Float)
+
+
+WEIGHT_RECORDS = (
+    select(_weight_logs.c.date_recorded, _weight_logs.c.weight)
+    .where(_weight_logs.c.user_id == bindparam("user_id"))
+    .order_by(_weight_logs.c.date_recorded.asc())
+)
+WEIGHT_SERIES = (
+    select(day_ordinal(_weight_logs.c.date_recorded), _weight_logs.c.weight)
+    .where(_weight_logs.c.user_id == bindparam("user_id"))
+    .where(_weight_logs.c.date_recorded.isnot(None))
+    .where(_weight_logs.c.weight.isnot(None))
+    .order_by(_weight_logs.c.date_recorded.asc())
+)
+RECENT_BLOOD_PRESSURE = (
+    select(_health_metrics.c.date, _health_metrics.c.blood_pressure)
+    .where(_health_metrics.c.user_id == bindparam("user_id"))
+    .order_by(_health_metrics.c.date.desc())
+    .limit(bindparam("number_of_records"))
+)
+HEART_RATE_SERIES = (
+    select(
+        epoch_seconds(_heart_rate_logs.c.time_recorded),
+        _heart_rate_logs.c.heart_rate,
+    )
+    .where(_heart_rate_logs.c.user_id == bindparam("user_id"))
+    .where(_heart_rate_logs.c.time_recorded.isnot(None))
+    .where(_heart_rate_logs.c.heart_rate.isnot(None))
+    .order_by(_heart_rate_logs.c.time_recorded.asc())
+)
+
+_compiled = {}
+
+
+def driver_cursor(session, statement, parameters):
+    """Execute a Core statement straight on the DBAPI connection.
+
+    The statement is compiled once per dialect, and rows come back as the
+    driver's plain tuples, without SQLAlchemy Row objects or type processing.
+    Pending ORM changes are flushed first when the session autoflushes. Engine
+    cursor events, and so app.instrumentation, don't see these statements.
+    """
+    if session.autoflush:
+        session.flush()
+    connection = session.connection()
+    key = (statement, connection.dialect.name)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = statement.compile(dialect=connection.dialect)
+    # Also fills in the literal values of the statement, e.g. julianday offsets
+    values = compiled.construct_params(parameters)
+    cursor = connection.connection.driver_connection.cursor()
+    cursor.execute(compiled.string, [values[name] for name in compiled.positiontup])
+    return cursor
+
+
+def get_user_weight_records(session, user_id):
+    """Retrieve weight records over time for a user as plain tuples.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+
+    Returns:
+        list of tuples: List containing (date_recorded, weight)
+    """
+    cursor = driver_cursor(session, WEIGHT_RECORDS, {"user_id": user_id})
+    try:
+        return [(_date(day), weight) for day, weight in cursor]
+    finally:
+        cursor.close()
+
+
+def get_user_recent_blood_pressure(session, user_id, number_of_records=5):
+    """Retrieve the most recent blood pressure readings for a user as plain tuples.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        number_of_records (int): Number of recent records to retrieve
+
+    Returns:
+        list of tuples: List containing (date, blood_pressure)
+    """
+    parameters = {"user_id": user_id, "number_of_records": number_of_records}
+    cursor = driver_cursor(session, RECENT_BLOOD_PRESSURE, parameters)
+    try:
+        return [(_date(day), pressure) for day, pressure in cursor]
+    finally:
+        cursor.close()
+
+
+def get_user_weight_series(session, user_id):
+    """Retrieve a user's weight history as two compact numeric columns.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+
+    Returns:
+        WeightSeries: array('l') of day ordinals and array('d') of weights,
+        oldest first
+    """
+    days, weights = array("l"), array("d")
+    cursor = driver_cursor(session, WEIGHT_SERIES, {"user_id": user_id})
+    try:
+        for day, weight in cursor:
+            days.append(day)
+            weights.append(weight)
+    finally:
+        cursor.close()
+    return WeightSeries(days, weights)
+
+
+def get_user_heart_rate_series(session, user_id):
+    """Retrieve a user's heart rate samples as two compact numeric columns.
+
+    Times are computed by SQLite's julianday, so they are accurate to about a
+    millisecond.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+
+    Returns:
+        HeartRateSeries: array('d') of Unix epoch seconds and array('l') of
+        heart rates, oldest first
+    """
+    times, heart_rates = array("d"), array("l")
+    cursor = driver_cursor(session, HEART_RATE_SERIES, {"user_id": user_id})
+    try:
+        for time_recorded, heart_rate in cursor:
+            times.append(time_recorded)
+            heart_rates.append(heart_rate)
+    finally:
+        cursor.close()
+    return HeartRateSeries(times, heart_rates)
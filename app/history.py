@@ -0,0 +1,163 @@
+# history.py
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from sqlalchemy import DateTime, select, tuple_
+from app.models.tables import (
+    HealthMetrics,
+    HeartRateLog,
+    HeightLog,
+    NutritionLog,
+    SleepLog,
+    WaterIntakeLog,
+    WeightLog,
+    WorkoutLog,
+)
+
+# History name -> (log model, column the history is ordered by)
+HISTORY_SOURCES = {
+    "height": (HeightLog, HeightLog.date_recorded),
+    "weight": (WeightLog, WeightLog.date_recorded),
+    "workouts": (WorkoutLog, WorkoutLog.date),
+    "meals": (NutritionLog, NutritionLog.date),
+    "sleep": (SleepLog, SleepLog.start_time),
+    "health_metrics": (HealthMetrics, HealthMetrics.date),
+    "heart_rate": (HeartRateLog, HeartRateLog.time_recorded),
+    "water": (WaterIntakeLog, WaterIntakeLog.date),
+}
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_STREAM_BATCH_SIZE = 1000
+
+HistoryPage = namedtuple("HistoryPage", ["rows", "next_cursor"])
+
+
+def _source(history):
+    try:
+        return HISTORY_SOURCES[history]
+    except KeyError:
+        raise ValueError(
+            f"Unknown history {history!r}, expected one of {sorted(HISTORY_SOURCES)}"
+        ) from None
+
+
+def encode_cursor(history, newest_first, key_value, row_id):
+    """Build the opaque cursor pointing after the row (key_value, row_id)."""
+    payload = [history, newest_first, key_value.isoformat(), row_id]
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor, history, newest_first):
+    """Return the (key_value, row_id) a cursor points after.
+
+    Raises:
+        ValueError: The cursor is malformed or belongs to another history or
+            ordering
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_history, cursor_newest_first, key_value, row_id = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as error:
+        raise ValueError(f"Invalid history cursor {cursor!r}") from error
+    if (cursor_history, cursor_newest_first) != (history, newest_first):
+        raise ValueError(f"Cursor {cursor!r} belongs to another history or ordering")
+    _, key_column = _source(history)
+    if isinstance(key_column.type, DateTime):
+        return datetime.fromisoformat(key_value), row_id
+    return date.fromisoformat(key_value), row_id
+
+
+def _history_statement(history, user_id, newest_first):
+    model, key_column = _source(history)
+    table = model.__table__
+    key, row_id = table.c[key_column.key], table.c.id
+    order = [key.desc(), row_id.desc()] if newest_first else [key.asc(), row_id.asc()]
+    statement = (
+        select(table)
+        .where(table.c.user_id == user_id)
+        .where(key.isnot(None))
+        .order_by(*order)
+    )
+    return statement, key, row_id
+
+
+def get_history_page(
+    session,
+    history,
+    user_id,
+    cursor=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    newest_first=False,
+):
+    """Fetch one page of a user's log history with keyset pagination.
+
+    Pages are ordered by (date, id), and each page continues right after the
+    last row of the previous one. That is an index seek on the user's
+    composite index however deep the page, unlike an OFFSET, and rows
+    inserted meanwhile never shift the pages.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        history (str): Name of the history, see HISTORY_SOURCES
+        user_id (int): ID of the user
+        cursor (str): next_cursor of the previous page, None for the first page
+        page_size (int): Maximum number of rows in the page
+        newest_first (bool): Page from the latest rows back
+
+    Returns:
+        HistoryPage: The rows, and the cursor of the next page or None after
+        the last page
+    """
+    statement, key, row_id = _history_statement(history, user_id, newest_first)
+    if cursor is not None:
+        after = tuple_(*decode_cursor(cursor, history, newest_first))
+        position = tuple_(key, row_id)
+        statement = statement.where(
+            position < after if newest_first else position > after
+        )
+
+    # One extra row tells whether there is a next page
+    rows = session.execute(statement.limit(page_size + 1)).all()
+    if len(rows) <= page_size:
+        return HistoryPage(rows, None)
+    rows = rows[:page_size]
+    last = rows[-1]
+    next_cursor = encode_cursor(
+        history, newest_first, last._mapping[key], last._mapping[row_id]
+    )
+    return HistoryPage(rows, next_cursor)
+
+
+def iter_history(
+    session,
+    history,
+    user_id,
+    newest_first=False,
+    batch_size=DEFAULT_STREAM_BATCH_SIZE,
+):
+    """Stream a user's whole log history in (date, id) order.
+
+    Rows are fetched batch_size at a time with yield_per, so memory stays
+    constant however long the history is. The session can't run other
+    statements until the generator is exhausted or closed.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        history (str): Name of the history, see HISTORY_SOURCES
+        user_id (int): ID of the user
+        newest_first (bool): Stream from the latest rows back
+        batch_size (int): Rows fetched from the cursor at a time
+
+    Yields:
+        Row: One row of the log table
+    """
+    statement, _, _ = _history_statement(history, user_id, newest_first)
+    result = session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
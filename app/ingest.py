@@ -0,0 +1,444 @@
+# ingest.py
+import argparse
+import gzip
+import json
+import time
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from sqlalchemy import select
+from app.downsampling import downsample_heart_rates
+from app.models.tables import User, WorkoutLog
+from app.retry import default_retry_policy
+from app.rollups import STAT_COLUMNS, apply_deltas
+from app.workout_summaries import update_workout_summaries
+
+# Number of samples sent in one executemany
+INGEST_CHUNK_SIZE = 10000
+# Number of JSONL samples written in one transaction
+INGEST_BATCH_SIZE = 50000
+# Rejected samples whose reason is kept in IngestReport.errors
+MAX_ERROR_DETAILS = 100
+# Heart rates a wearable can plausibly report, in bpm
+HEART_RATE_RANGE = (20, 300)
+# Users or workouts looked up in one IN (...) query
+_ID_LOOKUP_CHUNK_SIZE = 500
+
+# Duplicates hit the unique (user_id, time_recorded) index and are skipped
+_HEART_RATE_INSERT = (
+    "INSERT OR IGNORE INTO heart_rate_logs "
+    "(user_id, workout_log_id, time_recorded, heart_rate) VALUES (?, ?, ?, ?)"
+)
+_HEART_RATE_STATS = (
+    "SELECT user_id, date(time_recorded), sum(heart_rate), count(*), "
+    "sum(CASE WHEN workout_log_id IS NOT NULL THEN heart_rate ELSE 0 END), "
+    "count(workout_log_id) "
+    "FROM heart_rate_logs WHERE id BETWEEN ? AND ? GROUP BY 1, 2"
+)
+_WATER_INSERT = (
+    "INSERT INTO water_intake_logs (user_id, date, water_intake) VALUES (?, ?, ?)"
+)
+
+
+class IngestReport:
+    """Counts and throughput of one or more ingested batches."""
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []  # (position, reason) of the first rejected samples
+        self.seconds = 0.0
+
+    def reject(self, position, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERROR_DETAILS:
+            self.errors.append((position, reason))
+
+    def merge(self, other):
+        self.received += other.received
+        self.inserted += other.inserted
+        self.duplicates += other.duplicates
+        self.seconds += other.seconds
+        for position, reason in other.errors:
+            if len(self.errors) < MAX_ERROR_DETAILS:
+                self.errors.append((position, reason))
+        self.rejected += other.rejected
+
+    @property
+    def rows_per_second(self):
+        """Sustained rate of received samples, validation and dedupe included."""
+        return self.received / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (
+            f"{self.received} received, {self.inserted} inserted, "
+            f"{self.duplicates} duplicates, {self.rejected} rejected "
+            f"in {self.seconds:.2f}s ({self.rows_per_second:,.0f} rows/s)"
+        )
+
+
+def _integer(sample, name):
+    value = sample[name]
+    if type(value) is not int:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    return value
+
+
+def _timestamp(value):
+    """Format a datetime, ISO 8601 string or Unix epoch seconds as stored by SQLite.
+
+    Aware times are converted to naive UTC, like the rest of the app stores them.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = datetime.fromtimestamp(value, timezone.utc)
+    elif not isinstance(value, datetime):
+        raise ValueError(f"time_recorded must be a datetime, got {value!r}")
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    # Same text as SQLAlchemy's SQLite DateTime, so equal times compare equal
+    return value.isoformat(" ", "microseconds")
+
+
+def _day(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = date.fromisoformat(value)
+    elif not isinstance(value, date):
+        raise ValueError(f"date must be a date, got {value!r}")
+    return value.isoformat()
+
+
+def heart_rate_row(sample):
+    """Validate one heart rate sample and convert it to an insert row.
+
+    Args:
+        sample (dict): user_id, time_recorded, heart_rate and optionally
+            workout_log_id
+
+    Returns:
+        tuple: (user_id, workout_log_id, time_recorded, heart_rate)
+
+    Raises:
+        ValueError: The sample is invalid
+    """
+    try:
+        user_id = _integer(sample, "user_id")
+        heart_rate = _integer(sample, "heart_rate")
+        time_recorded = _timestamp(sample["time_recorded"])
+    except KeyError as error:
+        raise ValueError(f"missing {error.args[0]}") from None
+    workout_log_id = sample.get("workout_log_id")
+    if workout_log_id is not None and type(workout_log_id) is not int:
+        raise ValueError(f"workout_log_id must be an integer, got {workout_log_id!r}")
+    low, high = HEART_RATE_RANGE
+    if not low <= heart_rate <= high:
+        raise ValueError(f"heart_rate {heart_rate} is outside {low}-{high}")
+    return user_id, workout_log_id, time_recorded, heart_rate
+
+
+def water_intake_row(sample):
+    """Validate one water intake sample and convert it to an insert row.
+
+    Args:
+        sample (dict): user_id, date and water_intake in ml
+
+    Returns:
+        tuple: (user_id, date, water_intake)
+
+    Raises:
+        ValueError: The sample is invalid
+    """
+    try:
+        user_id = _integer(sample, "user_id")
+        water_intake = _integer(sample, "water_intake")
+        day = _day(sample["date"])
+    except KeyError as error:
+        raise ValueError(f"missing {error.args[0]}") from None
+    if water_intake <= 0:
+        raise ValueError(f"water_intake must be positive, got {water_intake}")
+    return user_id, day, water_intake
+
+
+def _existing(connection, column, ids):
+    """Return the rows of (id, *columns) for the ids that exist."""
+    ids = list(ids)
+    rows = {}
+    for start in range(0, len(ids), _ID_LOOKUP_CHUNK_SIZE):
+        chunk = ids[start : start + _ID_LOOKUP_CHUNK_SIZE]
+        statement = select(column.table.c.id, column).where(
+            column.table.c.id.in_(chunk)
+        )
+        rows.update(connection.execute(statement).all())
+    return rows
+
+
+def _validate(connection, samples, convert, report, positions=None):
+    """Convert samples, rejecting invalid ones and the ones of unknown users."""
+    rows, row_positions = [], []
+    for index, sample in enumerate(samples):
+        position = index if positions is None else positions[index]
+        try:
+            rows.append(convert(sample))
+            row_positions.append(position)
+        except (ValueError, TypeError) as error:
+            report.reject(position, str(error))
+    report.received += len(samples)
+
+    users = _existing(connection, User.__table__.c.id, {row[0] for row in rows})
+    workouts = {}
+    if convert is heart_rate_row:
+        workout_ids = {row[1] for row in rows if row[1] is not None}
+        workouts = _existing(connection, WorkoutLog.__table__.c.user_id, workout_ids)
+
+    valid = []
+    for row, position in zip(rows, row_positions):
+        if row[0] not in users:
+            report.reject(position, f"unknown user_id {row[0]}")
+        elif (
+            convert is heart_rate_row
+            and row[1] is not None
+            and workouts.get(row[1]) != row[0]
+        ):
+            report.reject(
+                position, f"workout_log_id {row[1]} is not a workout of user {row[0]}"
+            )
+        else:
+            valid.append(row)
+    return valid
+
+
+def _heart_rate_deltas(connection, first_id, last_id):
+    deltas = {}
+    rows = connection.exec_driver_sql(_HEART_RATE_STATS, (first_id, last_id))
+    for user_id, day, total, count, workout_total, workout_count in rows:
+        stats = dict.fromkeys(STAT_COLUMNS, 0)
+        stats.update(
+            heart_rate_sum=total,
+            heart_rate_count=count,
+            workout_heart_rate_sum=workout_total,
+            workout_heart_rate_count=workout_count,
+        )
+        deltas[(user_id, date.fromisoformat(day))] = stats
+    return deltas
+
+
+def _write_heart_rates(connection, rows, chunk_size):
+    """Insert rows that aren't stored yet and return how many were inserted."""
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        # The executemany rowcount adds up changes(), which ignored rows don't
+        # count
+        inserted += connection.exec_driver_sql(
+            _HEART_RATE_INSERT, rows[start : start + chunk_size]
+        ).rowcount
+    return inserted
+
+
+def _write_batch(session, samples, convert, chunk_size, update_rollups, positions):
+    report = IngestReport()
+    connection = session.connection()
+    try:
+        rows = _validate(connection, samples, convert, report, positions)
+        if convert is heart_rate_row:
+            report.inserted = _write_heart_rates(connection, rows, chunk_size)
+            report.duplicates = len(rows) - report.inserted
+            if update_rollups and report.inserted:
+                # The transaction holds the write lock since the first insert, and
+                # ignored rows take no id, so the new rows got consecutive ids
+                # ending at last_insert_rowid()
+                last_id = connection.exec_driver_sql(
+                    "SELECT last_insert_rowid()"
+                ).scalar()
+                first_id = last_id - report.inserted + 1
+                apply_deltas(
+                    connection, _heart_rate_deltas(connection, first_id, last_id)
+                )
+                # As many ids as were inserted, so the write lock isn't held
+                # for a backlog left by other writers; with no backlog, these
+                # are exactly the new rows
+                downsample_heart_rates(
+                    connection, batch_size=report.inserted, max_batches=1
+                )
+                update_workout_summaries(
+                    connection, {row[1] for row in rows if row[1] is not None}
+                )
+        else:
+            for start in range(0, len(rows), chunk_size):
+                connection.exec_driver_sql(
+                    _WATER_INSERT, rows[start : start + chunk_size]
+                )
+            report.inserted = len(rows)
+            if update_rollups:
+                deltas = defaultdict(lambda: dict.fromkeys(STAT_COLUMNS, 0))
+                for user_id, day, water_intake in rows:
+                    deltas[(user_id, date.fromisoformat(day))][
+                        "water_intake"
+                    ] += water_intake
+                apply_deltas(connection, deltas)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return report
+
+
+def _ingest(session, samples, convert, chunk_size, update_rollups, positions=None):
+    started = time.perf_counter()
+    # A batch that lost a lock race is validated and written again from scratch
+    report = default_retry_policy.call(
+        _write_batch, session, samples, convert, chunk_size, update_rollups, positions
+    )
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def ingest_heart_rates(
+    session, samples, chunk_size=INGEST_CHUNK_SIZE, update_rollups=True
+):
+    """Validate and insert a batch of heart rate samples in one transaction.
+
+    Invalid samples, samples of unknown users and samples pointing at another
+    user's workout are rejected. A sample whose (user_id, time_recorded) is
+    already stored, or repeated in the batch, is skipped by the unique index on
+    those columns and counted as a duplicate. Samples are written with chunked
+    INSERT OR IGNORE executemany straight to the driver, and
+    daily_user_stats, the heart rate tiers of app.downsampling and the
+    summaries of the workouts the samples belong to are updated in the same
+    transaction. Samples other writers left out of the tiers are rolled in at
+    most as many ids per call as were inserted; catch_up_heart_rate_tiers rolls
+    in the rest.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        samples (list of dict): user_id, time_recorded (datetime, ISO 8601 string
+            or Unix epoch seconds), heart_rate and optionally workout_log_id
+        chunk_size (int): Samples sent in one executemany
+        update_rollups (bool): Add the new samples to daily_user_stats, the
+            heart rate tiers and the workout summaries
+
+    Returns:
+        IngestReport: Counts of the batch, errors hold (index, reason)
+    """
+    return _ingest(session, samples, heart_rate_row, chunk_size, update_rollups)
+
+
+def ingest_water_intakes(
+    session, samples, chunk_size=INGEST_CHUNK_SIZE, update_rollups=True
+):
+    """Validate and insert a batch of water intake samples in one transaction.
+
+    Water logs only have a date, so two equal samples are two drinks and
+    nothing is deduplicated.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        samples (list of dict): user_id, date (date or ISO 8601 string) and
+            water_intake in ml
+        chunk_size (int): Samples sent in one executemany
+        update_rollups (bool): Add the new samples to daily_user_stats
+
+    Returns:
+        IngestReport: Counts of the batch, errors hold (index, reason)
+    """
+    return _ingest(session, samples, water_intake_row, chunk_size, update_rollups)
+
+
+# Ingest kind -> row conversion
+INGEST_KINDS = {"heart_rate": heart_rate_row, "water": water_intake_row}
+
+
+def ingest_jsonl(
+    session,
+    source,
+    kind,
+    batch_size=INGEST_BATCH_SIZE,
+    chunk_size=INGEST_CHUNK_SIZE,
+    update_rollups=True,
+):
+    """Ingest a JSONL file of samples, one transaction per batch_size samples.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        source (str or file): Path of the file, gzip-compressed if it ends with
+            .gz, or an iterable of lines
+        kind (str): "heart_rate" or "water"
+        batch_size (int): Samples written in one transaction
+        chunk_size (int): Samples sent in one executemany
+        update_rollups (bool): Add the new samples to daily_user_stats
+
+    Returns:
+        IngestReport: Counts of the whole file, errors hold (line number, reason)
+    """
+    try:
+        convert = INGEST_KINDS[kind]
+    except KeyError:
+        raise ValueError(
+            f"Unknown ingest kind {kind!r}, expected one of {sorted(INGEST_KINDS)}"
+        ) from None
+
+    if isinstance(source, str):
+        opener = gzip.open if source.endswith(".gz") else open
+        with opener(source, "rt", encoding="utf-8") as file:
+            return ingest_jsonl(
+                session, file, kind, batch_size, chunk_size, update_rollups
+            )
+
+    report = IngestReport()
+    samples, positions = [], []
+
+    def flush():
+        report.merge(
+            _ingest(session, samples, convert, chunk_size, update_rollups, positions)
+        )
+        samples.clear()
+        positions.clear()
+
+    for line_number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        try:
+            sample = json.loads(line)
+        except ValueError:
+            report.received += 1
+            report.reject(line_number, "malformed JSON")
+            continue
+        if not isinstance(sample, dict):
+            report.received += 1
+            report.reject(line_number, "sample must be a JSON object")
+            continue
+        samples.append(sample)
+        positions.append(line_number)
+        if len(samples) >= batch_size:
+            flush()
+    if samples:
+        flush()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest a JSONL file of wearable samples."
+    )
+    parser.add_argument("kind", choices=sorted(INGEST_KINDS))
+    parser.add_argument("path", help="JSONL file, gzip-compressed if it ends with .gz")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import get_session
+
+    session = get_session()
+    try:
+        report = ingest_jsonl(session, args.path, args.kind, args.batch_size)
+    finally:
+        session.close()
+    print(report.summary())
+    for position, reason in report.errors:
+        print(f"line {position}: {reason}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# instrumentation.py
+import functools
+import inspect
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from sqlalchemy import event
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+# Statements slower than this are written to the slow-query log
+DEFAULT_SLOW_QUERY_MS = 100.0
+
+PERCENTILES = [50, 95, 99]
+# Latencies kept per histogram for the percentiles
+DEFAULT_MAX_SAMPLES = 10000
+# Most recent slow queries kept in QueryStats.slow_queries
+DEFAULT_MAX_SLOW_QUERIES = 1000
+
+
+class LatencyHistogram:
+    """Latency samples in milliseconds of one statement or query function.
+
+    Memory is bounded in long-running processes: calls, rows and the total are
+    counted exactly, but percentiles come from a uniform random sample of at
+    most max_samples latencies (reservoir sampling). They are exact until then.
+
+    Args:
+        max_samples (int): Most latencies kept for the percentiles
+    """
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = []
+        self.calls = 0
+        self.total = 0.0
+        self.rows = None
+        self._random = random.Random(0)
+
+    def add(self, milliseconds, rows=None):
+        """Record one call, rows is None when the row count is unknown."""
+        self.calls += 1
+        self.total += milliseconds
+        if len(self.samples) < self.max_samples:
+            self.samples.append(milliseconds)
+        else:
+            # Keeps every call in the sample with the same probability
+            index = self._random.randrange(self.calls)
+            if index < self.max_samples:
+                self.samples[index] = milliseconds
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of the samples, 0 when there are none."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, math.ceil(percent / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self):
+        summary = {"calls": self.calls, "rows": self.rows, "total_ms": self.total}
+        for percent in PERCENTILES:
+            summary[f"p{percent}_ms"] = self.percentile(percent)
+        return summary
+
+
+def _statement_key(statement):
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+def _summarize_batch(parameters):
+    """Row count and first row of executemany parameters, for the slow log."""
+    return {"rows": len(parameters), "first": parameters[0] if parameters else None}
+
+
+class QueryStats:
+    """Collects statement and query function latencies from an engine.
+
+    Statements are timed with before_cursor_execute/after_cursor_execute
+    events. Row counts of statements are the driver rowcount, which SQLite only
+    reports for INSERT, UPDATE and DELETE; query functions count the rows they
+    return. Slow executemany batches are logged with their row count and first
+    row instead of every row.
+
+    Args:
+        slow_query_ms (float): Statements at least this slow are logged, None disables the log
+        explain_slow_queries (bool): Attach the EXPLAIN QUERY PLAN of slow statements
+        max_slow_queries (int): Most recent slow queries kept in slow_queries
+    """
+
+    def __init__(
+        self,
+        slow_query_ms=DEFAULT_SLOW_QUERY_MS,
+        explain_slow_queries=True,
+        max_slow_queries=DEFAULT_MAX_SLOW_QUERIES,
+    ):
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow_queries = explain_slow_queries
+        self.statements = defaultdict(LatencyHistogram)
+        self.functions = defaultdict(LatencyHistogram)
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self.slow_query_count = 0
+        # Queries run on ConcurrentQueries and WriteBuffer threads too
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._engines = []
+        self._patched = []
+
+    def _function_stack(self):
+        if not hasattr(self._local, "functions"):
+            self._local.functions = []
+        return self._local.functions
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        elapsed = (time.perf_counter() - context._query_started) * 1000
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        with self._lock:
+            self.statements[_statement_key(statement)].add(elapsed, rows)
+
+        if self.slow_query_ms is not None and elapsed >= self.slow_query_ms:
+            plan = None
+            if executemany:
+                parameters = _summarize_batch(parameters)
+            elif self.explain_slow_queries:
+                plan = self._explain(cursor, statement, parameters)
+            self._log_slow_query(statement, parameters, elapsed, plan)
+
+    def _explain(self, cursor, statement, parameters):
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in explain_cursor.fetchall()]
+        except Exception as error:  # the plan is a nice-to-have, never fail the query
+            return [f"EXPLAIN failed: {error}"]
+        finally:
+            explain_cursor.close()
+
+    def _log_slow_query(self, statement, parameters, elapsed, plan):
+        stack = self._function_stack()
+        entry = {
+            "function": stack[-1] if stack else None,
+            "statement": statement,
+            "parameters": parameters,
+            "elapsed_ms": elapsed,
+            "plan": plan,
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+            self.slow_query_count += 1
+        slow_query_logger.warning(
+            "Slow query (%.1f ms) in %s: %s\nparameters: %r\nplan: %s",
+            elapsed,
+            entry["function"] or "<unknown>",
+            _statement_key(statement),
+            parameters,
+            "; ".join(plan or []),
+        )
+
+    def attach(self, engine):
+        """Start timing the statements executed by engine."""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        self._engines.append(engine)
+
+    def track(self, function, name=None):
+        """Wrap a function so its calls are timed as one query function.
+
+        Args:
+            function (callable): Function to time
+            name (str): Name in the stats, defaults to the function name
+
+        Returns:
+            callable: The wrapped function
+        """
+        name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = self._function_stack()
+            stack.append(name)
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                stack.pop()
+            if result is None:
+                rows = 0
+            else:
+                rows = len(result) if hasattr(result, "__len__") else 1
+            with self._lock:
+                self.functions[name].add(elapsed, rows)
+            return result
+
+        return wrapper
+
+    def instrument_module(self, module, prefix="get_"):
+        """Replace the query functions of a module with timed wrappers.
+
+        Callers that look the functions up on the module, like run_queries,
+        are timed; references imported before this call are not.
+
+        Args:
+            module (module): Module holding the query functions, e.g. app.queries
+            prefix (str): Only functions whose name starts with prefix are wrapped
+        """
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if name.startswith(prefix) and function.__module__ == module.__name__:
+                setattr(module, name, self.track(function, name))
+                self._patched.append((module, name, function))
+
+    def detach(self):
+        """Remove the engine listeners and restore instrumented modules."""
+        for engine in self._engines:
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+        self._engines = []
+        for module, name, function in reversed(self._patched):
+            setattr(module, name, function)
+        self._patched = []
+
+    def format_table(self, limit=20):
+        """Render query function and statement stats as a text table.
+
+        Args:
+            limit (int): Number of statements to show, slowest total time first
+
+        Returns:
+            str: The table
+        """
+        header = f"{'calls':>6} {'rows':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+
+        def line(histogram, label):
+            rows = "-" if histogram.rows is None else histogram.rows
+            return (
+                f"{histogram.calls:>6} {rows:>7} "
+                f"{histogram.percentile(50):>9.2f} {histogram.percentile(95):>9.2f} "
+                f"{histogram.percentile(99):>9.2f}  {label}"
+            )
+
+        with self._lock:
+            lines = [f"{header}  query function"]
+            for name, histogram in sorted(self.functions.items()):
+                lines.append(line(histogram, name))
+            lines += ["", f"{header}  statement"]
+            statements = sorted(
+                self.statements.items(), key=lambda item: item[1].total, reverse=True
+            )
+            for statement, histogram in statements[:limit]:
+                label = statement if len(statement) <= 80 else statement[:77] + "..."
+                lines.append(line(histogram, label))
+            lines += ["", f"{self.slow_query_count} slow queries"]
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling(engine, module=None, **options):
+    """Collect QueryStats for everything run inside the block.
+
+    Args:
+        engine (Engine): Engine whose statements are timed
+        module (module): Module whose get_* functions are timed, e.g. app.queries
+        **options: Passed on to QueryStats
+
+    Yields:
+        QueryStats: The stats being collected
+    """
+    stats = QueryStats(**options)
+    stats.attach(engine)
+    if module is not None:
+        stats.instrument_module(module)
+    try:
+        yield stats
+    finally:
+        stats.detach()
@@ -0,0 +1,209 @@
+# migrations.py
+from sqlalchemy import func, inspect, select, text, update
+from app.models.tables import Base, HeartRateLog, SleepLog, UserFitnessGoalTarget
+
+# Rows updated per transaction by the backfills
+BACKFILL_BATCH_SIZE = 10000
+
+# Stored in PRAGMA user_version once the schema is up to date. Bump it whenever
+# a table, column or index is added, so ensure_schema upgrades existing
+# databases on their next start.
+SCHEMA_VERSION = 4
+
+
+def get_schema_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def ensure_schema(engine):
+    """Bring the schema up to date unless the database is already at SCHEMA_VERSION.
+
+    Checking the version is a single pragma read, much cheaper than the
+    per-table inspection done here on every start otherwise. create_all only
+    creates missing tables, so the columns and indexes added to existing
+    tables are created too. Data is not migrated: run python -m app.migrations
+    to backfill new columns and tables.
+
+    Args:
+        engine (Engine): Engine of the database
+
+    Returns:
+        bool: True if the schema had to be checked
+    """
+    with engine.connect() as connection:
+        if get_schema_version(connection) == SCHEMA_VERSION:
+            return False
+        Base.metadata.create_all(connection)
+        _deduplicate_heart_rates(connection)
+        for table in Base.metadata.sorted_tables:
+            for column in table.columns:
+                _add_column(connection, column)
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        connection.commit()
+    return True
+
+
+# Replaced by the unique uq_heart_rate_logs_user_id_time_recorded
+_OLD_HEART_RATE_INDEX = "ix_heart_rate_logs_user_id_time_recorded"
+_DUPLICATE_HEART_RATES_SQL = """
+DELETE FROM heart_rate_logs
+WHERE id NOT IN (
+    SELECT min(id) FROM heart_rate_logs GROUP BY user_id, time_recorded
+)
+"""
+
+
+def _deduplicate_heart_rates(connection):
+    """Prepare heart_rate_logs for its unique (user_id, time_recorded) index.
+
+    Databases created before the index existed may hold samples repeated by
+    writers other than app.ingest, which would make creating it fail. All but
+    the first of them are deleted; rebuild daily_user_stats afterwards if any
+    were.
+
+    Returns:
+        int: Number of samples deleted
+    """
+    table = HeartRateLog.__table__
+    existing = {index["name"] for index in inspect(connection).get_indexes(table.name)}
+    if _OLD_HEART_RATE_INDEX not in existing:
+        return 0
+    deleted = connection.exec_driver_sql(_DUPLICATE_HEART_RATES_SQL).rowcount
+    connection.exec_driver_sql(f"DROP INDEX {_OLD_HEART_RATE_INDEX}")
+    return deleted
+
+
+def _add_column(connection, column):
+    """ALTER TABLE ADD COLUMN unless the column exists; True if it was added."""
+    table = column.table
+    existing = {info["name"] for info in inspect(connection).get_columns(table.name)}
+    if column.name in existing:
+        return False
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.exec_driver_sql(
+        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+    )
+    return True
+
+
+def add_missing_column(session, column):
+    """Add a column that was introduced after the table was created.
+
+    Base.metadata.create_all only creates missing tables, so databases created
+    by an older version of the app need the new columns added by hand.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        column (Column): Mapped column, e.g. SleepLog.__table__.c.duration
+
+    Returns:
+        bool: True if the column had to be added
+    """
+    connection = session.connection()
+    if not _add_column(connection, column):
+        return False
+    for index in column.table.indexes:
+        if column in index.columns.values():
+            index.create(connection, checkfirst=True)
+    session.commit()
+    return True
+
+
+def backfill_sleep_durations(session, batch_size=BACKFILL_BATCH_SIZE):
+    """Compute sleep_logs.duration for rows written before the column existed.
+
+    Rows are updated in batches of batch_size, one transaction per batch, so
+    the database is never locked for long.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        batch_size (int): Number of rows updated per transaction
+
+    Returns:
+        int: Number of rows updated
+    """
+    table = SleepLog.__table__
+    add_missing_column(session, table.c.duration)
+
+    pending = (
+        select(table.c.id)
+        .where(table.c.duration.is_(None))
+        .where(table.c.start_time.isnot(None), table.c.end_time.isnot(None))
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    statement = (
+        update(table)
+        .where(table.c.id.in_(pending))
+        .values(
+            duration=(
+                func.julianday(table.c.end_time) - func.julianday(table.c.start_time)
+            )
+            * 1440
+        )
+    )
+
+    updated = 0
+    while True:
+        result = session.execute(statement)
+        session.commit()
+        if not result.rowcount:
+            return updated
+        updated += result.rowcount
+
+
+# Targets written by the fake data generator are JSON strings holding the
+# encoded object, so unwrap those before walking the keys
+GOAL_TARGETS_SQL = """
+INSERT INTO user_fitness_goal_targets (goal_id, metric, user_id, value)
+SELECT goals.id, metrics.key, goals.user_id, metrics.value
+FROM (
+    SELECT id, user_id,
+           CASE WHEN json_type(target) = 'text'
+                     AND json_valid(json_extract(target, '$'))
+                THEN json_extract(target, '$')
+                ELSE target
+           END AS target
+    FROM user_fitness_goals
+    WHERE json_valid(target)
+) AS goals, json_each(goals.target) AS metrics
+WHERE json_type(goals.target) = 'object'
+  AND metrics.type IN ('integer', 'real')
+"""
+
+
+def backfill_goal_targets(session):
+    """Rebuild user_fitness_goal_targets from the JSON targets of every goal.
+
+    The ORM keeps the table in sync on writes, this fills it for goals stored
+    before it existed or written with Core bulk inserts.
+
+    Args:
+        session (db session): SQLAlchemy database session
+
+    Returns:
+        int: Number of target rows written
+    """
+    session.execute(UserFitnessGoalTarget.__table__.delete())
+    result = session.execute(text(GOAL_TARGETS_SQL))
+    session.commit()
+    return result.rowcount
+
+
+def main():
+    from app import get_session
+
+    session = get_session()
+    try:
+        updated = backfill_sleep_durations(session)
+        targets = backfill_goal_targets(session)
+    finally:
+        session.close()
+    print(f"Backfilled the sleep duration of {updated} sleep logs.")
+    print(f"Backfilled {targets} fitness goal targets.")
+
+
+if __name__ == "__main__":
+    main()
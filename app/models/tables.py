@@ -1,3 +1,4 @@
+import json
 from sqlalchemy import (
     Column,
     Integer,
@@ -8,9 +9,15 @@ from sqlalchemy import (
     DateTime,
     JSON,
     CheckConstraint,
+    Index,
+    PrimaryKeyConstraint,
+    event,
+    insert,
+    delete,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import declared_attr, relationship
+from sqlalchemy import inspect
 
 Base = declarative_base()
 
@@ -39,30 +46,44 @@ class HeightLog(Base):
     __tablename__ = "height_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     date_recorded = Column(Date)
     height = Column(Float, CheckConstraint("height > 0"))  # In centimeters (cm)
 
     user = relationship("User", back_populates="height_logs")
 
+    __table_args__ = (
+        Index("ix_height_logs_user_id_date_recorded", "user_id", "date_recorded"),
+    )
+
 
 class WeightLog(Base):
     __tablename__ = "weight_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     date_recorded = Column(Date)
     weight = Column(Float, CheckConstraint("weight > 0"))  # In kilograms (kg)
 
     user = relationship("User", back_populates="weight_logs")
 
+    # Covers a user's weight history in date order without touching the table
+    __table_args__ = (
+        Index(
+            "ix_weight_logs_user_id_date_recorded_weight",
+            "user_id",
+            "date_recorded",
+            "weight",
+        ),
+    )
+
 
 # Workout Log Table
 class WorkoutLog(Base):
     __tablename__ = "workout_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     date = Column(Date)
     exercise_type = Column(String)
     duration = Column(Float)  # in minutes
@@ -70,6 +91,11 @@ class WorkoutLog(Base):
     user = relationship("User", back_populates="workouts")
     heart_rate_logs = relationship("HeartRateLog", back_populates="workout_log")
 
+    # Covers total workout duration over a date range
+    __table_args__ = (
+        Index("ix_workout_logs_user_id_date_duration", "user_id", "date", "duration"),
+    )
+
 
 class MealType(Base):
     __tablename__ = "meal_types"
@@ -85,7 +111,7 @@ class NutritionLog(Base):
     __tablename__ = "nutrition_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     date = Column(Date)
     food = Column(String)
     calories = Column(Integer, CheckConstraint("calories > 0"))
@@ -96,19 +122,46 @@ class NutritionLog(Base):
     user = relationship("User", back_populates="meals")
     meal_type = relationship("MealType", back_populates="nutrition_logs")
 
+    # Covers average caloric intake
+    __table_args__ = (
+        Index("ix_nutrition_logs_user_id_date_calories", "user_id", "date", "calories"),
+    )
+
 
 # Sleep Data Table
 class SleepLog(Base):
     __tablename__ = "sleep_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     start_time = Column(DateTime, index=True)
     end_time = Column(DateTime, index=True)
+    duration = Column(Float)  # in minutes, kept in sync with start and end time
 
     user = relationship("User", back_populates="sleep_records")
 
-    __table_args__ = (CheckConstraint("start_time < end_time"),)
+    __table_args__ = (
+        CheckConstraint("start_time < end_time"),
+        # Covers average sleep duration
+        Index(
+            "ix_sleep_logs_user_id_start_time_duration",
+            "user_id",
+            "start_time",
+            "duration",
+        ),
+    )
+
+
+def sleep_duration_minutes(start_time, end_time):
+    if start_time is None or end_time is None:
+        return None
+    return (end_time - start_time).total_seconds() / 60
+
+
+@event.listens_for(SleepLog, "before_insert")
+@event.listens_for(SleepLog, "before_update")
+def set_sleep_duration(mapper, connection, target):
+    target.duration = sleep_duration_minutes(target.start_time, target.end_time)
 
 
 # Health Metrics Table
@@ -116,7 +169,7 @@ class HealthMetrics(Base):
     __tablename__ = "health_metrics"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     date = Column(Date, index=True)
     blood_pressure = Column(String)
     bmi = Column(Float)
@@ -129,24 +182,44 @@ class HealthMetrics(Base):
 
     user = relationship("User", back_populates="health_metrics")
 
+    # Covers the most recent blood pressure readings, newest first
+    __table_args__ = (
+        Index(
+            "ix_health_metrics_user_id_date_desc_blood_pressure",
+            user_id,
+            date.desc(),
+            blood_pressure,
+        ),
+    )
+
 
 class WaterIntakeLog(Base):
     __tablename__ = "water_intake_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     date = Column(Date)
     water_intake = Column(Integer, CheckConstraint("water_intake > 0"))  # in ml
 
     user = relationship("User", back_populates="water_intake_logs")
 
+    # Covers daily water intake
+    __table_args__ = (
+        Index(
+            "ix_water_intake_logs_user_id_date_water_intake",
+            "user_id",
+            "date",
+            "water_intake",
+        ),
+    )
+
 
 # Heart Rate Log Table
 class HeartRateLog(Base):
     __tablename__ = "heart_rate_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
     workout_log_id = Column(Integer, ForeignKey("workout_logs.id"), nullable=True)
     time_recorded = Column(DateTime)
     heart_rate = Column(Integer)  # Heart rate in beats per minute
@@ -154,6 +227,22 @@ class HeartRateLog(Base):
     user = relationship("User", back_populates="heart_rate_logs")
     workout_log = relationship("WorkoutLog", back_populates="heart_rate_logs")
 
+    __table_args__ = (
+        # Samples are deduplicated on (user_id, time_recorded) by app.ingest
+        Index(
+            "uq_heart_rate_logs_user_id_time_recorded",
+            "user_id",
+            "time_recorded",
+            unique=True,
+        ),
+        # Covers the heart rate samples of a workout
+        Index(
+            "ix_heart_rate_logs_workout_log_id_heart_rate",
+            "workout_log_id",
+            "heart_rate",
+        ),
+    )
+
 
 class FitnessGoalType(Base):
     __tablename__ = "fitness_goal_types"
@@ -183,3 +272,163 @@ class UserFitnessGoal(Base):
 
     user = relationship("User", back_populates="fitness_goals")
     goal_type = relationship("FitnessGoalType", back_populates="user_fitness_goals")
+    targets = relationship("UserFitnessGoalTarget", viewonly=True)
+
+
+# Numeric metrics of UserFitnessGoal.target, one row per metric, so goals can be
+# looked up by metric through an index instead of matching the JSON text
+class UserFitnessGoalTarget(Base):
+    __tablename__ = "user_fitness_goal_targets"
+
+    goal_id = Column(Integer, ForeignKey("user_fitness_goals.id"), primary_key=True)
+    metric = Column(String, primary_key=True)  # e.g., "weight", "sleep"
+    user_id = Column(Integer, ForeignKey("users.id"))
+    value = Column(Float)
+
+    __table_args__ = (
+        Index(
+            "ix_user_fitness_goal_targets_metric_user_id_value",
+            "metric",
+            "user_id",
+            "value",
+        ),
+    )
+
+
+def goal_target_values(target):
+    """Return the numeric metrics of a goal target as a dict.
+
+    Targets are stored either as a JSON object or, as written by the fake data
+    generator, as a JSON string holding the encoded object.
+    """
+    if isinstance(target, str):
+        try:
+            target = json.loads(target)
+        except ValueError:
+            return {}
+    if not isinstance(target, dict):
+        return {}
+    return {
+        metric: float(value)
+        for metric, value in target.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+def goal_target_rows(goal_id, user_id, target):
+    return [
+        {"goal_id": goal_id, "metric": metric, "user_id": user_id, "value": value}
+        for metric, value in goal_target_values(target).items()
+    ]
+
+
+def _delete_goal_targets(connection, goal):
+    table = UserFitnessGoalTarget.__table__
+    connection.execute(delete(table).where(table.c.goal_id == goal.id))
+
+
+@event.listens_for(UserFitnessGoal, "after_insert")
+@event.listens_for(UserFitnessGoal, "after_update")
+def sync_goal_targets(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not (attrs.target.history.has_changes() or attrs.user_id.history.has_changes()):
+        return
+    _delete_goal_targets(connection, target)
+    rows = goal_target_rows(target.id, target.user_id, target.target)
+    if rows:
+        connection.execute(insert(UserFitnessGoalTarget.__table__), rows)
+
+
+@event.listens_for(UserFitnessGoal, "after_delete")
+def delete_goal_targets(mapper, connection, target):
+    _delete_goal_targets(connection, target)
+
+
+# Daily per-user rollup of the log tables, maintained by app.rollups
+class DailyUserStats(Base):
+    __tablename__ = "daily_user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    workout_minutes = Column(Float, nullable=False, default=0)
+    calories = Column(Integer, nullable=False, default=0)
+    meal_count = Column(Integer, nullable=False, default=0)
+    water_intake = Column(Integer, nullable=False, default=0)  # in ml
+    sleep_minutes = Column(Float, nullable=False, default=0)
+    sleep_count = Column(Integer, nullable=False, default=0)
+    heart_rate_sum = Column(Integer, nullable=False, default=0)
+    heart_rate_count = Column(Integer, nullable=False, default=0)
+    # Samples linked to a workout, for the average heart rate during workouts
+    workout_heart_rate_sum = Column(Integer, nullable=False, default=0)
+    workout_heart_rate_count = Column(Integer, nullable=False, default=0)
+
+
+# Downsampled heart rate tiers, one row per user per minute, hour or day, filled
+# from heart_rate_logs by app.downsampling
+class _HeartRateBucket:
+    @declared_attr
+    def user_id(cls):
+        return Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    bucket = Column(DateTime, primary_key=True)  # start of the minute, hour or day
+    min_heart_rate = Column(Integer, nullable=False)
+    max_heart_rate = Column(Integer, nullable=False)
+    heart_rate_sum = Column(Integer, nullable=False)
+    heart_rate_count = Column(Integer, nullable=False)
+
+    # Columns of a mixin's declared_attr come last, so order the key explicitly
+    __table_args__ = (PrimaryKeyConstraint("user_id", "bucket"),)
+
+
+class HeartRateMinuteStats(_HeartRateBucket, Base):
+    __tablename__ = "heart_rate_minute_stats"
+
+
+class HeartRateHourStats(_HeartRateBucket, Base):
+    __tablename__ = "heart_rate_hour_stats"
+
+
+class HeartRateDayStats(_HeartRateBucket, Base):
+    __tablename__ = "heart_rate_day_stats"
+
+
+# Progress of app.downsampling per source table: the last heart_rate_logs id
+# rolled into the tiers, and the time before which rows were pruned
+class DownsampleState(Base):
+    __tablename__ = "downsample_state"
+
+    source = Column(String, primary_key=True)  # table name
+    last_id = Column(Integer)
+    pruned_before = Column(DateTime)
+
+
+# Heart rate of every workout that has samples, computed from its heart_rate_logs
+# by app.workout_summaries when they are ingested or the workout is closed
+class WorkoutHeartRateSummary(Base):
+    __tablename__ = "workout_heart_rate_summaries"
+
+    workout_log_id = Column(Integer, ForeignKey("workout_logs.id"), primary_key=True)
+    # Copied from the workout, so summaries are aggregated without joining it
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    exercise_type = Column(String)
+    sample_count = Column(Integer, nullable=False)
+    heart_rate_sum = Column(Integer, nullable=False)
+    min_heart_rate = Column(Integer, nullable=False)
+    max_heart_rate = Column(Integer, nullable=False)
+    # Seconds spent in each heart rate zone, see app.workout_summaries
+    zone_1_seconds = Column(Float, nullable=False, default=0)
+    zone_2_seconds = Column(Float, nullable=False, default=0)
+    zone_3_seconds = Column(Float, nullable=False, default=0)
+    zone_4_seconds = Column(Float, nullable=False, default=0)
+    zone_5_seconds = Column(Float, nullable=False, default=0)
+
+    # Covers a user's average heart rate during workouts, also by exercise type
+    __table_args__ = (
+        Index(
+            "ix_workout_heart_rate_summaries_user_id_exercise_type_sums",
+            "user_id",
+            "exercise_type",
+            "heart_rate_sum",
+            "sample_count",
+        ),
+    )
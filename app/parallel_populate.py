@@ -0,0 +1,238 @@
+# parallel_populate.py
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from app.engine import create_app_engine
+from app.models.tables import Base, MealType, FitnessGoalType
+from app.populate_db import (
+    BULK_CHUNK_SIZE,
+    BULK_TABLES,
+    fake,
+    get_next_ids,
+    populate_fitness_goal_types,
+    populate_meal_types,
+    set_reference_time,
+    write_fake_users,
+)
+
+
+# Users generated from one seed. Blocks, not shards, get their own seed, so the
+# data doesn't depend on how many shards the users are split across
+SEED_BLOCK_USERS = 100
+
+
+def block_seed(seed, block_index):
+    """Derive the random seed used by one block of users.
+
+    Args:
+        seed (int): Seed of the whole dataset
+        block_index (int): Index of the block, counted from the first user
+
+    Returns:
+        int: Seed for the block
+    """
+    return seed * 1_000_003 + block_index
+
+
+def split_user_ids(first_user_id, num_users, num_shards):
+    """Split a contiguous range of user IDs into at most num_shards ranges.
+
+    Args:
+        first_user_id (int): First user ID to generate
+        num_users (int): Number of users to generate
+        num_shards (int): Number of shards
+
+    Returns:
+        list of range: One range of user IDs per non-empty shard
+    """
+    per_shard, remainder = divmod(num_users, num_shards)
+    ranges = []
+    start = first_user_id
+    for shard_index in range(num_shards):
+        size = per_shard + (1 if shard_index < remainder else 0)
+        if size:
+            ranges.append(range(start, start + size))
+        start += size
+    return ranges
+
+
+def populate_shard(
+    shard_path,
+    user_ids,
+    first_ids,
+    num_logs_per_user,
+    meal_type_ids,
+    goal_type_ids,
+    seed,
+    reference_time,
+    chunk_size=BULK_CHUNK_SIZE,
+    vectorized=False,
+    block_size=SEED_BLOCK_USERS,
+):
+    """Generate the rows for one range of users into its own SQLite file.
+
+    Runs inside a worker process. Because primary keys are derived from the
+    user ID (see create_fake_rows), rows from different shards never collide
+    and can be copied into the main database unchanged. user_ids starts at a
+    block boundary, and every block of block_size users is generated from its
+    own seed.
+
+    Returns:
+        str: Path of the shard file
+    """
+    set_reference_time(reference_time)
+    if vectorized:
+        import numpy as np
+
+    engine = create_app_engine(f"sqlite:///{shard_path}", profile="bulk_load")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        for block_start in range(user_ids.start, user_ids.stop, block_size):
+            block_index = (block_start - first_ids["users"]) // block_size
+            random.seed(block_seed(seed, block_index))
+            fake.seed_instance(block_seed(seed, block_index))
+            rng = (
+                np.random.default_rng(block_seed(seed, block_index))
+                if vectorized
+                else None
+            )
+            write_fake_users(
+                session,
+                range(block_start, min(block_start + block_size, user_ids.stop)),
+                first_ids,
+                num_logs_per_user,
+                meal_type_ids,
+                goal_type_ids,
+                chunk_size,
+                rng,
+            )
+    finally:
+        session.close()
+        engine.dispose()
+    return shard_path
+
+
+def merge_shards(engine, shard_paths):
+    """Copy the rows of every shard file into the database behind engine.
+
+    Each shard is attached to the main database and copied table by table with
+    INSERT ... SELECT in a single transaction.
+
+    Args:
+        engine (Engine): Engine of the main database
+        shard_paths (list of str): Paths of the shard files
+    """
+    with engine.connect() as connection:
+        for shard_path in shard_paths:
+            connection.exec_driver_sql("ATTACH DATABASE ? AS shard", (shard_path,))
+            try:
+                for table in BULK_TABLES:
+                    columns = ", ".join(column.name for column in table.columns)
+                    connection.exec_driver_sql(
+                        f"INSERT INTO main.{table.name} ({columns}) "
+                        f"SELECT {columns} FROM shard.{table.name}"
+                    )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.exec_driver_sql("DETACH DATABASE shard")
+                connection.commit()
+
+
+def parallel_populate_database(
+    session,
+    num_users=10,
+    num_logs_per_user=5,
+    num_shards=None,
+    seed=0,
+    chunk_size=BULK_CHUNK_SIZE,
+    shard_dir=None,
+    reference_time=None,
+    vectorized=False,
+    block_size=SEED_BLOCK_USERS,
+):
+    """Populate the database from several worker processes.
+
+    The user ID range is split into blocks of block_size users, and the blocks
+    across a process pool. Each worker seeds Faker and ``random`` from the
+    dataset seed and the index of every block it generates, and writes into
+    its own SQLite file. The same arguments therefore produce the same data
+    whatever the number of shards. The shard files are then merged into the
+    main database.
+
+    Generated dates end at reference_time, which defaults to the start of the
+    current day; pass it explicitly to reproduce a dataset on another day.
+
+    Args:
+        session (db session): SQLAlchemy session bound to a file database
+        num_users (int): Number of users to create
+        num_logs_per_user (int): Number of rows per log table for each user
+        num_shards (int): Number of worker processes, defaults to the CPU count
+        seed (int): Seed of the whole dataset
+        chunk_size (int): Approximate number of rows per table in one transaction
+        shard_dir (str): Directory for the shard files, a temporary one by default
+        reference_time (datetime): Latest generated datetime
+        vectorized (bool): Generate whole columns with NumPy instead of Faker
+        block_size (int): Users generated from one seed
+    """
+    engine = session.get_bind()
+    if engine.url.database in (None, "", ":memory:"):
+        raise ValueError("parallel_populate_database requires a file database")
+
+    populate_meal_types(session)
+    populate_fitness_goal_types(session)
+    meal_type_ids = list(session.execute(select(MealType.id)).scalars())
+    goal_type_ids = list(session.execute(select(FitnessGoalType.id)).scalars())
+    first_ids = get_next_ids(session)
+    session.commit()
+
+    reference_time = reference_time or datetime.combine(datetime.today(), time())
+    num_shards = num_shards or os.cpu_count() or 1
+    # Shards get whole blocks of users, which are seeded on their own
+    first_user_id = first_ids["users"]
+    user_id_ranges = [
+        range(
+            first_user_id + blocks.start * block_size,
+            first_user_id + min(blocks.stop * block_size, num_users),
+        )
+        for blocks in split_user_ids(0, -(-num_users // block_size), num_shards)
+    ]
+
+    work_dir = shard_dir or tempfile.mkdtemp(prefix="health_fitness_shards_")
+    try:
+        with ProcessPoolExecutor(max_workers=len(user_id_ranges) or 1) as executor:
+            futures = [
+                executor.submit(
+                    populate_shard,
+                    os.path.join(work_dir, f"shard_{shard_index}.db"),
+                    user_ids,
+                    first_ids,
+                    num_logs_per_user,
+                    meal_type_ids,
+                    goal_type_ids,
+                    seed,
+                    reference_time,
+                    chunk_size,
+                    vectorized,
+                    block_size,
+                )
+                for shard_index, user_ids in enumerate(user_id_ranges)
+            ]
+            shard_paths = [future.result() for future in futures]
+
+        merge_shards(engine, shard_paths)
+    finally:
+        if shard_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(
+        f"Loaded fake data for {num_users} users from {len(user_id_ranges)} shards into the database."
+    )
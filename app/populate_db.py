@@ -15,11 +15,19 @@ from app.models.tables import (
     WaterIntakeLog,
     FitnessGoalType,
     UserFitnessGoal,
+    UserFitnessGoalTarget,
+    goal_target_rows,
+    sleep_duration_minutes,
 )
 from datetime import timedelta
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, insert, select
 
 fake = Faker()
 
+# Number of log rows per table sent in one executemany by the bulk loader
+BULK_CHUNK_SIZE = 10000
+
 FOOD_ITEMS = [
     "Pasta",
     "Rice",
@@ -30,6 +38,10 @@ FOOD_ITEMS = [
     "Tofu Curry",
 ]
 
+EXERCISE_TYPES = ["Running", "Swimming", "Cycling", "Yoga"]
+
+GOAL_STATUSES = ["Not Started", "In Progress", "Achieved"]
+
 FITNESS_GOAL_TYPES = [
     {"name": "Lose Weight", "description": "Lose a certain amount of weight"},
     {"name": "Gain Weight", "description": "Gain a certain amount of weight"},
@@ -38,82 +50,111 @@ FITNESS_GOAL_TYPES = [
 ]
 
 
-def create_fake_user():
-    return User(
-        username=fake.user_name(), age=random.randint(18, 80), email=fake.email()
-    )
+# Generated dates fall in the ten years before this datetime; None means now
+reference_time = None
 
 
-def create_fake_height_log(user):
-    return HeightLog(
-        user=user,
-        date_recorded=fake.date_between(start_date="-10y", end_date="today"),
-        height=random.uniform(150.0, 200.0),  # Height in cm
-    )
+def set_reference_time(value):
+    """Pin the end of the generated date range, making seeded runs reproducible.
 
+    Args:
+        value (datetime): Latest generated datetime, or None to use the current time
+    """
+    global reference_time
+    reference_time = value
 
-def create_fake_weight_log(user):
-    return WeightLog(
-        user=user,
-        date_recorded=fake.date_between(start_date="-10y", end_date="today"),
-        weight=random.uniform(50.0, 100.0),  # Weight in kg
+
+def fake_past_date(start_date=None):
+    if reference_time is None:
+        return fake.date_between(start_date=start_date or "-10y", end_date="today")
+    return fake.date_between(
+        start_date=start_date or (reference_time - relativedelta(years=10)).date(),
+        end_date=reference_time.date(),
     )
 
 
-def create_fake_workout_log(user):
-    return WorkoutLog(
-        user=user,
-        date=fake.date_between(start_date="-10y", end_date="today"),
-        exercise_type=random.choice(["Running", "Swimming", "Cycling", "Yoga"]),
-        duration=random.uniform(30.0, 120.0),  # Duration in minutes
+def fake_past_datetime():
+    if reference_time is None:
+        return fake.date_time_between(start_date="-10y", end_date="now")
+    return fake.date_time_between(
+        start_date=reference_time - relativedelta(years=10), end_date=reference_time
     )
 
 
-def create_fake_water_intake_log(user):
-    return WaterIntakeLog(
-        user=user,
-        date=fake.date_between(start_date="-10y", end_date="today"),
-        water_intake=random.randint(0, 5000),  # Water intake in ml
-    )
+def fake_user_values():
+    return {
+        "username": fake.user_name(),
+        "age": random.randint(18, 80),
+        "email": fake.email(),
+    }
 
 
-def create_fake_nutrition_log(user, meal_type_id):
-    return NutritionLog(
-        user=user,
-        date=fake.date_between(start_date="-10y", end_date="today"),
-        food=random.choice(FOOD_ITEMS),
-        calories=random.randint(100, 1000),
-        meal_type_id=meal_type_id,
-    )
+def fake_height_log_values():
+    return {
+        "date_recorded": fake_past_date(),
+        "height": random.uniform(150.0, 200.0),  # Height in cm
+    }
 
 
-def create_fake_sleep_log(user):
-    start_time = fake.date_time_between(start_date="-10y", end_date="now")
+def fake_weight_log_values():
+    return {
+        "date_recorded": fake_past_date(),
+        "weight": random.uniform(50.0, 100.0),  # Weight in kg
+    }
+
+
+def fake_workout_log_values():
+    return {
+        "date": fake_past_date(),
+        "exercise_type": random.choice(EXERCISE_TYPES),
+        "duration": random.uniform(30.0, 120.0),  # Duration in minutes
+    }
+
+
+def fake_water_intake_log_values():
+    return {
+        "date": fake_past_date(),
+        "water_intake": random.randint(1, 5000),  # Water intake in ml
+    }
+
+
+def fake_nutrition_log_values(meal_type_id):
+    return {
+        "date": fake_past_date(),
+        "food": random.choice(FOOD_ITEMS),
+        "calories": random.randint(100, 1000),
+        "meal_type_id": meal_type_id,
+    }
+
+
+def fake_sleep_log_values():
+    start_time = fake_past_datetime()
     end_time = start_time + timedelta(hours=random.randint(6, 10))
-    return SleepLog(user=user, start_time=start_time, end_time=end_time)
+    return {
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration": sleep_duration_minutes(start_time, end_time),
+    }
 
 
-def create_fake_health_metrics(user):
-    return HealthMetrics(
-        user=user,
-        date=fake.date_between(start_date="-10y", end_date="today"),
-        blood_pressure=f"{random.randint(70, 120)}/{random.randint(40, 80)}",
-        resting_heart_rate=random.randint(50, 80),
-        blood_oxygen_level=random.randint(95, 100),
-        blood_sugar_level=random.randint(70, 120),
-    )
+def fake_health_metrics_values():
+    return {
+        "date": fake_past_date(),
+        "blood_pressure": f"{random.randint(70, 120)}/{random.randint(40, 80)}",
+        "resting_heart_rate": random.randint(50, 80),
+        "blood_oxygen_level": random.randint(95, 100),
+        "blood_sugar_level": random.randint(70, 120),
+    }
 
 
-def create_fake_heart_rate_log(user, workout_log=None):
-    return HeartRateLog(
-        user=user,
-        workout_log=workout_log,
-        time_recorded=fake.date_time_between(start_date="-10y", end_date="now"),
-        heart_rate=random.randint(60, 180),  # Heart rate in bpm
-    )
+def fake_heart_rate_log_values():
+    return {
+        "time_recorded": fake_past_datetime(),
+        "heart_rate": random.randint(60, 180),  # Heart rate in bpm
+    }
 
 
-def create_fake_fitness_goal(user, goal_type_id):
+def fake_fitness_goal_values(goal_type_id):
     # Generate a fake target JSON containing relevant user metrics
     target = {
         "weight": random.uniform(
@@ -125,19 +166,60 @@ def create_fake_fitness_goal(user, goal_type_id):
         # Add more relevant metrics as needed
     }
 
-    start_date = fake.date_between(start_date="-10y", end_date="today")
-    end_date = fake.date_between(start_date=start_date, end_date="today")
+    start_date = fake_past_date()
+    end_date = fake_past_date(start_date=start_date)
+
+    return {
+        "goal_type_id": goal_type_id,
+        "target": json.dumps(target),  # Convert the dictionary to a JSON string
+        "start_date": start_date,
+        "end_date": end_date,
+        "status": random.choice(GOAL_STATUSES),
+    }
+
+
+def create_fake_user():
+    return User(**fake_user_values())
+
+
+def create_fake_height_log(user):
+    return HeightLog(user=user, **fake_height_log_values())
+
+
+def create_fake_weight_log(user):
+    return WeightLog(user=user, **fake_weight_log_values())
+
+
+def create_fake_workout_log(user):
+    return WorkoutLog(user=user, **fake_workout_log_values())
+
+
+def create_fake_water_intake_log(user):
+    return WaterIntakeLog(user=user, **fake_water_intake_log_values())
+
 
-    return UserFitnessGoal(
-        user=user,
-        goal_type_id=goal_type_id,
-        target=json.dumps(target),  # Convert the dictionary to a JSON string
-        start_date=start_date,
-        end_date=end_date,
-        status=random.choice(["Not Started", "In Progress", "Achieved"]),
+def create_fake_nutrition_log(user, meal_type_id):
+    return NutritionLog(user=user, **fake_nutrition_log_values(meal_type_id))
+
+
+def create_fake_sleep_log(user):
+    return SleepLog(user=user, **fake_sleep_log_values())
+
+
+def create_fake_health_metrics(user):
+    return HealthMetrics(user=user, **fake_health_metrics_values())
+
+
+def create_fake_heart_rate_log(user, workout_log=None):
+    return HeartRateLog(
+        user=user, workout_log=workout_log, **fake_heart_rate_log_values()
     )
 
 
+def create_fake_fitness_goal(user, goal_type_id):
+    return UserFitnessGoal(user=user, **fake_fitness_goal_values(goal_type_id))
+
+
 def populate_meal_types(session):
     # Check if the MealType table is already populated
     if session.query(MealType).count() == 0:
@@ -212,3 +294,217 @@ def populate_database(session, num_users=10, num_logs_per_user=5):
     print(
         f"Added fake data for {num_users} users and their associated logs to the database."
     )
+
+
+# Tables written by the bulk loader, in foreign key order
+BULK_TABLES = [
+    User.__table__,
+    UserFitnessGoal.__table__,
+    UserFitnessGoalTarget.__table__,
+    HeightLog.__table__,
+    WeightLog.__table__,
+    WorkoutLog.__table__,
+    NutritionLog.__table__,
+    SleepLog.__table__,
+    HealthMetrics.__table__,
+    HeartRateLog.__table__,
+    WaterIntakeLog.__table__,
+]
+
+
+def get_next_ids(session):
+    """Return the first free primary key of every table written by the bulk loader.
+
+    Args:
+        session (db session): SQLAlchemy database session
+
+    Returns:
+        dict: Mapping of table name to the next unused id
+    """
+    return {
+        table.name: (session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+        for table in BULK_TABLES
+        if "id" in table.c
+    }
+
+
+def create_fake_rows(
+    user_ids, first_ids, num_logs_per_user, meal_type_ids, goal_type_ids
+):
+    """Build plain row dictionaries for a batch of users and their logs.
+
+    Primary keys are assigned up front so the rows can be inserted with
+    executemany and still reference each other: the n-th user after
+    ``first_ids["users"]`` owns a fixed block of ids in every log table, which
+    is what lets ``heart_rate_logs.workout_log_id`` point at its workout.
+
+    Args:
+        user_ids (iterable of int): IDs of the users to generate
+        first_ids (dict): Id of the first row of each table, see get_next_ids
+        num_logs_per_user (int): Number of rows per log table for each user
+        meal_type_ids (list of int): Existing meal type IDs
+        goal_type_ids (list of int): Existing fitness goal type IDs
+
+    Returns:
+        dict: Mapping of table name to a list of row dictionaries
+    """
+    rows = {table.name: [] for table in BULK_TABLES}
+    for user_id in user_ids:
+        user_index = user_id - first_ids["users"]
+
+        user = fake_user_values()
+        # Faker repeats usernames and emails long before a million users
+        user["username"] = f"{user['username']}_{user_id}"
+        local_part, domain = user["email"].split("@")
+        user["email"] = f"{local_part}_{user_id}@{domain}"
+        rows["users"].append({"id": user_id, **user})
+
+        # Reserve one goal id per goal type so every user owns a fixed block
+        goal_base = first_ids["user_fitness_goals"] + user_index * len(goal_type_ids)
+        num_goal_types = random.randint(1, len(goal_type_ids))
+        for offset, goal_type_id in enumerate(
+            random.sample(goal_type_ids, num_goal_types)
+        ):
+            goal = fake_fitness_goal_values(goal_type_id)
+            rows["user_fitness_goals"].append(
+                {"id": goal_base + offset, "user_id": user_id, **goal}
+            )
+            rows["user_fitness_goal_targets"].extend(
+                goal_target_rows(goal_base + offset, user_id, goal["target"])
+            )
+
+        for log_index in range(num_logs_per_user):
+            offset = user_index * num_logs_per_user + log_index
+            log_values = {
+                "height_logs": fake_height_log_values(),
+                "weight_logs": fake_weight_log_values(),
+                "workout_logs": fake_workout_log_values(),
+                "nutrition_logs": fake_nutrition_log_values(
+                    random.choice(meal_type_ids)
+                ),
+                "sleep_logs": fake_sleep_log_values(),
+                "health_metrics": fake_health_metrics_values(),
+                "heart_rate_logs": {
+                    "workout_log_id": first_ids["workout_logs"] + offset,
+                    **fake_heart_rate_log_values(),
+                },
+                "water_intake_logs": fake_water_intake_log_values(),
+            }
+            for table_name, values in log_values.items():
+                rows[table_name].append(
+                    {"id": first_ids[table_name] + offset, "user_id": user_id, **values}
+                )
+    return rows
+
+
+def insert_rows(session, rows):
+    """Insert row dictionaries with one executemany per table.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        rows (dict): Mapping of table name to a list of row dictionaries
+    """
+    for table in BULK_TABLES:
+        if rows.get(table.name):
+            session.execute(insert(table), rows[table.name])
+
+
+def write_fake_users(
+    session,
+    user_ids,
+    first_ids,
+    num_logs_per_user,
+    meal_type_ids,
+    goal_type_ids,
+    chunk_size=BULK_CHUNK_SIZE,
+    rng=None,
+):
+    """Generate and insert a contiguous range of users, one transaction per chunk.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (range): Contiguous IDs of the users to generate
+        first_ids (dict): Id of the first row of each table, see get_next_ids
+        num_logs_per_user (int): Number of rows per log table for each user
+        meal_type_ids (list of int): Existing meal type IDs
+        goal_type_ids (list of int): Existing fitness goal type IDs
+        chunk_size (int): Approximate number of rows per table in one transaction
+        rng (numpy.random.Generator): Use the vectorized NumPy generator with
+            this source of randomness instead of Faker
+    """
+    if rng is not None:
+        # NumPy is only needed by the vectorized generator
+        from app.fake_batches import generate_fake_batch, insert_fake_batch
+
+    users_per_chunk = max(1, chunk_size // max(1, num_logs_per_user))
+    for chunk_start in range(user_ids.start, user_ids.stop, users_per_chunk):
+        chunk = range(chunk_start, min(chunk_start + users_per_chunk, user_ids.stop))
+        if rng is None:
+            rows = create_fake_rows(
+                chunk, first_ids, num_logs_per_user, meal_type_ids, goal_type_ids
+            )
+            insert_rows(session, rows)
+        else:
+            batch = generate_fake_batch(
+                rng,
+                chunk,
+                first_ids,
+                num_logs_per_user,
+                meal_type_ids,
+                goal_type_ids,
+                reference_time,
+            )
+            insert_fake_batch(session, batch)
+        session.commit()
+
+
+def bulk_populate_database(
+    session,
+    num_users=10,
+    num_logs_per_user=5,
+    chunk_size=BULK_CHUNK_SIZE,
+    vectorized=False,
+    seed=None,
+):
+    """Populate the database using chunked Core executemany inserts.
+
+    This is the fast alternative to populate_database: rows are built as plain
+    dictionaries with pre-assigned primary keys and written without the ORM
+    unit of work. Each chunk of users is inserted and committed in its own
+    transaction, so a failure only loses the chunk in progress.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        num_users (int): Number of users to create
+        num_logs_per_user (int): Number of rows per log table for each user
+        chunk_size (int): Approximate number of rows per table in one transaction
+        vectorized (bool): Generate whole columns with NumPy instead of Faker
+        seed (int): Seed of the NumPy generator when vectorized is set
+    """
+    populate_meal_types(session)
+    populate_fitness_goal_types(session)
+
+    meal_type_ids = list(session.execute(select(MealType.id)).scalars())
+    goal_type_ids = list(session.execute(select(FitnessGoalType.id)).scalars())
+    first_ids = get_next_ids(session)
+
+    rng = None
+    if vectorized:
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+
+    write_fake_users(
+        session,
+        range(first_ids["users"], first_ids["users"] + num_users),
+        first_ids,
+        num_logs_per_user,
+        meal_type_ids,
+        goal_type_ids,
+        chunk_size,
+        rng,
+    )
+
+    print(
+        f"Bulk loaded fake data for {num_users} users and their associated logs to the database."
+    )
@@ -7,12 +7,124 @@ from app.models.tables import (
     HealthMetrics,
     HeartRateLog,
     WaterIntakeLog,
-    UserFitnessGoal,
+    UserFitnessGoalTarget,
+    DailyUserStats,
+    WorkoutHeartRateSummary,
 )
-from sqlalchemy import func
+import json
+from dataclasses import dataclass
+from datetime import date
+from sqlalchemy import bindparam, case, func, null, select
+
+# The single-user queries below are built once at import time with named bound
+# parameters, instead of rebuilding a session.query() chain on every call, and
+# run through _execute. At dashboard rates the SQLAlchemy overhead of building
+# and caching a statement costs more than SQLite takes to run it.
+_user_id = bindparam("user_id")
+
+TOTAL_WORKOUT_DURATION = (
+    select(func.sum(WorkoutLog.duration))
+    .where(WorkoutLog.user_id == _user_id)
+    .where(WorkoutLog.date.between(bindparam("start_date"), bindparam("end_date")))
+)
+ROLLUP_TOTAL_WORKOUT_DURATION = (
+    select(func.sum(DailyUserStats.workout_minutes))
+    .where(DailyUserStats.user_id == _user_id)
+    .where(DailyUserStats.day.between(bindparam("start_date"), bindparam("end_date")))
+)
+AVG_DAILY_CALORIC_INTAKE = select(func.avg(NutritionLog.calories)).where(
+    NutritionLog.user_id == _user_id
+)
+ROLLUP_AVG_DAILY_CALORIC_INTAKE = select(
+    func.sum(DailyUserStats.calories)
+    * 1.0
+    / func.nullif(func.sum(DailyUserStats.meal_count), 0)
+).where(DailyUserStats.user_id == _user_id)
+AVG_SLEEP_DURATION = select(func.avg(SleepLog.duration) / 60).where(
+    SleepLog.user_id == _user_id
+)
+ROLLUP_AVG_SLEEP_DURATION = select(
+    func.sum(DailyUserStats.sleep_minutes)
+    / func.nullif(func.sum(DailyUserStats.sleep_count), 0)
+    / 60
+).where(DailyUserStats.user_id == _user_id)
+WEIGHT_RECORDS = (
+    select(WeightLog.date_recorded, WeightLog.weight)
+    .where(WeightLog.user_id == _user_id)
+    .order_by(WeightLog.date_recorded.asc())
+)
+DAILY_WATER_INTAKE = (
+    select(func.sum(WaterIntakeLog.water_intake))
+    .where(WaterIntakeLog.user_id == _user_id)
+    .where(WaterIntakeLog.date == bindparam("specific_date"))
+)
+ROLLUP_DAILY_WATER_INTAKE = (
+    select(DailyUserStats.water_intake)
+    .where(DailyUserStats.user_id == _user_id)
+    .where(DailyUserStats.day == bindparam("specific_date"))
+)
+RECENT_BLOOD_PRESSURE = (
+    select(HealthMetrics.date, HealthMetrics.blood_pressure)
+    .where(HealthMetrics.user_id == _user_id)
+    .order_by(HealthMetrics.date.desc())
+    .limit(bindparam("number_of_records"))
+)
+AVG_HEART_RATE_DURING_WORKOUTS = (
+    select(func.avg(HeartRateLog.heart_rate))
+    .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
+    .where(WorkoutLog.user_id == _user_id)
+)
+ROLLUP_AVG_HEART_RATE_DURING_WORKOUTS = select(
+    func.sum(DailyUserStats.workout_heart_rate_sum)
+    * 1.0
+    / func.nullif(func.sum(DailyUserStats.workout_heart_rate_count), 0)
+).where(DailyUserStats.user_id == _user_id)
+_WORKOUT_SUMMARY_AVG_HEART_RATE = (
+    func.sum(WorkoutHeartRateSummary.heart_rate_sum)
+    * 1.0
+    / func.nullif(func.sum(WorkoutHeartRateSummary.sample_count), 0)
+)
+SUMMARIES_AVG_HEART_RATE_DURING_WORKOUTS = select(
+    _WORKOUT_SUMMARY_AVG_HEART_RATE
+).where(WorkoutHeartRateSummary.user_id == _user_id)
+HEART_RATE_BY_EXERCISE_TYPE = (
+    select(
+        WorkoutHeartRateSummary.exercise_type,
+        func.count(),
+        _WORKOUT_SUMMARY_AVG_HEART_RATE,
+        func.max(WorkoutHeartRateSummary.max_heart_rate),
+        *[
+            func.sum(WorkoutHeartRateSummary.__table__.c[f"zone_{zone}_seconds"])
+            for zone in range(1, 6)
+        ],
+    )
+    .where(WorkoutHeartRateSummary.user_id == _user_id)
+    .group_by(WorkoutHeartRateSummary.exercise_type)
+    .order_by(WorkoutHeartRateSummary.exercise_type)
+)
+
+
+def _date(value):
+    # Prebuilt statements bind dates with the Date type, which unlike the
+    # literal comparisons they replaced doesn't accept ISO strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
 
+def _execute(session, statement, parameters):
+    """Run a prebuilt Core statement on the session's connection.
 
-def get_user_total_workout_duration(session, user_id, start_date, end_date):
+    This skips the ORM execution layer of session.execute, which these
+    column-only statements don't need. Pending changes are still flushed first
+    when the session autoflushes.
+    """
+    if session.autoflush:
+        session.flush()
+    return session.connection().execute(statement, parameters)
+
+
+def get_user_total_workout_duration(
+    session, user_id, start_date, end_date, use_rollup=False
+):
     """Get the total amount of time spent working out by a user between two dates
 
     Args:
@@ -20,58 +132,52 @@ def get_user_total_workout_duration(session, user_id, start_date, end_date):
         user_id (int): ID of the user
         start_date (date): Start date of the time period
         end_date (date): End date of the time period
+        use_rollup (bool): Read the daily_user_stats rollup instead of raw logs
 
     Returns:
         float: Total workout duration in minutes
     """
-    total_duration = (
-        session.query(func.sum(WorkoutLog.duration))
-        .filter(WorkoutLog.user_id == user_id)
-        .filter(WorkoutLog.date.between(start_date, end_date))
-        .scalar()
-    )
-    return total_duration
+    statement = ROLLUP_TOTAL_WORKOUT_DURATION if use_rollup else TOTAL_WORKOUT_DURATION
+    parameters = {
+        "user_id": user_id,
+        "start_date": _date(start_date),
+        "end_date": _date(end_date),
+    }
+    return _execute(session, statement, parameters).scalar()
 
 
-def get_user_avg_daily_caloric_intake(session, user_id):
+def get_user_avg_daily_caloric_intake(session, user_id, use_rollup=False):
     """Calculate the average daily caloric intake for a user.
 
     Args:
         session (db session): SQLAlchemy database session
         user_id (int): ID of the user
+        use_rollup (bool): Read the daily_user_stats rollup instead of raw logs,
+            which leaves out logs without a date
 
     Returns:
         float: Average daily caloric intake
     """
-    avg_calories = (
-        session.query(func.avg(NutritionLog.calories))
-        .filter(NutritionLog.user_id == user_id)
-        .scalar()
+    statement = (
+        ROLLUP_AVG_DAILY_CALORIC_INTAKE if use_rollup else AVG_DAILY_CALORIC_INTAKE
     )
-    return avg_calories
+    return _execute(session, statement, {"user_id": user_id}).scalar()
 
 
-def get_user_avg_sleep_duration(session, user_id):
+def get_user_avg_sleep_duration(session, user_id, use_rollup=False):
     """Calculate the average sleep duration for a user.
 
     Args:
         session (db session): SQLAlchemy database session
         user_id (int): ID of the user
+        use_rollup (bool): Read the daily_user_stats rollup instead of raw logs,
+            which leaves out logs without a date
 
     Returns:
         float: Average sleep duration in hours
     """
-    avg_sleep_duration = (
-        session.query(
-            func.avg(
-                func.julianday(SleepLog.end_time) - func.julianday(SleepLog.start_time)
-            )
-            * 24
-        )
-        .filter(SleepLog.user_id == user_id)
-        .scalar()
-    )
-    return avg_sleep_duration
+    statement = ROLLUP_AVG_SLEEP_DURATION if use_rollup else AVG_SLEEP_DURATION
+    return _execute(session, statement, {"user_id": user_id}).scalar()
 
 
 def get_user_weight_records(session, user_id):
@@ -84,13 +190,11 @@ def get_user_weight_records(session, user_id):
     Returns:
         list of tuples: List containing (date_recorded, weight)
     """
-    weight_records = (
-        session.query(WeightLog.date_recorded, WeightLog.weight)
-        .filter(WeightLog.user_id == user_id)
-        .order_by(WeightLog.date_recorded.asc())
-        .all()
-    )
-    return weight_records
+    return _execute(session, WEIGHT_RECORDS, {"user_id": user_id}).all()
+
+
+# Goal target metrics that describe a sleep goal
+SLEEP_GOAL_METRICS = ["sleep", "sleep_hours"]
 
 
 def get_users_not_meeting_sleep_goals(session, sleep_hours_goal):
@@ -103,41 +207,43 @@ def get_users_not_meeting_sleep_goals(session, sleep_hours_goal):
     Returns:
         list: List of usernames not meeting sleep goals
     """
+    users_with_sleep_goal = select(UserFitnessGoalTarget.user_id).where(
+        UserFitnessGoalTarget.metric.in_(SLEEP_GOAL_METRICS)
+    )
+    # Aggregate sleep per user first so goals don't multiply the sleep rows
+    avg_sleep = (
+        select(
+            SleepLog.user_id.label("user_id"),
+            func.avg(SleepLog.duration).label("avg_duration"),
+        )
+        .where(SleepLog.user_id.in_(users_with_sleep_goal))
+        .group_by(SleepLog.user_id)
+        .subquery()
+    )
     users_not_meeting_sleep_goal = (
         session.query(User.username)
-        .join(SleepLog)
-        .join(UserFitnessGoal)
-        .filter(UserFitnessGoal.target.contains("sleep"))
-        .group_by(User.id)
-        .having(
-            func.avg(
-                func.julianday(SleepLog.end_time) - func.julianday(SleepLog.start_time)
-            )
-            < sleep_hours_goal / 24
-        )
+        .join(avg_sleep, avg_sleep.c.user_id == User.id)
+        .filter(avg_sleep.c.avg_duration < sleep_hours_goal * 60)
         .all()
     )
     return [user.username for user in users_not_meeting_sleep_goal]
 
 
-def get_user_daily_water_intake(session, user_id, specific_date):
+def get_user_daily_water_intake(session, user_id, specific_date, use_rollup=False):
     """Calculate the total water intake for a user on a specific date.
 
     Args:
         session (db session): SQLAlchemy database session
         user_id (int): ID of the user
         specific_date (date): The specific date for which water intake is calculated
+        use_rollup (bool): Read the daily_user_stats rollup instead of raw logs
 
     Returns:
         int: Total water intake in milliliters
     """
-    total_water_intake = (
-        session.query(func.sum(WaterIntakeLog.water_intake))
-        .filter(WaterIntakeLog.user_id == user_id)
-        .filter(WaterIntakeLog.date == specific_date)
-        .scalar()
-    )
-    return total_water_intake or 0
+    statement = ROLLUP_DAILY_WATER_INTAKE if use_rollup else DAILY_WATER_INTAKE
+    parameters = {"user_id": user_id, "specific_date": _date(specific_date)}
+    return _execute(session, statement, parameters).scalar() or 0
 
 
 def get_user_recent_blood_pressure(session, user_id, number_of_records=5):
@@ -151,33 +257,397 @@ def get_user_recent_blood_pressure(session, user_id, number_of_records=5):
     Returns:
         list of tuples: List containing (date, blood_pressure)
     """
-    recent_bp_readings = (
-        session.query(HealthMetrics.date, HealthMetrics.blood_pressure)
-        .filter(HealthMetrics.user_id == user_id)
-        .order_by(HealthMetrics.date.desc())
-        .limit(number_of_records)
-        .all()
-    )
-    return recent_bp_readings
+    parameters = {"user_id": user_id, "number_of_records": number_of_records}
+    return _execute(session, RECENT_BLOOD_PRESSURE, parameters).all()
 
 
-def get_user_avg_heart_rate_during_workouts(session, user_id):
+def get_user_avg_heart_rate_during_workouts(
+    session, user_id, use_rollup=False, use_workout_summaries=False
+):
     """Calculate the average heart rate during workouts for a user.
 
     Args:
         session (db session): SQLAlchemy database session
         user_id (int): ID of the user
+        use_rollup (bool): Read the daily_user_stats rollup instead of raw logs,
+            which leaves out logs without a date
+        use_workout_summaries (bool): Read the workout_heart_rate_summaries
+            instead of raw logs
 
     Returns:
         float: Average heart rate during workouts
     """
-    avg_heart_rate = (
-        session.query(func.avg(HeartRateLog.heart_rate))
-        .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
-        .filter(WorkoutLog.user_id == user_id)
-        .scalar()
+    if use_workout_summaries:
+        statement = SUMMARIES_AVG_HEART_RATE_DURING_WORKOUTS
+    elif use_rollup:
+        statement = ROLLUP_AVG_HEART_RATE_DURING_WORKOUTS
+    else:
+        statement = AVG_HEART_RATE_DURING_WORKOUTS
+    return _execute(session, statement, {"user_id": user_id}).scalar() or 0
+
+
+@dataclass(frozen=True)
+class ExerciseHeartRate:
+    """Heart rate of a user's workouts of one exercise type."""
+
+    exercise_type: str
+    workouts: int
+    avg_heart_rate: float
+    max_heart_rate: int
+    zone_seconds: tuple  # seconds in heart rate zones 1 to 5
+
+
+def get_user_heart_rate_by_exercise_type(session, user_id):
+    """Compare a user's heart rate across exercise types.
+
+    Only workouts with heart rate samples count. The values come from
+    workout_heart_rate_summaries, without reading the raw samples.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+
+    Returns:
+        list of ExerciseHeartRate: One per exercise type, by exercise type
+    """
+    rows = _execute(session, HEART_RATE_BY_EXERCISE_TYPE, {"user_id": user_id})
+    return [
+        ExerciseHeartRate(
+            exercise_type, workouts, avg_heart_rate, max_heart_rate, tuple(zones)
+        )
+        for exercise_type, workouts, avg_heart_rate, max_heart_rate, *zones in rows
+    ]
+
+
+@dataclass(frozen=True)
+class UserSummary:
+    """Dashboard metrics of one user, as returned by get_user_summary."""
+
+    user_id: int
+    total_workout_duration: float
+    avg_daily_caloric_intake: float
+    avg_sleep_duration: float
+    weight_records: list
+    daily_water_intake: int
+    recent_blood_pressure: list
+    avg_heart_rate_during_workouts: float
+
+
+_SUMMARY_WEIGHT_RECORDS = (
+    select(WeightLog.date_recorded, WeightLog.weight)
+    .where(WeightLog.user_id == _user_id)
+    .order_by(WeightLog.date_recorded.asc())
+    .subquery()
+)
+_SUMMARY_RECENT_BP_READINGS = (
+    select(HealthMetrics.date, HealthMetrics.blood_pressure)
+    .where(HealthMetrics.user_id == _user_id)
+    .order_by(HealthMetrics.date.desc())
+    .limit(bindparam("number_of_records"))
+    .subquery()
+)
+USER_SUMMARY = select(
+    select(func.sum(WorkoutLog.duration))
+    .where(WorkoutLog.user_id == _user_id)
+    .where(WorkoutLog.date.between(bindparam("start_date"), bindparam("end_date")))
+    .scalar_subquery(),
+    select(func.avg(NutritionLog.calories))
+    .where(NutritionLog.user_id == _user_id)
+    .scalar_subquery(),
+    select(func.avg(SleepLog.duration) / 60)
+    .where(SleepLog.user_id == _user_id)
+    .scalar_subquery(),
+    select(
+        func.json_group_array(
+            # json_array would round REAL values to 15 significant digits, and
+            # printf turns NULL into '0'
+            func.json_array(
+                _SUMMARY_WEIGHT_RECORDS.c.date_recorded,
+                case(
+                    (_SUMMARY_WEIGHT_RECORDS.c.weight.is_(None), null()),
+                    else_=func.printf("%!.17g", _SUMMARY_WEIGHT_RECORDS.c.weight),
+                ),
+            )
+        )
+    ).scalar_subquery(),
+    select(func.sum(WaterIntakeLog.water_intake))
+    .where(WaterIntakeLog.user_id == _user_id)
+    .where(WaterIntakeLog.date == bindparam("specific_date"))
+    .scalar_subquery(),
+    select(
+        func.json_group_array(
+            func.json_array(
+                _SUMMARY_RECENT_BP_READINGS.c.date,
+                _SUMMARY_RECENT_BP_READINGS.c.blood_pressure,
+            )
+        )
+    ).scalar_subquery(),
+    select(func.avg(HeartRateLog.heart_rate))
+    .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
+    .where(WorkoutLog.user_id == _user_id)
+    .scalar_subquery(),
+)
+
+
+def get_user_summary(
+    session, user_id, start_date, end_date, specific_date, number_of_records=5
+):
+    """Compute all of a user's dashboard metrics in a single SQL statement.
+
+    Every metric is a scalar subquery of one SELECT; the weight records and
+    blood pressure readings are folded into JSON arrays so they fit in a
+    single result row.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_id (int): ID of the user
+        start_date (date): Start date of the workout duration period
+        end_date (date): End date of the workout duration period
+        specific_date (date): The date for which water intake is calculated
+        number_of_records (int): Number of recent blood pressure readings
+
+    Returns:
+        UserSummary: The same values as the individual get_user_* queries
+    """
+    (
+        total_duration,
+        avg_calories,
+        avg_sleep_duration,
+        weight_json,
+        total_water_intake,
+        bp_json,
+        avg_heart_rate,
+    ) = _execute(
+        session,
+        USER_SUMMARY,
+        {
+            "user_id": user_id,
+            "start_date": _date(start_date),
+            "end_date": _date(end_date),
+            "specific_date": _date(specific_date),
+            "number_of_records": number_of_records,
+        },
+    ).one()
+
+    return UserSummary(
+        user_id=user_id,
+        total_workout_duration=total_duration,
+        avg_daily_caloric_intake=avg_calories,
+        avg_sleep_duration=avg_sleep_duration,
+        weight_records=[
+            (_date(date_recorded), None if weight is None else float(weight))
+            for date_recorded, weight in json.loads(weight_json)
+        ],
+        daily_water_intake=total_water_intake or 0,
+        recent_blood_pressure=[
+            (_date(day), blood_pressure) for day, blood_pressure in json.loads(bp_json)
+        ],
+        avg_heart_rate_during_workouts=avg_heart_rate or 0,
+    )
+
+
+# Stay below SQLITE_MAX_VARIABLE_NUMBER, which defaults to 999 before SQLite 3.32
+MAX_BOUND_PARAMETERS = 900
+
+
+def _user_id_chunks(user_ids):
+    """Split user IDs into chunks that fit in one statement; None means all users."""
+    if user_ids is None:
+        yield None
+        return
+    user_ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(user_ids), MAX_BOUND_PARAMETERS):
+        yield user_ids[start : start + MAX_BOUND_PARAMETERS]
+
+
+def _filter_user_ids(query, column, user_ids):
+    return query if user_ids is None else query.filter(column.in_(user_ids))
+
+
+def _grouped_scalars(session, column, user_id_column, user_ids, default, *criteria):
+    """Run one GROUP BY user_id statement per chunk of user IDs.
+
+    Requested users without any rows are mapped to default.
+    """
+    results = {} if user_ids is None else dict.fromkeys(user_ids, default)
+    for chunk in _user_id_chunks(user_ids):
+        query = session.query(user_id_column, column).filter(*criteria)
+        query = _filter_user_ids(query, user_id_column, chunk)
+        for user_id, value in query.group_by(user_id_column):
+            results[user_id] = default if value is None else value
+    return results
+
+
+def get_users_total_workout_duration(session, user_ids, start_date, end_date):
+    """Get the total workout duration of many users between two dates
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+        start_date (date): Start date of the time period
+        end_date (date): End date of the time period
+
+    Returns:
+        dict: Mapping of user ID to total workout duration in minutes
+    """
+    return _grouped_scalars(
+        session,
+        func.sum(WorkoutLog.duration),
+        WorkoutLog.user_id,
+        user_ids,
+        None,
+        WorkoutLog.date.between(start_date, end_date),
+    )
+
+
+def get_users_avg_daily_caloric_intake(session, user_ids):
+    """Calculate the average daily caloric intake of many users.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+
+    Returns:
+        dict: Mapping of user ID to average daily caloric intake
+    """
+    return _grouped_scalars(
+        session, func.avg(NutritionLog.calories), NutritionLog.user_id, user_ids, None
     )
-    return avg_heart_rate or 0
+
+
+def get_users_avg_sleep_duration(session, user_ids):
+    """Calculate the average sleep duration of many users.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+
+    Returns:
+        dict: Mapping of user ID to average sleep duration in hours
+    """
+    return _grouped_scalars(
+        session,
+        func.avg(SleepLog.duration) / 60,
+        SleepLog.user_id,
+        user_ids,
+        None,
+    )
+
+
+def get_users_weight_records(session, user_ids):
+    """Retrieve the weight records over time of many users.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+
+    Returns:
+        dict: Mapping of user ID to a list of (date_recorded, weight)
+    """
+    results = {} if user_ids is None else {user_id: [] for user_id in user_ids}
+    for chunk in _user_id_chunks(user_ids):
+        query = session.query(
+            WeightLog.user_id, WeightLog.date_recorded, WeightLog.weight
+        )
+        query = _filter_user_ids(query, WeightLog.user_id, chunk)
+        for user_id, date_recorded, weight in query.order_by(
+            WeightLog.user_id, WeightLog.date_recorded.asc()
+        ):
+            results.setdefault(user_id, []).append((date_recorded, weight))
+    return results
+
+
+def get_users_daily_water_intake(session, user_ids, specific_date):
+    """Calculate the total water intake of many users on a specific date.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+        specific_date (date): The specific date for which water intake is calculated
+
+    Returns:
+        dict: Mapping of user ID to total water intake in milliliters
+    """
+    return _grouped_scalars(
+        session,
+        func.sum(WaterIntakeLog.water_intake),
+        WaterIntakeLog.user_id,
+        user_ids,
+        0,
+        WaterIntakeLog.date == specific_date,
+    )
+
+
+def get_users_recent_blood_pressure(session, user_ids, number_of_records=5):
+    """Retrieve the most recent blood pressure readings of many users.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+        number_of_records (int): Number of recent records to retrieve per user
+
+    Returns:
+        dict: Mapping of user ID to a list of (date, blood_pressure)
+    """
+    results = {} if user_ids is None else {user_id: [] for user_id in user_ids}
+    for chunk in _user_id_chunks(user_ids):
+        ranked = session.query(
+            HealthMetrics.user_id,
+            HealthMetrics.date,
+            HealthMetrics.blood_pressure,
+            func.row_number()
+            .over(
+                partition_by=HealthMetrics.user_id,
+                order_by=HealthMetrics.date.desc(),
+            )
+            .label("position"),
+        )
+        ranked = _filter_user_ids(ranked, HealthMetrics.user_id, chunk).subquery()
+        query = session.query(
+            ranked.c.user_id,
+            ranked.c.position,
+            ranked.c.date,
+            ranked.c.blood_pressure,
+        ).filter(ranked.c.position <= number_of_records)
+        # Sorting the few rows per user here keeps SQLite from building a temp B-tree
+        for user_id, position, day, blood_pressure in sorted(query):
+            results.setdefault(user_id, []).append((day, blood_pressure))
+    return results
+
+
+def get_users_avg_heart_rate_during_workouts(
+    session, user_ids, use_workout_summaries=False
+):
+    """Calculate the average heart rate during workouts of many users.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): IDs of the users, or None for all users
+        use_workout_summaries (bool): Read the workout_heart_rate_summaries
+            instead of raw logs
+
+    Returns:
+        dict: Mapping of user ID to average heart rate during workouts
+    """
+    if use_workout_summaries:
+        return _grouped_scalars(
+            session,
+            _WORKOUT_SUMMARY_AVG_HEART_RATE,
+            WorkoutHeartRateSummary.user_id,
+            user_ids,
+            0,
+        )
+    results = {} if user_ids is None else dict.fromkeys(user_ids, 0)
+    for chunk in _user_id_chunks(user_ids):
+        query = (
+            session.query(WorkoutLog.user_id, func.avg(HeartRateLog.heart_rate))
+            .select_from(HeartRateLog)
+            .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
+        )
+        query = _filter_user_ids(query, WorkoutLog.user_id, chunk)
+        for user_id, avg_heart_rate in query.group_by(WorkoutLog.user_id):
+            results[user_id] = avg_heart_rate or 0
+    return results
 
 
 def run_queries(session):
@@ -207,3 +677,11 @@ def run_queries(session):
         "Average heart rate during workouts for user 1:",
         get_user_avg_heart_rate_during_workouts(session, 1),
     )
+    print(
+        "Heart rate by exercise type for user 1:",
+        get_user_heart_rate_by_exercise_type(session, 1),
+    )
+    print(
+        "Dashboard summary for user 1:",
+        get_user_summary(session, 1, "2020-01-01", "2020-12-31", "2020-01-01"),
+    )
@@ -0,0 +1,116 @@
+# retry.py
+import logging
+import random
+import threading
+import time
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# SQLITE_BUSY and SQLITE_LOCKED as the sqlite3 driver reports them
+LOCK_ERROR_MESSAGES = ("database is locked", "database table is locked")
+
+
+def is_lock_error(error):
+    """Whether error means another connection held a lock SQLite needed.
+
+    Besides the busy_timeout running out, this happens at once, without
+    waiting, when a WAL transaction that read first tries to write after
+    another connection committed. Retrying the whole transaction is the only
+    way out of that.
+    """
+    if isinstance(error, OperationalError):
+        error = error.orig
+    return any(message in str(error) for message in LOCK_ERROR_MESSAGES)
+
+
+class RetryPolicy:
+    """Re-run transactions that failed on a SQLite lock, with backoff.
+
+    The n-th retry waits a random time up to min(max_delay, base_delay * 2**n),
+    full jitter, so writers that collided don't collide again in lockstep.
+
+    Args:
+        attempts (int): Runs of the transaction at most, retries included
+        base_delay (float): Upper bound of the first wait in seconds
+        max_delay (float): Upper bound of any wait in seconds
+        sleep (callable): Waits the given seconds, for tests
+    """
+
+    def __init__(self, attempts=8, base_delay=0.005, max_delay=0.5, sleep=time.sleep):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def delay(self, retry):
+        """Seconds to wait before the given retry, counted from 0."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+    def call(self, function, *args, **kwargs):
+        """Call function, calling it again while it fails on a lock.
+
+        function must run a whole transaction, and roll it back when it
+        raises, so every attempt starts from scratch.
+
+        Returns:
+            The result of function
+
+        Raises:
+            OperationalError: The last lock error, once attempts are used up
+        """
+        with self._lock:
+            self.calls += 1
+        for attempt in range(self.attempts):
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if not is_lock_error(error):
+                    raise
+                if attempt == self.attempts - 1:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                logger.debug("Retrying %s after: %s", function, error)
+                self.sleep(self.delay(attempt))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+            }
+
+
+# Used by the write paths unless they are given another policy
+default_retry_policy = RetryPolicy()
+
+
+def run_in_transaction(session_factory, function, *args, policy=None, **kwargs):
+    """Run function(session, *args) in a transaction of a new session, retrying on locks.
+
+    The transaction is committed when function returns and rolled back when it
+    raises; every attempt gets a fresh session.
+
+    Args:
+        session_factory (sessionmaker): Creates the session of every attempt
+        function (callable): Does the transaction's work with the session
+        policy (RetryPolicy): Defaults to default_retry_policy
+
+    Returns:
+        The result of function
+    """
+
+    def attempt():
+        with session_factory() as session:
+            with session.begin():
+                return function(session, *args, **kwargs)
+
+    return (policy or default_retry_policy).call(attempt)
@@ -0,0 +1,368 @@
+# rollups.py
+import argparse
+import weakref
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import delete, event, func, inspect, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+from app.models.tables import (
+    DailyUserStats,
+    HeartRateLog,
+    NutritionLog,
+    SleepLog,
+    WaterIntakeLog,
+    WorkoutLog,
+    sleep_duration_minutes,
+)
+
+STAT_COLUMNS = [
+    "workout_minutes",
+    "calories",
+    "meal_count",
+    "water_intake",
+    "sleep_minutes",
+    "sleep_count",
+    "heart_rate_sum",
+    "heart_rate_count",
+    "workout_heart_rate_sum",
+    "workout_heart_rate_count",
+]
+
+
+def _day(value):
+    return value.date() if hasattr(value, "date") else value
+
+
+def _workout_stats(values):
+    return _day(values["date"]), {"workout_minutes": values["duration"] or 0}
+
+
+def _nutrition_stats(values):
+    return _day(values["date"]), {"calories": values["calories"] or 0, "meal_count": 1}
+
+
+def _water_intake_stats(values):
+    return _day(values["date"]), {"water_intake": values["water_intake"] or 0}
+
+
+def _sleep_stats(values):
+    start_time, end_time = values["start_time"], values["end_time"]
+    if start_time is None or end_time is None:
+        return None, {}
+    minutes = sleep_duration_minutes(start_time, end_time)
+    return _day(start_time), {"sleep_minutes": minutes, "sleep_count": 1}
+
+
+def _heart_rate_stats(values):
+    if values["time_recorded"] is None or values["heart_rate"] is None:
+        return None, {}
+    stats = {"heart_rate_sum": values["heart_rate"], "heart_rate_count": 1}
+    return _day(values["time_recorded"]), stats
+
+
+# Log model -> (columns read, function returning (day, stat deltas) for one row).
+# Rows without a user or a day are left out of the rollup. The workout heart
+# rate stats belong to the user of the workout, see _add_workout_heart_rates.
+ROLLUP_SOURCES = {
+    WorkoutLog: (["user_id", "date", "duration"], _workout_stats),
+    NutritionLog: (["user_id", "date", "calories"], _nutrition_stats),
+    WaterIntakeLog: (["user_id", "date", "water_intake"], _water_intake_stats),
+    SleepLog: (["user_id", "start_time", "end_time"], _sleep_stats),
+    HeartRateLog: (["user_id", "time_recorded", "heart_rate"], _heart_rate_stats),
+}
+# Samples or workouts looked up in one IN (...) query
+_ID_LOOKUP_CHUNK_SIZE = 500
+_WORKOUT_OF_SAMPLE = HeartRateLog.workout_log_id == WorkoutLog.id
+_HAS_WORKOUT_HEART_RATE = (
+    HeartRateLog.time_recorded.isnot(None),
+    HeartRateLog.heart_rate.isnot(None),
+)
+
+
+def _current_values(obj, columns):
+    return {column: getattr(obj, column) for column in columns}
+
+
+def _stored_values(connection, model, objects):
+    """Read the rows of objects as they are in the database, before the flush.
+
+    Attribute history can't be used here: attributes expired by a commit and
+    then assigned never loaded their old value.
+    """
+    columns, _ = ROLLUP_SOURCES[model]
+    ids = [inspect(obj).identity[0] for obj in objects]
+    rows = connection.execute(
+        select(*[model.__table__.c[column] for column in columns]).where(
+            model.__table__.c.id.in_(ids)
+        )
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def _add_contribution(deltas, model, values, sign):
+    _, stats = ROLLUP_SOURCES[model]
+    if values["user_id"] is None:
+        return
+    day, contribution = stats(values)
+    if day is None:
+        return
+    row = deltas[(values["user_id"], day)]
+    for column, value in contribution.items():
+        row[column] += sign * value
+
+
+def _add_workout_heart_rates(connection, deltas, sample_ids, workout_ids, sign):
+    """Add the workout heart rate stats of samples as they are in the database.
+
+    Like the raw query, a sample counts for the user of its workout, so besides
+    the samples themselves every sample of the given workouts is read: changing
+    or deleting a workout moves its samples' stats.
+
+    Args:
+        connection (Connection): Connection in the flushing transaction
+        deltas (dict): Mapping of (user_id, day) to a dict of stat deltas
+        sample_ids (set of int): Changed heart_rate_logs ids
+        workout_ids (set of int): Changed workout_logs ids
+        sign (int): 1 to add the stats, -1 to take them out
+    """
+    sample_ids = set(sample_ids)
+    workout_ids = list(workout_ids)
+    for start in range(0, len(workout_ids), _ID_LOOKUP_CHUNK_SIZE):
+        chunk = workout_ids[start : start + _ID_LOOKUP_CHUNK_SIZE]
+        sample_ids.update(
+            connection.scalars(
+                select(HeartRateLog.id).where(HeartRateLog.workout_log_id.in_(chunk))
+            )
+        )
+
+    sample_ids = list(sample_ids)
+    for start in range(0, len(sample_ids), _ID_LOOKUP_CHUNK_SIZE):
+        chunk = sample_ids[start : start + _ID_LOOKUP_CHUNK_SIZE]
+        rows = connection.execute(
+            select(
+                WorkoutLog.user_id,
+                func.date(HeartRateLog.time_recorded),
+                func.sum(HeartRateLog.heart_rate),
+                func.count(),
+            )
+            .join_from(HeartRateLog, WorkoutLog, _WORKOUT_OF_SAMPLE)
+            .where(HeartRateLog.id.in_(chunk), *_HAS_WORKOUT_HEART_RATE)
+            .group_by(WorkoutLog.user_id, func.date(HeartRateLog.time_recorded))
+        )
+        for user_id, day, total, count in rows:
+            row = deltas[(user_id, date.fromisoformat(day))]
+            row["workout_heart_rate_sum"] += sign * total
+            row["workout_heart_rate_count"] += sign * count
+
+
+def _changed_ids(objects, model):
+    return {obj.id for obj in objects if type(obj) is model}
+
+
+def _new_deltas():
+    return defaultdict(lambda: dict.fromkeys(STAT_COLUMNS, 0))
+
+
+def _before_flush(session, flush_context, instances):
+    # Take the old contribution of changed and deleted rows out while the
+    # database still holds it. Starting from scratch drops the leftovers of a
+    # flush that failed.
+    deltas = session.info["daily_user_stats_deltas"] = _new_deltas()
+    changed = session.info["daily_user_stats_changed"] = []
+    stored = defaultdict(list)
+    for obj in session.deleted:
+        if type(obj) in ROLLUP_SOURCES:
+            stored[type(obj)].append(obj)
+    for obj in session.dirty:
+        if type(obj) in ROLLUP_SOURCES and session.is_modified(obj):
+            stored[type(obj)].append(obj)
+            changed.append(obj)
+
+    connection = session.connection()
+    for model, objects in stored.items():
+        for values in _stored_values(connection, model, objects):
+            _add_contribution(deltas, model, values, -1)
+    _add_workout_heart_rates(
+        connection,
+        deltas,
+        _changed_ids(stored[HeartRateLog], HeartRateLog),
+        _changed_ids(stored[WorkoutLog], WorkoutLog),
+        -1,
+    )
+
+
+def _after_flush(session, flush_context):
+    deltas = session.info.pop("daily_user_stats_deltas", None) or _new_deltas()
+    changed = session.info.pop("daily_user_stats_changed", None) or []
+    written = list(session.new) + changed
+    for obj in written:
+        if type(obj) in ROLLUP_SOURCES:
+            columns, _ = ROLLUP_SOURCES[type(obj)]
+            _add_contribution(deltas, type(obj), _current_values(obj, columns), 1)
+
+    connection = session.connection()
+    _add_workout_heart_rates(
+        connection,
+        deltas,
+        _changed_ids(written, HeartRateLog),
+        _changed_ids(written, WorkoutLog),
+        1,
+    )
+    apply_deltas(connection, deltas)
+
+
+def apply_deltas(connection, deltas):
+    """Add per (user_id, day) stat deltas to the rollup with one upsert.
+
+    Args:
+        connection (Connection): Connection in the transaction that wrote the logs
+        deltas (dict): Mapping of (user_id, day) to a dict of stat deltas
+    """
+    rows = [
+        {"user_id": user_id, "day": day, **stats}
+        for (user_id, day), stats in deltas.items()
+        if any(stats.values())
+    ]
+    if not rows:
+        return
+    table = DailyUserStats.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day],
+        set_={
+            column: table.c[column] + statement.excluded[column]
+            for column in STAT_COLUMNS
+        },
+    )
+    connection.execute(statement, rows)
+
+
+_hooked_session_factories = weakref.WeakSet()
+
+
+def install_rollup_hooks(session_factory):
+    """Keep daily_user_stats up to date on every flush of sessions from the factory.
+
+    Only writes that go through the ORM unit of work are seen; rebuild the
+    rollup after Core bulk loads.
+
+    Args:
+        session_factory (sessionmaker or Session class): Sessions to watch
+    """
+    # Not event.contains: it can match a collected factory that had the same id
+    if session_factory not in _hooked_session_factories:
+        event.listen(session_factory, "before_flush", _before_flush)
+        event.listen(session_factory, "after_flush", _after_flush)
+        _hooked_session_factories.add(session_factory)
+
+
+def _source_rows(user_ids=None):
+    """One SELECT per log table producing (user_id, day, *STAT_COLUMNS) rows."""
+
+    def row(user_id, day, **stats):
+        return [user_id.label("user_id"), day.label("day")] + [
+            stats.get(column, literal(0)).label(column) for column in STAT_COLUMNS
+        ]
+
+    def rows(model, *columns, **stats):
+        statement = select(*row(model.user_id, *columns, **stats))
+        if user_ids is not None:
+            statement = statement.where(model.user_id.in_(user_ids))
+        return statement
+
+    workout_heart_rates = rows(
+        WorkoutLog,
+        func.date(HeartRateLog.time_recorded),
+        workout_heart_rate_sum=HeartRateLog.heart_rate,
+        workout_heart_rate_count=literal(1),
+    )
+    return union_all(
+        rows(
+            WorkoutLog,
+            WorkoutLog.date,
+            workout_minutes=func.coalesce(WorkoutLog.duration, 0),
+        ),
+        rows(
+            NutritionLog,
+            NutritionLog.date,
+            calories=func.coalesce(NutritionLog.calories, 0),
+            meal_count=literal(1),
+        ),
+        rows(
+            WaterIntakeLog,
+            WaterIntakeLog.date,
+            water_intake=func.coalesce(WaterIntakeLog.water_intake, 0),
+        ),
+        rows(
+            SleepLog,
+            func.date(SleepLog.start_time),
+            sleep_minutes=SleepLog.duration,
+            sleep_count=literal(1),
+        ).where(SleepLog.duration.isnot(None)),
+        rows(
+            HeartRateLog,
+            func.date(HeartRateLog.time_recorded),
+            heart_rate_sum=HeartRateLog.heart_rate,
+            heart_rate_count=literal(1),
+        ).where(
+            HeartRateLog.time_recorded.isnot(None), HeartRateLog.heart_rate.isnot(None)
+        ),
+        workout_heart_rates.join_from(
+            HeartRateLog, WorkoutLog, _WORKOUT_OF_SAMPLE
+        ).where(*_HAS_WORKOUT_HEART_RATE),
+    ).subquery()
+
+
+def rebuild_daily_user_stats(session, user_ids=None):
+    """Recompute daily_user_stats from the raw log tables.
+
+    Used to backfill an existing database, or after bulk loads that bypass the
+    ORM flush hooks.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): Only rebuild these users, defaults to all users
+    """
+    table = DailyUserStats.__table__
+    source = _source_rows(user_ids)
+    aggregated = (
+        select(
+            source.c.user_id,
+            source.c.day,
+            *[func.sum(source.c[column]) for column in STAT_COLUMNS],
+        )
+        .where(source.c.user_id.isnot(None), source.c.day.isnot(None))
+        .group_by(source.c.user_id, source.c.day)
+    )
+    clear = delete(table)
+    if user_ids is not None:
+        clear = clear.where(table.c.user_id.in_(user_ids))
+
+    session.execute(clear)
+    session.execute(
+        table.insert().from_select(["user_id", "day"] + STAT_COLUMNS, aggregated)
+    )
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the daily_user_stats rollup from the raw log tables."
+    )
+    parser.add_argument(
+        "--user-id", type=int, action="append", help="only rebuild this user"
+    )
+    args = parser.parse_args()
+
+    from app import get_session
+
+    session = get_session()
+    try:
+        rebuild_daily_user_stats(session, args.user_id)
+    finally:
+        session.close()
+    print("Rebuilt daily user stats.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# workout_summaries.py
+import argparse
+from sqlalchemy import and_, case, delete, func, select
+from app.models.tables import (
+    HeartRateLog,
+    User,
+    WorkoutHeartRateSummary,
+    WorkoutLog,
+)
+
+# Lower bounds of zones 1 to 5 as a share of the maximum heart rate; zone 5 has
+# no upper bound and samples below zone 1 aren't in any zone
+HEART_RATE_ZONES = (0.5, 0.6, 0.7, 0.8, 0.9)
+# Age used for the maximum heart rate of users without one
+DEFAULT_AGE = 35
+# A sample counts for the time until the next one of its workout, at most this
+MAX_SAMPLE_GAP_SECONDS = 60
+# Workouts summarized per statement
+_WORKOUT_CHUNK_SIZE = 500
+
+ZONE_COLUMNS = [f"zone_{zone}_seconds" for zone in range(1, 6)]
+SUMMARY_COLUMNS = [
+    "workout_log_id",
+    "user_id",
+    "exercise_type",
+    "sample_count",
+    "heart_rate_sum",
+    "min_heart_rate",
+    "max_heart_rate",
+] + ZONE_COLUMNS
+
+
+def max_heart_rate(age):
+    """Estimated maximum heart rate in bpm, 220 minus the age."""
+    return 220 - (DEFAULT_AGE if age is None else age)
+
+
+def _summary_rows(*criteria):
+    """SELECT producing the SUMMARY_COLUMNS of the workouts matching criteria."""
+    heart_rate = HeartRateLog.heart_rate
+    next_time = func.lead(HeartRateLog.time_recorded).over(
+        partition_by=HeartRateLog.workout_log_id, order_by=HeartRateLog.time_recorded
+    )
+    # To the millisecond, julianday() differences carry rounding noise below it
+    gap = func.round(
+        (func.julianday(next_time) - func.julianday(HeartRateLog.time_recorded))
+        * 86400,
+        3,
+    )
+    samples = (
+        select(
+            HeartRateLog.workout_log_id,
+            heart_rate,
+            # min() of two values is NULL for the last sample, which counts 0 s
+            func.coalesce(func.min(gap, MAX_SAMPLE_GAP_SECONDS), 0).label("seconds"),
+            (220 - func.coalesce(User.age, DEFAULT_AGE)).label("max_heart_rate"),
+        )
+        .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
+        .join(User, WorkoutLog.user_id == User.id, isouter=True)
+        .where(heart_rate.isnot(None), *criteria)
+        .subquery()
+    )
+
+    bounds = [samples.c.max_heart_rate * share for share in HEART_RATE_ZONES]
+    zones = []
+    for index, lower in enumerate(bounds):
+        in_zone = samples.c.heart_rate >= lower
+        if index + 1 < len(bounds):
+            in_zone = and_(in_zone, samples.c.heart_rate < bounds[index + 1])
+        zones.append(func.sum(case((in_zone, samples.c.seconds), else_=0)))
+
+    return (
+        select(
+            WorkoutLog.id,
+            WorkoutLog.user_id,
+            WorkoutLog.exercise_type,
+            func.count(),
+            func.sum(samples.c.heart_rate),
+            func.min(samples.c.heart_rate),
+            func.max(samples.c.heart_rate),
+            *zones,
+        )
+        .join(samples, samples.c.workout_log_id == WorkoutLog.id)
+        .where(WorkoutLog.user_id.isnot(None))
+        .group_by(WorkoutLog.id)
+    )
+
+
+def update_workout_summaries(connection, workout_ids):
+    """Recompute the heart rate summaries of some workouts from their samples.
+
+    Zones depend on the order of the samples, so a summary is computed again
+    from all of its workout's samples instead of being adjusted.
+
+    Args:
+        connection (Connection): Connection in the transaction that wrote the
+            samples
+        workout_ids (iterable of int): IDs of the workouts
+
+    Returns:
+        int: Number of summaries written, workouts without samples have none
+    """
+    table = WorkoutHeartRateSummary.__table__
+    workout_ids = sorted(set(workout_ids))
+    written = 0
+    for start in range(0, len(workout_ids), _WORKOUT_CHUNK_SIZE):
+        chunk = workout_ids[start : start + _WORKOUT_CHUNK_SIZE]
+        connection.execute(delete(table).where(table.c.workout_log_id.in_(chunk)))
+        written += connection.execute(
+            table.insert().from_select(
+                SUMMARY_COLUMNS,
+                _summary_rows(HeartRateLog.workout_log_id.in_(chunk)),
+            )
+        ).rowcount
+    return written
+
+
+def close_workouts(session, workout_ids):
+    """Summarize workouts whose samples are complete and commit.
+
+    Call it when a workout ends, after its samples were written through the
+    ORM. The ingest path keeps the summaries of the workouts it writes to.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        workout_ids (iterable of int): IDs of the workouts
+
+    Returns:
+        int: Number of summaries written
+    """
+    session.flush()
+    written = update_workout_summaries(session.connection(), workout_ids)
+    session.commit()
+    return written
+
+
+def rebuild_workout_summaries(session, user_ids=None):
+    """Recompute workout_heart_rate_summaries from the raw heart rate samples.
+
+    Used to backfill an existing database, after bulk loads, or after samples
+    or workouts were edited.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        user_ids (list of int): Only rebuild these users, defaults to all users
+    """
+    table = WorkoutHeartRateSummary.__table__
+    clear = delete(table)
+    criteria = []
+    if user_ids is not None:
+        clear = clear.where(table.c.user_id.in_(user_ids))
+        criteria.append(WorkoutLog.user_id.in_(user_ids))
+
+    session.execute(clear)
+    session.execute(
+        table.insert().from_select(SUMMARY_COLUMNS, _summary_rows(*criteria))
+    )
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the workout heart rate summaries from the raw samples."
+    )
+    parser.add_argument(
+        "--user-id", type=int, action="append", help="only rebuild this user"
+    )
+    args = parser.parse_args()
+
+    from app import get_session
+
+    session = get_session()
+    try:
+        rebuild_workout_summaries(session, args.user_id)
+    finally:
+        session.close()
+    print("Rebuilt workout heart rate summaries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# write_buffer.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy import inspect
+from app.retry import default_retry_policy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_ROWS = 1000
+DEFAULT_MAX_DELAY_MS = 10
+DEFAULT_MAX_QUEUE_ROWS = 10000
+
+_STOP = object()
+
+
+class WriteBuffer:
+    """Coalesce log inserts from many threads into group commits.
+
+    Threads hand new ORM objects (WorkoutLog, NutritionLog, WaterIntakeLog, ...)
+    to add() and get a Future back. A single writer thread collects them and
+    commits every max_batch_rows objects, or max_delay_ms after the first
+    object of a batch arrived, in one transaction of its own session. The
+    future resolves to the object's primary key once that transaction is
+    committed, so one commit, and one fsync, covers the whole batch. How
+    durable a commit is depends on the synchronous pragma, see app.engine.
+
+    Sessions come from session_factory, so the rollup and cache hooks
+    installed on it see every batch. A batch that loses a lock race is retried
+    by retry_policy. A batch that fails otherwise is retried one object at a
+    time, and only the futures of the failing objects get the error.
+
+    Args:
+        session_factory (sessionmaker): Creates the writer's sessions
+        max_batch_rows (int): Most objects committed in one transaction
+        max_delay_ms (float): Longest wait for a batch to fill up
+        max_queue_rows (int): Objects waiting to be written before add() blocks
+        retry_policy (RetryPolicy): Defaults to app.retry.default_retry_policy
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_batch_rows=DEFAULT_MAX_BATCH_ROWS,
+        max_delay_ms=DEFAULT_MAX_DELAY_MS,
+        max_queue_rows=DEFAULT_MAX_QUEUE_ROWS,
+        retry_policy=None,
+    ):
+        self.session_factory = session_factory
+        self.retry_policy = retry_policy or default_retry_policy
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue(max_queue_rows)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.rows = 0
+        self.transactions = 0
+        self.failed = 0
+        self._writer = threading.Thread(
+            target=self._run, name="write-buffer", daemon=True
+        )
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, obj, timeout=None):
+        """Queue a new ORM object to be inserted by the writer thread.
+
+        The buffer owns the object from now on; don't use it from the calling
+        thread. When the queue is full, blocks until there is room.
+
+        Args:
+            obj (Base): Transient ORM object
+            timeout (float): Longest wait for room in seconds, forever by default
+
+        Returns:
+            Future: Resolves to the primary key of the row once it is committed.
+            Cancelling it before the writer takes the object skips the object
+
+        Raises:
+            queue.Full: The queue stayed full for timeout seconds
+            RuntimeError: The buffer is closed
+        """
+        # close() queues the stop marker under the same lock, so nothing can be
+        # queued after it
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise queue.Full
+        try:
+            if self._closed:
+                raise RuntimeError("WriteBuffer is closed")
+            future = Future()
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            self._queue.put((obj, future), timeout=timeout)
+        finally:
+            self._lock.release()
+        return future
+
+    def close(self, timeout=None):
+        """Stop accepting objects, commit the queued ones and stop the writer.
+
+        Args:
+            timeout (float): Longest wait for the writer thread in seconds
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_STOP)
+        self._writer.join(timeout)
+
+    def stats(self):
+        """Return the number of committed rows and transactions.
+
+        Returns:
+            dict: rows, transactions, failed rows, rows_per_transaction and the
+            queued objects
+        """
+        with self._stats_lock:
+            return {
+                "rows": self.rows,
+                "transactions": self.transactions,
+                "failed": self.failed,
+                "rows_per_transaction": (
+                    self.rows / self.transactions if self.transactions else 0.0
+                ),
+                "queued": self._queue.qsize(),
+            }
+
+    def _next_batch(self):
+        """Block for the next batch; returns (batch, stop requested)."""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            # Futures cancelled by their caller are dropped; the others can't
+            # be cancelled any more, so resolving them can't fail
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+
+    def _commit_once(self, objects):
+        session = self.session_factory()
+        try:
+            session.add_all(objects)
+            session.flush()
+            keys = [inspect(obj).identity for obj in objects]
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return [key[0] if key and len(key) == 1 else key for key in keys]
+
+    def _commit(self, objects):
+        keys = self.retry_policy.call(self._commit_once, objects)
+        with self._stats_lock:
+            self.rows += len(objects)
+            self.transactions += 1
+        return keys
+
+    def _write(self, batch):
+        try:
+            keys = self._commit([obj for obj, _ in batch])
+        except Exception as error:
+            if len(batch) > 1:
+                logger.warning(
+                    "Group commit of %d objects failed, retrying one by one: %s",
+                    len(batch),
+                    error,
+                )
+                for item in batch:
+                    self._write([item])
+                return
+            with self._stats_lock:
+                self.failed += 1
+            batch[0][1].set_exception(error)
+            return
+        for (_, future), key in zip(batch, keys):
+            future.set_result(key)
@@ -0,0 +1,324 @@
+# contention.py
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from sqlalchemy.orm import sessionmaker
+from app import queries
+from app.engine import create_app_engine
+from app.instrumentation import LatencyHistogram
+from app.models.tables import HeartRateLog, User, WaterIntakeLog
+from app.retry import RetryPolicy, is_lock_error, run_in_transaction
+from benchmarks.run import REFERENCE_TIME, seed_dataset
+
+# Read queries run by the reader threads: name -> function(session, user_id)
+READ_CASES = {
+    "weight_records": queries.get_user_weight_records,
+    "avg_daily_caloric_intake": queries.get_user_avg_daily_caloric_intake,
+    "recent_blood_pressure": queries.get_user_recent_blood_pressure,
+    "avg_heart_rate_during_workouts": queries.get_user_avg_heart_rate_during_workouts,
+    "summary": lambda session, user_id: queries.get_user_summary(
+        session, user_id, "2020-01-01", "2020-12-31", "2020-01-01"
+    ),
+}
+
+
+def _write_transaction(session, rng, num_users, rows_per_transaction):
+    """What a logging request handler does: read the user, then insert logs.
+
+    Reading first makes the transaction upgrade from a read to a write lock,
+    which fails at once in WAL mode when another writer committed meanwhile.
+    """
+    user_id = rng.randint(1, num_users)
+    session.get(User, user_id)
+    time_recorded = REFERENCE_TIME + timedelta(microseconds=rng.getrandbits(48))
+    for index in range(rows_per_transaction):
+        if index % 2:
+            session.add(
+                WaterIntakeLog(
+                    user_id=user_id,
+                    date=time_recorded.date(),
+                    water_intake=rng.randint(100, 1000),
+                )
+            )
+        else:
+            session.add(
+                HeartRateLog(
+                    user_id=user_id,
+                    time_recorded=time_recorded + timedelta(seconds=index),
+                    heart_rate=rng.randint(50, 180),
+                )
+            )
+
+
+def _new_stats():
+    return {"latencies": [], "rows": 0, "lock_errors": 0, "failures": 0, "errors": 0}
+
+
+def writer_loop(Session, seed, deadline, num_users, rows_per_transaction, retry):
+    """Run write transactions until deadline.
+
+    Returns:
+        dict: latencies in ms, rows written, lock errors (retried or not),
+        transactions that failed on a lock and other errors
+    """
+    rng = random.Random(seed)
+    policy = RetryPolicy(attempts=8 if retry else 1)
+    stats = _new_stats()
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            run_in_transaction(
+                Session,
+                _write_transaction,
+                rng,
+                num_users,
+                rows_per_transaction,
+                policy=policy,
+            )
+            stats["rows"] += rows_per_transaction
+        except Exception as error:
+            stats["failures" if is_lock_error(error) else "errors"] += 1
+        stats["latencies"].append((time.perf_counter() - started) * 1000)
+    stats["lock_errors"] = policy.stats()["retries"] + policy.stats()["failures"]
+    return stats
+
+
+def reader_loop(Session, seed, deadline, num_users):
+    """Run read queries on random users until deadline."""
+    rng = random.Random(seed)
+    functions = list(READ_CASES.values())
+    stats = _new_stats()
+    with Session() as session:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                rng.choice(functions)(session, rng.randint(1, num_users))
+            except Exception as error:
+                if is_lock_error(error):
+                    stats["lock_errors"] += 1
+                    stats["failures"] += 1
+                else:
+                    stats["errors"] += 1
+            # A new snapshot for every request, like a pooled handler
+            session.rollback()
+            stats["latencies"].append((time.perf_counter() - started) * 1000)
+    return stats
+
+
+def writer_process(url, pragmas, seed, duration, num_users, rows, retry, threads):
+    """Run writer threads in a separate process with its own engine."""
+    engine = create_app_engine(url, pragmas=pragmas)
+    try:
+        return _run_threads(
+            sessionmaker(bind=engine),
+            [
+                (writer_loop, (seed + index, num_users, rows, retry))
+                for index in range(threads)
+            ],
+            duration,
+        )
+    finally:
+        engine.dispose()
+
+
+def _run_threads(Session, loops, duration):
+    deadline = time.monotonic() + duration
+    results = [None] * len(loops)
+
+    def run(index, loop, args):
+        results[index] = loop(Session, args[0], deadline, *args[1:])
+
+    threads = [
+        threading.Thread(target=run, args=(index, loop, args))
+        for index, (loop, args) in enumerate(loops)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, duration):
+    """Merge the stats of several workers into throughput and percentiles."""
+    histogram = LatencyHistogram()
+    totals = _new_stats()
+    for result in results:
+        for milliseconds in result["latencies"]:
+            histogram.add(milliseconds)
+        for key in ("rows", "lock_errors", "failures", "errors"):
+            totals[key] += result[key]
+    operations = histogram.calls
+    summary = {
+        "operations": operations,
+        "operations_per_second": operations / duration,
+        "rows_per_second": totals["rows"] / duration,
+        "lock_errors": totals["lock_errors"],
+        "lock_error_rate": totals["lock_errors"] / operations if operations else 0.0,
+        "failures": totals["failures"],
+        "failure_rate": totals["failures"] / operations if operations else 0.0,
+        "errors": totals["errors"],
+    }
+    for percent in (50, 95, 99):
+        summary[f"p{percent}_ms"] = histogram.percentile(percent)
+    return summary
+
+
+def run_load(
+    path,
+    writers=4,
+    readers=4,
+    writer_processes=0,
+    duration=5.0,
+    num_users=100,
+    rows_per_transaction=10,
+    retry=True,
+    busy_timeout_ms=None,
+    seed=0,
+):
+    """Run writers and readers against one database file at the same time.
+
+    Writer threads run in this process, and writer_processes more processes
+    each run writers threads of their own, so the load models both a threaded
+    server and several server processes sharing the file.
+
+    Args:
+        path (str): Database file, seeded with num_users users if missing
+        writers (int): Writer threads per process
+        readers (int): Reader threads
+        writer_processes (int): Extra processes running writer threads
+        duration (float): Seconds of load
+        num_users (int): Users the load is spread over
+        rows_per_transaction (int): Log rows inserted by each write
+        retry (bool): Retry writes that fail on a lock with app.retry
+        busy_timeout_ms (int): Override of the busy_timeout pragma
+        seed (int): Seed of the dataset and of the load
+
+    Returns:
+        dict: Configuration and the summary of writers and readers
+    """
+    if not os.path.exists(path):
+        seed_dataset(path, num_users, 5, seed, num_shards=1)
+    pragmas = {} if busy_timeout_ms is None else {"busy_timeout": busy_timeout_ms}
+    url = f"sqlite:///{path}"
+    engine = create_app_engine(url, pragmas=pragmas)
+    Session = sessionmaker(bind=engine)
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, writer_processes)) as executor:
+            futures = [
+                executor.submit(
+                    writer_process,
+                    url,
+                    pragmas,
+                    seed + 1000 * (index + 1),
+                    duration,
+                    num_users,
+                    rows_per_transaction,
+                    retry,
+                    writers,
+                )
+                for index in range(writer_processes)
+            ]
+            loops = [
+                (writer_loop, (seed + index, num_users, rows_per_transaction, retry))
+                for index in range(writers)
+            ] + [
+                (reader_loop, (seed + 500 + index, num_users))
+                for index in range(readers)
+            ]
+            results = _run_threads(Session, loops, duration)
+            writer_results = results[:writers]
+            for future in futures:
+                writer_results += future.result()
+    finally:
+        engine.dispose()
+
+    return {
+        "config": {
+            "writer_threads": writers * (writer_processes + 1),
+            "writer_processes": writer_processes + 1,
+            "readers": readers,
+            "duration": duration,
+            "rows_per_transaction": rows_per_transaction,
+            "retry": retry,
+            "busy_timeout_ms": busy_timeout_ms,
+        },
+        "writers": summarize(writer_results, duration),
+        "readers": summarize(results[writers:], duration),
+    }
+
+
+def format_report(report):
+    lines = [
+        f"{'role':<8} {'ops':>8} {'ops/s':>9} {'rows/s':>9} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'lock err':>9} {'failed':>8}"
+    ]
+    for role in ("writers", "readers"):
+        summary = report[role]
+        lines.append(
+            f"{role:<8} {summary['operations']:>8} "
+            f"{summary['operations_per_second']:>9.1f} "
+            f"{summary['rows_per_second']:>9.1f} {summary['p50_ms']:>8.2f} "
+            f"{summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f} "
+            f"{summary['lock_error_rate']:>8.1%} {summary['failure_rate']:>8.1%}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load the database with concurrent writers and readers."
+    )
+    parser.add_argument("--db", help="database file, a temporary one by default")
+    parser.add_argument("--writers", type=int, default=4, help="threads per process")
+    parser.add_argument("--writer-processes", type=int, default=0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rows-per-transaction", type=int, default=10)
+    parser.add_argument(
+        "--no-retry", action="store_true", help="report lock errors unretried"
+    )
+    parser.add_argument("--busy-timeout-ms", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.mkdtemp(prefix="health_fitness_contention_")
+        path = os.path.join(directory, "contention.db")
+    try:
+        report = run_load(
+            path,
+            writers=args.writers,
+            readers=args.readers,
+            writer_processes=args.writer_processes,
+            duration=args.duration,
+            num_users=args.users,
+            rows_per_transaction=args.rows_per_transaction,
+            retry=not args.no_retry,
+            busy_timeout_ms=args.busy_timeout_ms,
+            seed=args.seed,
+        )
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
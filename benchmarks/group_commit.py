@@ -0,0 +1,115 @@
+# group_commit.py
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from app.engine import create_app_engine
+from app.models.tables import Base, User, WaterIntakeLog
+from app.write_buffer import WriteBuffer
+
+
+def _water_log(user_id):
+    return WaterIntakeLog(user_id=user_id, date=date(2024, 1, 1), water_intake=250)
+
+
+def commit_per_row(Session, user_id, rows):
+    """Every row in its own transaction, as request handlers do today."""
+    with Session() as session:
+        for _ in range(rows):
+            session.add(_water_log(user_id))
+            session.commit()
+
+
+def buffered(buffer, user_id, rows):
+    futures = [buffer.add(_water_log(user_id)) for _ in range(rows)]
+    for future in futures:
+        future.result()
+
+
+def run_case(name, threads, rows_per_thread, synchronous):
+    """Insert rows from threads into a fresh database file.
+
+    Returns:
+        dict: rows, commits, commits_per_row and rows_per_second
+    """
+    directory = tempfile.mkdtemp(prefix="health_fitness_group_commit_")
+    engine = create_app_engine(
+        f"sqlite:///{os.path.join(directory, 'app.db')}",
+        pragmas={"synchronous": synchronous},
+    )
+    try:
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as session:
+            session.add_all(
+                User(id=user_id, username=f"user{user_id}", email=f"{user_id}@x.org")
+                for user_id in range(1, threads + 1)
+            )
+            session.commit()
+
+        commits = []
+        event.listen(engine, "commit", lambda connection: commits.append(1))
+        buffer = WriteBuffer(Session) if name == "group_commit" else None
+        workers = [
+            threading.Thread(
+                target=buffered if buffer else commit_per_row,
+                args=(buffer or Session, user_id, rows_per_thread),
+            )
+            for user_id in range(1, threads + 1)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if buffer:
+            buffer.close()
+        elapsed = time.perf_counter() - started
+
+        rows = threads * rows_per_thread
+        return {
+            "rows": rows,
+            "commits": len(commits),
+            "commits_per_row": len(commits) / rows,
+            "rows_per_second": rows / elapsed,
+        }
+    finally:
+        engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare a commit per row with the group-commit write buffer."
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=250, help="rows per thread")
+    parser.add_argument("--synchronous", default="FULL")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args(argv)
+
+    results = {
+        name: run_case(name, args.threads, args.rows, args.synchronous)
+        for name in ("commit_per_row", "group_commit")
+    }
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    print(f"{'mode':<16} {'rows':>8} {'commits':>8} {'commits/row':>12} {'rows/s':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<16} {result['rows']:>8} {result['commits']:>8} "
+            f"{result['commits_per_row']:>12.4f} {result['rows_per_second']:>10.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+# run.py
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import date, datetime
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from app import queries
+from app.engine import create_app_engine
+from app.instrumentation import LatencyHistogram
+from app.migrations import ensure_schema
+from app.parallel_populate import SEED_BLOCK_USERS, parallel_populate_database
+from app.populate_db import BULK_TABLES
+from app.rollups import rebuild_daily_user_stats
+from app.workout_summaries import rebuild_workout_summaries
+
+# Dataset name -> (number of users, rows per log table for each user)
+SIZES = {
+    "1k": (1000, 10),
+    "100k": (100000, 10),
+    "1m": (1000000, 10),
+}
+
+# Generated data ends here, so the query dates below always hit rows
+REFERENCE_TIME = datetime(2024, 1, 1)
+START, END, DAY = date(2014, 1, 1), date(2024, 1, 1), date(2020, 6, 1)
+
+# Worker processes seeding the datasets. The data doesn't depend on it, but the
+# populate throughput does, so it's fixed instead of following the CPU count
+DEFAULT_SEED_SHARDS = 4
+
+# Users per call of the batch queries
+BATCH_SIZE = 100
+
+# A query is a regression when its p95 is this much slower than the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and at least this many milliseconds slower, to ignore timer noise
+DEFAULT_MIN_DELTA_MS = 0.5
+
+
+def _one(function):
+    return lambda user_ids: function(user_ids[0])
+
+
+def _batch(function):
+    return lambda user_ids: function(user_ids)
+
+
+# Query function -> function of sampled user IDs returning the arguments after session
+QUERY_CASES = {
+    "get_user_total_workout_duration": _one(lambda user_id: (user_id, START, END)),
+    "get_user_avg_daily_caloric_intake": _one(lambda user_id: (user_id,)),
+    "get_user_avg_sleep_duration": _one(lambda user_id: (user_id,)),
+    "get_user_weight_records": _one(lambda user_id: (user_id,)),
+    "get_users_not_meeting_sleep_goals": lambda user_ids: (8,),
+    "get_user_daily_water_intake": _one(lambda user_id: (user_id, DAY)),
+    "get_user_recent_blood_pressure": _one(lambda user_id: (user_id,)),
+    "get_user_avg_heart_rate_during_workouts": _one(lambda user_id: (user_id,)),
+    "get_user_heart_rate_by_exercise_type": _one(lambda user_id: (user_id,)),
+    "get_user_summary": _one(lambda user_id: (user_id, START, END, DAY)),
+    "get_users_total_workout_duration": _batch(lambda ids: (ids, START, END)),
+    "get_users_avg_daily_caloric_intake": _batch(lambda ids: (ids,)),
+    "get_users_avg_sleep_duration": _batch(lambda ids: (ids,)),
+    "get_users_weight_records": _batch(lambda ids: (ids,)),
+    "get_users_daily_water_intake": _batch(lambda ids: (ids, DAY)),
+    "get_users_recent_blood_pressure": _batch(lambda ids: (ids,)),
+    "get_users_avg_heart_rate_during_workouts": _batch(lambda ids: (ids,)),
+}
+
+
+def query_functions():
+    return {
+        name: function
+        for name, function in inspect.getmembers(queries, inspect.isfunction)
+        if name.startswith("get_") and function.__module__ == queries.__name__
+    }
+
+
+# Keyword argument switching a query to a precomputed table -> case name suffix
+QUERY_VARIANTS = {
+    "use_rollup": "rollup",
+    "use_workout_summaries": "workout_summaries",
+}
+
+
+def benchmark_cases():
+    """Yield (case name, query function, argument factory, keyword arguments).
+
+    Functions that can read a precomputed table are measured both ways, the
+    variant as "<name>[rollup]" or "<name>[workout_summaries]".
+    """
+    for name, function in sorted(query_functions().items()):
+        arguments = QUERY_CASES[name]
+        yield name, function, arguments, {}
+        parameters = inspect.signature(function).parameters
+        for keyword, suffix in QUERY_VARIANTS.items():
+            if keyword in parameters:
+                yield f"{name}[{suffix}]", function, arguments, {keyword: True}
+
+
+def dataset_path(db_dir, num_users, num_logs_per_user, seed):
+    # The data depends on the seed block size, not on the shard count
+    return os.path.join(
+        db_dir,
+        f"benchmark_{num_users}x{num_logs_per_user}_seed{seed}"
+        f"_block{SEED_BLOCK_USERS}.db",
+    )
+
+
+def count_rows(session):
+    return sum(
+        session.execute(select(func.count()).select_from(table)).scalar()
+        for table in BULK_TABLES
+    )
+
+
+def seed_dataset(
+    path, num_users, num_logs_per_user, seed=0, num_shards=DEFAULT_SEED_SHARDS
+):
+    """Create a deterministic benchmark database and time how long it took.
+
+    Args:
+        path (str): Database file, must not exist yet
+        num_users (int): Number of users to create
+        num_logs_per_user (int): Number of rows per log table for each user
+        seed (int): Seed of the dataset
+        num_shards (int): Worker processes
+
+    Returns:
+        dict: Populate and rollup timings with the number of rows written
+    """
+    engine = create_app_engine(f"sqlite:///{path}")
+    try:
+        ensure_schema(engine)
+        session = sessionmaker(bind=engine)()
+        try:
+            started = time.perf_counter()
+            # Keep the loader's progress messages out of the JSON report
+            with redirect_stdout(sys.stderr):
+                parallel_populate_database(
+                    session,
+                    num_users=num_users,
+                    num_logs_per_user=num_logs_per_user,
+                    num_shards=num_shards,
+                    seed=seed,
+                    reference_time=REFERENCE_TIME,
+                    vectorized=True,
+                )
+            populate_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            rebuild_daily_user_stats(session)
+            rebuild_workout_summaries(session)
+            rollup_seconds = time.perf_counter() - started
+            rows = count_rows(session)
+        finally:
+            session.close()
+    finally:
+        engine.dispose()
+    return {
+        "rows": rows,
+        "populate_seconds": populate_seconds,
+        "rows_per_second": rows / populate_seconds if populate_seconds else 0.0,
+        "rollup_seconds": rollup_seconds,
+    }
+
+
+def time_query(session, function, arguments, kwargs, user_ids, repeat, rng, warmup=3):
+    """Call a query function repeat times on random users and time every call.
+
+    Args:
+        session (db session): SQLAlchemy database session
+        function (callable): Query function
+        arguments (callable): Returns the arguments after session for sampled user IDs
+        kwargs (dict): Keyword arguments of every call
+        user_ids (range): User IDs to sample from
+        repeat (int): Number of timed calls
+        rng (random.Random): Source of the sampled users
+        warmup (int): Untimed calls made first to fill caches
+
+    Returns:
+        dict: Latency summary with the throughput in calls per second
+    """
+    histogram = LatencyHistogram()
+    sample_size = min(BATCH_SIZE, len(user_ids))
+    for index in range(warmup + repeat):
+        args = arguments(rng.sample(user_ids, sample_size))
+        started = time.perf_counter()
+        function(session, *args, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        if index >= warmup:
+            histogram.add(elapsed)
+    summary = histogram.summary()
+    del summary["rows"]
+    summary["calls_per_second"] = (
+        histogram.calls / (histogram.total / 1000) if histogram.total else 0.0
+    )
+    return summary
+
+
+def benchmark_queries(path, num_users, repeat=50, seed=0):
+    """Time every query function against an existing benchmark database.
+
+    Returns:
+        dict: Mapping of case name to its latency summary
+    """
+    engine = create_app_engine(f"sqlite:///{path}")
+    rng = random.Random(seed)
+    results = {}
+    try:
+        session = sessionmaker(bind=engine)()
+        try:
+            user_ids = range(1, num_users + 1)
+            for name, function, arguments, kwargs in benchmark_cases():
+                results[name] = time_query(
+                    session, function, arguments, kwargs, user_ids, repeat, rng
+                )
+                session.rollback()
+        finally:
+            session.close()
+    finally:
+        engine.dispose()
+    return results
+
+
+def run_benchmarks(
+    sizes, repeat=50, seed=0, db_dir=None, num_shards=DEFAULT_SEED_SHARDS
+):
+    """Seed (or reuse) a dataset for every size and benchmark it.
+
+    Datasets are deterministic for a given size and seed, so files already in
+    db_dir are reused instead of seeded again.
+
+    Args:
+        sizes (dict): Mapping of size name to (number of users, logs per user)
+        repeat (int): Timed calls per query function
+        seed (int): Seed of the datasets and of the sampled users
+        db_dir (str): Directory that keeps the datasets, a temporary one by default
+        num_shards (int): Worker processes used for seeding
+
+    Returns:
+        dict: Report with the environment and the results of every size
+    """
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "seed": seed,
+        "seed_block_users": SEED_BLOCK_USERS,
+        "num_shards": num_shards,
+        "repeat": repeat,
+        "sizes": {},
+    }
+    temporary = None
+    if db_dir is None:
+        temporary = tempfile.TemporaryDirectory(prefix="health_fitness_benchmark_")
+        db_dir = temporary.name
+    try:
+        for size, (num_users, num_logs_per_user) in sizes.items():
+            path = dataset_path(db_dir, num_users, num_logs_per_user, seed)
+            result = {"num_users": num_users, "num_logs_per_user": num_logs_per_user}
+            if not os.path.exists(path):
+                # Seed under another name so an interrupted run is never reused
+                partial = path + ".partial"
+                if os.path.exists(partial):
+                    os.remove(partial)
+                result["populate"] = seed_dataset(
+                    partial, num_users, num_logs_per_user, seed, num_shards
+                )
+                os.replace(partial, path)
+            result["queries"] = benchmark_queries(path, num_users, repeat, seed)
+            report["sizes"][size] = result
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+    return report
+
+
+def compare_to_baseline(
+    report,
+    baseline,
+    tolerance=DEFAULT_TOLERANCE,
+    min_delta_ms=DEFAULT_MIN_DELTA_MS,
+):
+    """List the query and populate regressions of a report against a baseline.
+
+    Only sizes and queries present in both reports are compared. Reports of
+    datasets seeded differently, or by a different number of shards, aren't
+    comparable.
+
+    Args:
+        report (dict): Output of run_benchmarks
+        baseline (dict): Earlier output of run_benchmarks
+        tolerance (float): Allowed relative slowdown, 0.25 is 25%
+        min_delta_ms (float): Smaller absolute p95 slowdowns are ignored
+
+    Returns:
+        list of str: One description per regression
+
+    Raises:
+        ValueError: The reports were made with different seeding settings
+    """
+    for key in ("seed_block_users", "num_shards"):
+        if report.get(key) != baseline.get(key):
+            raise ValueError(
+                f"Can't compare reports with different {key}: "
+                f"{baseline.get(key)} in the baseline, {report.get(key)} now"
+            )
+    regressions = []
+    for size, result in report["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if previous is None:
+            continue
+        for name, summary in result["queries"].items():
+            before = previous.get("queries", {}).get(name)
+            if before is None:
+                continue
+            now, then = summary["p95_ms"], before["p95_ms"]
+            if now > then * (1 + tolerance) and now - then >= min_delta_ms:
+                regressions.append(f"{size} {name}: p95 {then:.2f} ms -> {now:.2f} ms")
+        if "populate" in result and "populate" in previous:
+            now = result["populate"]["rows_per_second"]
+            then = previous["populate"]["rows_per_second"]
+            if now < then / (1 + tolerance):
+                regressions.append(
+                    f"{size} populate: {then:.0f} rows/s -> {now:.0f} rows/s"
+                )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark population and every query function."
+    )
+    parser.add_argument(
+        "--size",
+        action="append",
+        choices=sorted(SIZES),
+        help="dataset size to run, may be repeated (default: 1k)",
+    )
+    parser.add_argument("--logs-per-user", type=int, help="override rows per log table")
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=DEFAULT_SEED_SHARDS,
+        help="worker processes for seeding, must match the baseline's",
+    )
+    parser.add_argument(
+        "--db-dir", help="keep and reuse the datasets in this directory"
+    )
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = {}
+    for size in args.size or ["1k"]:
+        num_users, num_logs_per_user = SIZES[size]
+        sizes[size] = (num_users, args.logs_per_user or num_logs_per_user)
+
+    report = run_benchmarks(sizes, args.repeat, args.seed, args.db_dir, args.shards)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        try:
+            regressions = compare_to_baseline(
+                report, baseline, args.tolerance, args.min_delta_ms
+            )
+        except ValueError as error:
+            print(f"ERROR {error}", file=sys.stderr)
+            return 2
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# statement_overhead.py
+import argparse
+import json
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from app import queries
+from app.models.tables import (
+    Base,
+    HealthMetrics,
+    NutritionLog,
+    WeightLog,
+    WorkoutLog,
+)
+from app.populate_db import bulk_populate_database
+
+START, END = date(2000, 1, 1), date(2100, 1, 1)
+
+
+# The query functions as they were before the statements were prebuilt: a new
+# session.query() chain on every call
+def legacy_total_workout_duration(session, user_id):
+    return (
+        session.query(func.sum(WorkoutLog.duration))
+        .filter(WorkoutLog.user_id == user_id)
+        .filter(WorkoutLog.date.between(START, END))
+        .scalar()
+    )
+
+
+def legacy_avg_daily_caloric_intake(session, user_id):
+    return (
+        session.query(func.avg(NutritionLog.calories))
+        .filter(NutritionLog.user_id == user_id)
+        .scalar()
+    )
+
+
+def legacy_weight_records(session, user_id):
+    return (
+        session.query(WeightLog.date_recorded, WeightLog.weight)
+        .filter(WeightLog.user_id == user_id)
+        .order_by(WeightLog.date_recorded.asc())
+        .all()
+    )
+
+
+def legacy_recent_blood_pressure(session, user_id):
+    return (
+        session.query(HealthMetrics.date, HealthMetrics.blood_pressure)
+        .filter(HealthMetrics.user_id == user_id)
+        .order_by(HealthMetrics.date.desc())
+        .limit(5)
+        .all()
+    )
+
+
+# Name -> (legacy implementation, current implementation)
+CASES = {
+    "total_workout_duration": (
+        legacy_total_workout_duration,
+        lambda session, user_id: queries.get_user_total_workout_duration(
+            session, user_id, START, END
+        ),
+    ),
+    "avg_daily_caloric_intake": (
+        legacy_avg_daily_caloric_intake,
+        queries.get_user_avg_daily_caloric_intake,
+    ),
+    "weight_records": (legacy_weight_records, queries.get_user_weight_records),
+    "recent_blood_pressure": (
+        legacy_recent_blood_pressure,
+        queries.get_user_recent_blood_pressure,
+    ),
+}
+
+
+def time_per_call(function, session, num_users, calls, warmup=100):
+    """Average microseconds per call of function over calls calls."""
+    for index in range(warmup):
+        function(session, index % num_users + 1)
+    started = time.perf_counter()
+    for index in range(calls):
+        function(session, index % num_users + 1)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def run(calls=5000, num_users=10, num_logs_per_user=5):
+    """Time the legacy and prebuilt version of every case on a small database.
+
+    The database is tiny and in memory so the timings are dominated by the
+    Python-side cost of building and executing the statements.
+
+    Returns:
+        dict: Mapping of case name to microseconds per call before and after
+    """
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        with redirect_stdout(sys.stderr):
+            bulk_populate_database(
+                session,
+                num_users=num_users,
+                num_logs_per_user=num_logs_per_user,
+                vectorized=True,
+                seed=0,
+            )
+        results = {}
+        for name, (legacy, current) in CASES.items():
+            for user_id in range(1, num_users + 1):
+                if legacy(session, user_id) != current(session, user_id):
+                    raise AssertionError(f"{name} results differ for user {user_id}")
+            before = time_per_call(legacy, session, num_users, calls)
+            after = time_per_call(current, session, num_users, calls)
+            results[name] = {
+                "before_us": before,
+                "after_us": after,
+                "speedup": before / after if after else 0.0,
+            }
+        return results
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the per-call overhead of rebuilt and prebuilt statements."
+    )
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.calls)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    print(f"{'query':<28} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<28} {result['before_us']:>10.1f} {result['after_us']:>10.1f} "
+            f"{result['speedup']:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
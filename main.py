@@ -1,12 +1,35 @@
 # main.py
-from app import Session
+import argparse
+import logging
+from app import get_engine, get_session
+from app import queries
+from app.instrumentation import DEFAULT_SLOW_QUERY_MS, profiling
 from app.populate_db import populate_database
 from app.models.tables import User
 from app.queries import run_queries
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Populate the database and run the queries."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time every query and print a latency table",
+    )
+    parser.add_argument(
+        "--slow-query-ms",
+        type=float,
+        default=DEFAULT_SLOW_QUERY_MS,
+        help="with --profile, log statements at least this slow with their plan",
+    )
+    return parser.parse_args()
+
+
 def main():
-    session = Session()
+    args = parse_args()
+    session = get_session()
 
     # Populate the database with fake data
     if not session.query(User).all():
@@ -16,7 +39,15 @@ def main():
             session.close()
 
     # Run the queries
-    run_queries(session)
+    if not args.profile:
+        run_queries(session)
+        return
+
+    logging.basicConfig(format="%(name)s: %(message)s")
+    with profiling(get_engine(), queries, slow_query_ms=args.slow_query_ms) as stats:
+        run_queries(session)
+    print()
+    print(stats.format_table())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,228 @@
+# tests/test_analytics.py
+
+import math
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from app import analytics
+from app.downsampling import catch_up_heart_rate_tiers
+from app.models.tables import (
+    Base,
+    HealthMetrics,
+    HeartRateLog,
+    SleepLog,
+    User,
+)
+from app.populate_db import bulk_populate_database
+
+EPOCH = datetime(1970, 1, 1)
+START = datetime(2024, 1, 1)
+
+
+def epoch(value):
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return (value - EPOCH).total_seconds()
+
+
+class LoadSeriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        bulk_populate_database(
+            self.session, num_users=5, num_logs_per_user=30, vectorized=True, seed=8
+        )
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_series_match_the_orm(self):
+        for metric, (time_column, value_column) in analytics.METRICS.items():
+            rows = self.session.execute(
+                select(time_column, value_column)
+                .where(time_column.class_.user_id == 2, value_column.isnot(None))
+                .order_by(time_column)
+            ).all()
+            series = analytics.load_series(self.session, 2, metric)
+            self.assertEqual(series.times.dtype, np.float64)
+            np.testing.assert_allclose(series.times, [epoch(t) for t, _ in rows])
+            np.testing.assert_allclose(series.values, [v for _, v in rows])
+
+    def test_range_bounds(self):
+        times = analytics.load_series(self.session, 1, "sleep").times
+        starts = self.session.scalars(
+            select(SleepLog.start_time)
+            .where(SleepLog.user_id == 1)
+            .order_by(SleepLog.start_time)
+        ).all()
+        start_time, end_time = starts[5], starts[20]
+        series = analytics.load_series(self.session, 1, "sleep", start_time, end_time)
+        np.testing.assert_array_equal(series.times, times[5:20])
+
+        days = analytics.load_series(self.session, 1, "weight").times
+        day = EPOCH + timedelta(seconds=float(days[3]))
+        # A bound inside a day excludes that day's midnight
+        series = analytics.load_series(
+            self.session, 1, "weight", day + timedelta(hours=1), None
+        )
+        self.assertTrue(np.all(series.times > days[3]))
+        series = analytics.load_series(self.session, 1, "weight", day.date(), None)
+        self.assertTrue(np.all(series.times >= days[3]))
+        self.assertIn(days[3], series.times)
+
+    def test_cohort_series(self):
+        cohort = analytics.load_cohort_series(self.session, [4, 1, 3, 99], "weight")
+        self.assertEqual(cohort.user_ids.dtype, np.int64)
+        by_user = analytics.split_by_user(cohort)
+        self.assertEqual(list(by_user), [1, 3, 4])
+        for user_id, series in by_user.items():
+            expected = analytics.load_series(self.session, user_id, "weight")
+            np.testing.assert_array_equal(series.times, expected.times)
+            np.testing.assert_array_equal(series.values, expected.values)
+
+        slopes = analytics.trend_slopes_by_user(cohort)
+        for user_id, series in by_user.items():
+            self.assertAlmostEqual(slopes[user_id], analytics.trend_slope(*series))
+        self.assertEqual(
+            analytics.split_by_user(
+                analytics.load_cohort_series(self.session, [], "weight")
+            ),
+            {},
+        )
+
+
+class OperationsTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.times = np.sort(rng.uniform(0, 10 * 86400, 500)) + epoch(START)
+        self.values = rng.normal(70, 5, 500)
+
+    def test_rolling_mean(self):
+        means = analytics.rolling_mean(self.values, 7)
+        self.assertTrue(np.all(np.isnan(means[:6])))
+        expected = [self.values[i - 6 : i + 1].mean() for i in range(6, 500)]
+        np.testing.assert_allclose(means[6:], expected)
+        self.assertTrue(np.all(np.isnan(analytics.rolling_mean([1.0, 2.0], 3))))
+
+        means = analytics.rolling_mean_by_time(self.times, self.values, 3600)
+        for i in range(0, 500, 37):
+            window = (self.times > self.times[i] - 3600) & (self.times <= self.times[i])
+            self.assertAlmostEqual(means[i], self.values[window].mean())
+
+    def test_trend_slope(self):
+        days = (self.times - self.times[0]) / 86400
+        self.assertAlmostEqual(
+            analytics.trend_slope(self.times, 80 - 0.25 * days), -0.25
+        )
+        expected = np.polyfit(days, self.values, 1)[0]
+        self.assertAlmostEqual(analytics.trend_slope(self.times, self.values), expected)
+        self.assertTrue(math.isnan(analytics.trend_slope([1.0], [2.0])))
+        self.assertTrue(math.isnan(analytics.trend_slope([1.0, 1.0], [2.0, 3.0])))
+
+    def test_resample_daily(self):
+        day_numbers = self.times // 86400
+        for how, reduce in [
+            ("mean", np.mean),
+            ("sum", np.sum),
+            ("min", np.min),
+            ("max", np.max),
+            ("count", len),
+        ]:
+            days, values = analytics.resample_daily(self.times, self.values, how)
+            self.assertEqual(len(days), len(np.unique(day_numbers)))
+            for day, value in zip(days, values):
+                self.assertAlmostEqual(
+                    value, reduce(self.values[day_numbers == day // 86400])
+                )
+        with self.assertRaises(ValueError):
+            analytics.resample_daily(self.times, self.values, "median")
+
+        times = np.array([2.5, 0.5, 3.5]) * 86400
+        days, values = analytics.resample_daily(times, [1.0, 2.0, 3.0], "sum", True)
+        np.testing.assert_array_equal(days, np.array([0, 1, 2, 3]) * 86400)
+        np.testing.assert_array_equal(values, [2.0, 0.0, 1.0, 3.0])
+        _, values = analytics.resample_daily(times, [1.0, 2.0, 3.0], fill=True)
+        self.assertTrue(np.isnan(values[1]))
+        self.assertEqual(len(analytics.resample_daily([], []).times), 0)
+
+    def test_daily_correlation(self):
+        days = np.arange(30) * 86400.0
+        noise = np.random.default_rng(1).normal(0, 1, 30)
+        first = analytics.Series(days, noise)
+        second = analytics.Series(days + 3600, 2 * np.roll(noise, 2) + 5)
+        self.assertAlmostEqual(analytics.daily_correlation(first, second, 2).r, 1.0)
+        self.assertEqual(analytics.daily_correlation(first, second, 2).days, 28)
+        self.assertLess(abs(analytics.daily_correlation(first, second).r), 0.5)
+        flat = analytics.Series(days, np.ones(30))
+        self.assertTrue(math.isnan(analytics.daily_correlation(first, flat).r))
+
+
+class SleepAndHeartRateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add(User(id=1, username="sleeper"))
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_sleep_vs_next_day_resting_heart_rate(self):
+        rng = np.random.default_rng(3)
+        for day in range(20):
+            night = START + timedelta(days=day, hours=22)
+            minutes = float(rng.integers(300, 540))
+            self.session.add(
+                SleepLog(
+                    user_id=1,
+                    start_time=night,
+                    end_time=night + timedelta(minutes=minutes),
+                    duration=minutes,
+                )
+            )
+            self.session.add(
+                HealthMetrics(
+                    user_id=1,
+                    date=(night + timedelta(days=1)).date(),
+                    resting_heart_rate=int(100 - minutes / 10),
+                )
+            )
+        self.session.commit()
+        correlation = analytics.sleep_vs_resting_heart_rate(self.session, 1)
+        self.assertEqual(correlation.days, 20)
+        self.assertLess(correlation.r, -0.99)
+
+    def test_heart_rate_buckets_from_the_tiers(self):
+        self.session.add_all(
+            HeartRateLog(
+                user_id=1,
+                time_recorded=START + timedelta(hours=hour),
+                heart_rate=60 + hour,
+            )
+            for hour in range(48)
+        )
+        self.session.commit()
+        catch_up_heart_rate_tiers(self.session)
+        buckets = analytics.load_heart_rate_buckets(
+            self.session, 1, START, START + timedelta(days=2)
+        )
+        np.testing.assert_array_equal(
+            buckets.times, [epoch(START), epoch(START) + 86400]
+        )
+        np.testing.assert_array_equal(buckets.min, [60, 84])
+        np.testing.assert_array_equal(buckets.max, [83, 107])
+        np.testing.assert_allclose(buckets.mean, [71.5, 95.5])
+        np.testing.assert_array_equal(buckets.count, [24, 24])
+        hours = analytics.load_heart_rate_buckets(
+            self.session, 1, START, START + timedelta(hours=5), tier="hour"
+        )
+        np.testing.assert_array_equal(hours.mean, [60, 61, 62, 63, 64])
+
+
+if __name__ == "__main__":
+    unittest.main()
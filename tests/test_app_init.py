@@ -0,0 +1,153 @@
+# tests/test_app_init.py
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from sqlalchemy import inspect
+from app.engine import create_app_engine
+from app.models.tables import Base
+from app.migrations import SCHEMA_VERSION, ensure_schema, get_schema_version
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AppInitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "app.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_python(self, code, **environ):
+        env = {**os.environ, "PYTHONPATH": PACKAGE_DIR, **environ}
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=self.directory.name,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.strip()
+
+    def test_import_does_not_touch_the_database(self):
+        output = self.run_python(
+            "import app, app.populate_db, app.queries, app.rollups; "
+            "print(app._engine is None and app._session_factory is None)"
+        )
+        self.assertEqual(output, "True")
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_session_initializes_on_first_use(self):
+        output = self.run_python(
+            "from app import Session, get_engine; "
+            "session = Session(); "
+            "print(session.get_bind() is get_engine(), get_engine().url.database)",
+            HEALTH_APP_DATABASE_URL=f"sqlite:///{self.path}",
+        )
+        self.assertEqual(output, f"True {self.path}")
+
+        engine = create_app_engine(f"sqlite:///{self.path}")
+        try:
+            with engine.connect() as connection:
+                self.assertEqual(get_schema_version(connection), SCHEMA_VERSION)
+                self.assertIn("users", inspect(connection).get_table_names())
+        finally:
+            engine.dispose()
+
+    def test_schema_creation_is_skipped_when_the_version_matches(self):
+        engine = create_app_engine(f"sqlite:///{self.path}")
+        try:
+            self.assertTrue(ensure_schema(engine))
+            self.assertFalse(ensure_schema(engine))
+
+            with engine.connect() as connection:
+                connection.exec_driver_sql("PRAGMA user_version = 0")
+                connection.commit()
+            self.assertTrue(ensure_schema(engine))
+        finally:
+            engine.dispose()
+
+    def test_older_databases_get_new_columns_and_indexes(self):
+        engine = create_app_engine(f"sqlite:///{self.path}")
+        try:
+            ensure_schema(engine)
+            with engine.connect() as connection:
+                # The sleep_logs and weight_logs of a version 1 database
+                connection.exec_driver_sql(
+                    "DROP INDEX ix_sleep_logs_user_id_start_time_duration"
+                )
+                connection.exec_driver_sql(
+                    "ALTER TABLE sleep_logs DROP COLUMN duration"
+                )
+                connection.exec_driver_sql(
+                    "DROP INDEX ix_weight_logs_user_id_date_recorded_weight"
+                )
+                connection.exec_driver_sql("PRAGMA user_version = 1")
+                connection.commit()
+
+            self.assertTrue(ensure_schema(engine))
+            with engine.connect() as connection:
+                inspector = inspect(connection)
+                self.assertIn(
+                    "duration",
+                    {column["name"] for column in inspector.get_columns("sleep_logs")},
+                )
+                for table in ("sleep_logs", "weight_logs"):
+                    self.assertEqual(
+                        {index["name"] for index in inspector.get_indexes(table)},
+                        {index.name for index in Base.metadata.tables[table].indexes},
+                    )
+                self.assertEqual(get_schema_version(connection), SCHEMA_VERSION)
+        finally:
+            engine.dispose()
+
+    def test_duplicate_heart_rates_are_removed_for_the_unique_index(self):
+        engine = create_app_engine(f"sqlite:///{self.path}")
+        try:
+            ensure_schema(engine)
+            with engine.connect() as connection:
+                # The heart_rate_logs of a version 3 database
+                connection.exec_driver_sql(
+                    "DROP INDEX uq_heart_rate_logs_user_id_time_recorded"
+                )
+                connection.exec_driver_sql(
+                    "CREATE INDEX ix_heart_rate_logs_user_id_time_recorded "
+                    "ON heart_rate_logs (user_id, time_recorded)"
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO heart_rate_logs (user_id, time_recorded, heart_rate) "
+                    "VALUES (1, '2024-01-01 08:00:00.000000', 70), "
+                    "(1, '2024-01-01 08:00:00.000000', 75), "
+                    "(2, '2024-01-01 08:00:00.000000', 80)"
+                )
+                connection.exec_driver_sql("PRAGMA user_version = 3")
+                connection.commit()
+
+            self.assertTrue(ensure_schema(engine))
+            with engine.connect() as connection:
+                self.assertEqual(
+                    connection.exec_driver_sql(
+                        "SELECT user_id, heart_rate FROM heart_rate_logs ORDER BY id"
+                    ).all(),
+                    [(1, 70), (2, 80)],
+                )
+                self.assertEqual(
+                    {
+                        index["name"]
+                        for index in inspect(connection).get_indexes("heart_rate_logs")
+                    },
+                    {
+                        index.name
+                        for index in Base.metadata.tables["heart_rate_logs"].indexes
+                    },
+                )
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# tests/test_benchmarks.py
+
+import copy
+import json
+import os
+import tempfile
+import unittest
+from benchmarks import contention, group_commit, run, statement_overhead
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.report = run.run_benchmarks(
+            {"tiny": (12, 3)}, repeat=3, seed=1, db_dir=cls.directory.name, num_shards=2
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_every_query_function_is_benchmarked(self):
+        self.assertEqual(set(run.query_functions()), set(run.QUERY_CASES))
+        results = self.report["sizes"]["tiny"]["queries"]
+        self.assertEqual(
+            set(results), {name for name, _, _, _ in run.benchmark_cases()}
+        )
+        self.assertIn("get_user_avg_sleep_duration[rollup]", results)
+        for summary in results.values():
+            self.assertEqual(summary["calls"], 3)
+            self.assertLessEqual(summary["p50_ms"], summary["p99_ms"])
+
+    def test_report_is_json_and_datasets_are_reused(self):
+        populate = self.report["sizes"]["tiny"]["populate"]
+        # Users, their goals and targets, and 3 rows per user in 8 log tables
+        self.assertGreater(populate["rows"], 12 + 8 * 12 * 3)
+        self.assertGreater(populate["rows_per_second"], 0)
+        json.loads(json.dumps(self.report))
+
+        again = run.run_benchmarks(
+            {"tiny": (12, 3)}, repeat=1, seed=1, db_dir=self.directory.name
+        )
+        self.assertNotIn("populate", again["sizes"]["tiny"])
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+    def test_compare_to_baseline(self):
+        self.assertEqual(run.compare_to_baseline(self.report, self.report), [])
+
+        slower = copy.deepcopy(self.report)
+        summary = slower["sizes"]["tiny"]["queries"]["get_user_summary"]
+        summary["p95_ms"] = summary["p95_ms"] * 2 + 10
+        slower["sizes"]["tiny"]["populate"]["rows_per_second"] /= 3
+        regressions = run.compare_to_baseline(slower, self.report)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("tiny get_user_summary"))
+        settings = {key: self.report[key] for key in ("seed_block_users", "num_shards")}
+        self.assertEqual(run.compare_to_baseline(slower, {**settings, "sizes": {}}), [])
+        other_shards = dict(self.report, num_shards=self.report["num_shards"] + 1)
+        with self.assertRaises(ValueError):
+            run.compare_to_baseline(self.report, other_shards)
+
+
+class StatementOverheadTestCase(unittest.TestCase):
+    def test_run_checks_and_times_every_case(self):
+        results = statement_overhead.run(calls=10, num_users=3, num_logs_per_user=2)
+        self.assertEqual(set(results), set(statement_overhead.CASES))
+        for result in results.values():
+            self.assertGreater(result["before_us"], 0)
+            self.assertGreater(result["after_us"], 0)
+
+
+class GroupCommitTestCase(unittest.TestCase):
+    def test_buffer_commits_less_than_once_per_row(self):
+        per_row = group_commit.run_case("commit_per_row", 2, 5, "NORMAL")
+        grouped = group_commit.run_case("group_commit", 2, 5, "NORMAL")
+        self.assertEqual(per_row["commits"], 10)
+        self.assertEqual(grouped["rows"], 10)
+        self.assertLess(grouped["commits"], per_row["commits"])
+
+
+class ContentionTestCase(unittest.TestCase):
+    def test_load_reports_both_roles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report = contention.run_load(
+                os.path.join(directory, "contention.db"),
+                writers=2,
+                readers=2,
+                duration=0.5,
+                num_users=5,
+                rows_per_transaction=4,
+            )
+        json.loads(json.dumps(report))
+        writers, readers = report["writers"], report["readers"]
+        self.assertGreater(writers["operations"], 0)
+        self.assertGreater(readers["operations"], 0)
+        self.assertEqual(writers["errors"] + readers["errors"], 0)
+        self.assertEqual(writers["failures"], 0)
+        self.assertLessEqual(writers["p50_ms"], writers["p99_ms"])
+        self.assertIn("writers", contention.format_report(report))
+
+
+if __name__ == "__main__":
+    unittest.main()
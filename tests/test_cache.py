@@ -0,0 +1,217 @@
+# tests/test_cache.py
+
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, WeightLog, WorkoutLog
+from app.cache import QUERY_TABLES, QueryCache, cached_queries
+from app.populate_db import bulk_populate_database
+from app.rollups import install_rollup_hooks
+from app import queries
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class QueryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        install_rollup_hooks(self.Session)
+        self.clock = FakeClock()
+        self.cache = QueryCache(ttl_seconds=10, clock=self.clock)
+        self.cache.install(self.Session)
+        self.cached = cached_queries(self.cache)
+        self.session = self.Session()
+        bulk_populate_database(
+            self.session, num_users=4, num_logs_per_user=3, vectorized=True, seed=3
+        )
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_every_query_function_is_covered(self):
+        names = {
+            name
+            for name in dir(queries)
+            if name.startswith("get_") and callable(getattr(queries, name))
+        }
+        self.assertEqual(set(QUERY_TABLES), names)
+
+    def test_repeat_reads_skip_the_database(self):
+        first = self.cached.get_user_weight_records(self.session, 1)
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(self.engine, "before_cursor_execute", count)
+        try:
+            second = self.cached.get_user_weight_records(self.session, 1)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", count)
+        self.assertEqual(first, second)
+        self.assertEqual(statements, [])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+        # Callers can't corrupt the cached value
+        second.clear()
+        self.assertEqual(self.cached.get_user_weight_records(self.session, 1), first)
+
+    def test_orm_writes_invalidate_only_the_touched_users(self):
+        self.cached.get_user_weight_records(self.session, 1)
+        self.cached.get_user_weight_records(self.session, 2)
+        self.cached.get_user_avg_daily_caloric_intake(self.session, 1)
+        self.session.commit()
+
+        self.session.add(
+            WeightLog(user_id=1, date_recorded=date(2021, 1, 1), weight=70)
+        )
+        # Uncommitted writes of the session itself bypass the cache
+        self.assertEqual(
+            len(self.cached.get_user_weight_records(self.session, 1)),
+            len(queries.get_user_weight_records(self.session, 1)),
+        )
+        self.session.commit()
+
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+        self.assertEqual(
+            self.cached.get_user_weight_records(self.session, 1),
+            queries.get_user_weight_records(self.session, 1),
+        )
+        hits = self.cache.stats()["hits"]
+        self.cached.get_user_weight_records(self.session, 2)
+        self.cached.get_user_avg_daily_caloric_intake(self.session, 1)
+        self.assertEqual(self.cache.stats()["hits"], hits + 2)
+
+    def test_moving_and_deleting_rows(self):
+        start, end = date(2000, 1, 1), date(2100, 1, 1)
+        before = self.cached.get_users_total_workout_duration(
+            self.session, [1, 2], start, end
+        )
+        workout = self.session.query(WorkoutLog).filter_by(user_id=1).first()
+        self.session.commit()
+
+        # Expired by the commit, so the old owner is only known to the database
+        workout.user_id = 3
+        self.session.commit()
+        after = self.cached.get_users_total_workout_duration(
+            self.session, [1, 2], start, end
+        )
+        self.assertLess(after[1], before[1])
+        self.assertEqual(
+            after,
+            queries.get_users_total_workout_duration(self.session, [1, 2], start, end),
+        )
+
+        total = self.cached.get_user_total_workout_duration(self.session, 3, start, end)
+        self.session.delete(workout)
+        self.session.commit()
+        self.assertLess(
+            self.cached.get_user_total_workout_duration(self.session, 3, start, end),
+            total,
+        )
+
+    def test_core_writes_invalidate_the_table(self):
+        records = self.cached.get_user_weight_records(self.session, 2)
+        self.session.execute(text("DELETE FROM weight_logs WHERE user_id = 2"))
+        # Not committed yet, so not cached either
+        self.assertEqual(self.cached.get_user_weight_records(self.session, 2), [])
+        self.session.rollback()
+        self.assertEqual(self.cached.get_user_weight_records(self.session, 2), records)
+
+        self.session.execute(text("DELETE FROM weight_logs WHERE user_id = 2"))
+        self.session.commit()
+        self.assertEqual(self.cached.get_user_weight_records(self.session, 2), [])
+
+        # Schema-qualified, like the shard merge of parallel_populate
+        self.cached.get_user_weight_records(self.session, 3)
+        self.session.execute(text('DELETE FROM "main"."weight_logs" WHERE user_id = 3'))
+        self.session.commit()
+        self.assertEqual(self.cached.get_user_weight_records(self.session, 3), [])
+        self.session.execute(
+            text(
+                "INSERT INTO main.weight_logs (user_id, date_recorded, weight) "
+                "VALUES (3, '2030-01-01', 70.0)"
+            )
+        )
+        self.session.commit()
+        self.assertEqual(
+            self.cached.get_user_weight_records(self.session, 3),
+            [(date(2030, 1, 1), 70.0)],
+        )
+
+    def test_writes_from_another_session(self):
+        self.assertEqual(
+            self.cached.get_user_daily_water_intake(self.session, 1, date(2030, 1, 1)),
+            0,
+        )
+        self.session.commit()
+
+        other = self.Session()
+        other.execute(
+            text(
+                "INSERT INTO water_intake_logs (user_id, date, water_intake) "
+                "VALUES (1, '2030-01-01', 500)"
+            )
+        )
+        other.commit()
+        other.close()
+        self.assertEqual(
+            self.cached.get_user_daily_water_intake(self.session, 1, date(2030, 1, 1)),
+            500,
+        )
+
+    def test_results_read_before_an_invalidation_are_not_stored(self):
+        self.cached.get_user_weight_records(self.session, 1)  # begins a transaction
+        self.cache.invalidate({"weight_logs": {4}})
+        self.cache.clear()
+        self.cached.get_user_weight_records(self.session, 1)
+        self.assertEqual(len(self.cache), 0)
+        self.session.commit()
+        self.cached.get_user_weight_records(self.session, 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_ttl_and_budget(self):
+        cache = QueryCache(
+            max_entries=2, max_bytes=10000, ttl_seconds=5, clock=self.clock
+        )
+        cache.set("a", 1, {"t"})
+        cache.set("b", 2, {"t"})
+        cache.get("a")
+        cache.set("c", 3, {"t"})
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("a"), (True, 1))
+        self.assertEqual(cache.evictions, 1)
+
+        self.clock.now = 6
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.expirations, 1)
+
+        cache.set("big", "x" * 20000, {"t"})
+        self.assertEqual(cache.get("big"), (False, None))
+        cache.max_entries = 100
+        for index in range(20):
+            cache.set(index, "x" * 900, {"t"})
+        self.assertLessEqual(cache.size, 10000)
+
+    def test_sessions_without_hooks_bypass_the_cache(self):
+        session = sessionmaker(bind=self.engine)()
+        try:
+            self.cached.get_user_weight_records(session, 1)
+            self.assertEqual(len(self.cache), 0)
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,248 @@
+# tests/test_downsampling.py
+
+import random
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app.downsampling import (
+    TIERS,
+    catch_up_heart_rate_tiers,
+    get_user_heart_rate_series,
+    get_user_heart_rate_stats,
+    prune_heart_rate_data,
+    rebuild_heart_rate_tiers,
+    select_tier,
+)
+from app.ingest import ingest_heart_rates
+from app.models.tables import (
+    Base,
+    DownsampleState,
+    HeartRateLog,
+    User,
+    WorkoutLog,
+)
+
+START = datetime(2024, 3, 1)
+
+
+class DownsamplingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.rng = random.Random(4)
+        self.session.add_all(
+            [User(id=user_id, username=f"user{user_id}") for user_id in (1, 2)]
+        )
+        self.session.add(WorkoutLog(id=1, user_id=1, date=START.date(), duration=30))
+        self.add_samples(2000)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def add_samples(self, count, days=3):
+        for _ in range(count):
+            self.session.add(
+                HeartRateLog(
+                    user_id=self.rng.choice([1, 2]),
+                    time_recorded=START
+                    + timedelta(seconds=self.rng.uniform(0, days * 86400)),
+                    heart_rate=self.rng.randint(40, 190),
+                )
+            )
+
+    def raw_stats(self, user_id, start_time, end_time):
+        rates = [
+            rate
+            for rate, in self.session.execute(
+                select(HeartRateLog.heart_rate).where(
+                    HeartRateLog.user_id == user_id,
+                    HeartRateLog.time_recorded >= start_time,
+                    HeartRateLog.time_recorded < end_time,
+                )
+            )
+        ]
+        if not rates:
+            return (None, None, None, 0)
+        return (min(rates), max(rates), sum(rates) / len(rates), len(rates))
+
+    def tier_rows(self, tier):
+        table = tier.model.__table__
+        columns = [
+            "user_id",
+            "bucket",
+            "min_heart_rate",
+            "max_heart_rate",
+            "heart_rate_sum",
+            "heart_rate_count",
+        ]
+        rows = self.session.execute(select(*[table.c[name] for name in columns]))
+        return set(rows.all())
+
+    def expected_tier_rows(self, tier):
+        buckets = defaultdict(list)
+        for log in self.session.scalars(select(HeartRateLog)):
+            buckets_since = (log.time_recorded - datetime.min) // tier.width
+            bucket = datetime.min + buckets_since * tier.width
+            buckets[(log.user_id, bucket)].append(log.heart_rate)
+        return {
+            (user_id, bucket, min(rates), max(rates), sum(rates), len(rates))
+            for (user_id, bucket), rates in buckets.items()
+        }
+
+    def test_tiers_match_the_raw_samples(self):
+        self.assertEqual(catch_up_heart_rate_tiers(self.session, batch_size=300), 2000)
+        for tier in TIERS:
+            self.assertEqual(self.tier_rows(tier), self.expected_tier_rows(tier))
+
+        # Later samples, some falling into buckets that already exist
+        self.add_samples(500, days=4)
+        self.session.commit()
+        self.assertEqual(catch_up_heart_rate_tiers(self.session), 500)
+        self.assertEqual(catch_up_heart_rate_tiers(self.session), 0)
+        incremental = [self.tier_rows(tier) for tier in TIERS]
+        for tier, rows in zip(TIERS, incremental):
+            self.assertEqual(rows, self.expected_tier_rows(tier))
+
+        self.assertEqual(rebuild_heart_rate_tiers(self.session), 2500)
+        self.assertEqual([self.tier_rows(tier) for tier in TIERS], incremental)
+
+    def test_stats_over_any_range_match_the_raw_samples(self):
+        catch_up_heart_rate_tiers(self.session)
+        ranges = [
+            (START, START + timedelta(days=3)),
+            (START + timedelta(hours=5), START + timedelta(days=2, minutes=7)),
+            (START + timedelta(seconds=1234.5), START + timedelta(seconds=98765.25)),
+            (START + timedelta(minutes=3), START + timedelta(minutes=3, seconds=30)),
+            (START, START),
+        ]
+        for _ in range(20):
+            start_time = START + timedelta(seconds=self.rng.uniform(0, 3 * 86400))
+            end_time = start_time + timedelta(seconds=self.rng.uniform(0, 86400 * 2))
+            ranges.append((start_time, end_time))
+        for user_id in (1, 2):
+            for start_time, end_time in ranges:
+                stats = get_user_heart_rate_stats(
+                    self.session, user_id, start_time, end_time
+                )
+                expected = self.raw_stats(user_id, start_time, end_time)
+                self.assertEqual(stats[:2], expected[:2])
+                self.assertEqual(stats.count, expected[3])
+                if expected[2] is not None:
+                    self.assertAlmostEqual(stats.avg_heart_rate, expected[2])
+
+    def test_series_reads_the_finest_tier_within_max_points(self):
+        catch_up_heart_rate_tiers(self.session)
+        end_time = START + timedelta(days=3)
+        for max_points, name in [(5000, "minute"), (100, "hour"), (10, "day")]:
+            tier = select_tier(self.session, START, end_time, max_points)
+            self.assertEqual(tier.name, name)
+
+        series = get_user_heart_rate_series(self.session, 1, START, end_time, 100)
+        self.assertLessEqual(len(series), 72)
+        self.assertEqual(
+            sum(bucket.count for bucket in series),
+            self.raw_stats(1, START, end_time)[3],
+        )
+        for bucket in series:
+            expected = self.raw_stats(
+                1, bucket.bucket, bucket.bucket + timedelta(hours=1)
+            )
+            self.assertEqual(
+                (bucket.min_heart_rate, bucket.max_heart_rate, bucket.count),
+                (expected[0], expected[1], expected[3]),
+            )
+            self.assertAlmostEqual(bucket.avg_heart_rate, expected[2])
+
+    def test_retention_keeps_the_history_in_coarser_tiers(self):
+        self.session.add(
+            HeartRateLog(
+                user_id=1, workout_log_id=1, time_recorded=START, heart_rate=150
+            )
+        )
+        self.session.commit()
+        catch_up_heart_rate_tiers(self.session)
+        whole_range = (START, START + timedelta(days=3))
+        before = get_user_heart_rate_stats(self.session, 1, *whole_range)
+
+        now = START + timedelta(days=4)
+        deleted = prune_heart_rate_data(
+            self.session,
+            retention={"raw": timedelta(days=2), "minute": timedelta(days=3)},
+            now=now,
+        )
+        cutoff = now - timedelta(days=2)
+        remaining = self.session.execute(
+            select(func.count()).where(
+                HeartRateLog.time_recorded < cutoff,
+                HeartRateLog.workout_log_id.is_(None),
+            )
+        ).scalar()
+        self.assertEqual(remaining, 0)
+        self.assertGreater(deleted["raw"], 0)
+        self.assertGreater(deleted["minute"], 0)
+        self.assertNotIn("hour", deleted)
+        # The workout sample is kept
+        self.assertEqual(self.raw_stats(1, START, START + timedelta(seconds=1))[3], 1)
+
+        after = get_user_heart_rate_stats(self.session, 1, *whole_range)
+        self.assertEqual(after[:2], before[:2])
+        self.assertEqual(after.count, before.count)
+        # The pruned minute tier is no longer picked for those days
+        tier = select_tier(self.session, START, START + timedelta(hours=2), 5000)
+        self.assertEqual(tier.name, "hour")
+
+    def test_ingest_updates_the_tiers(self):
+        catch_up_heart_rate_tiers(self.session)
+        samples = [
+            {
+                "user_id": 2,
+                "time_recorded": START + timedelta(days=5, seconds=i),
+                "heart_rate": 60 + i,
+            }
+            for i in range(10)
+        ]
+        report = ingest_heart_rates(self.session, samples)
+        self.assertEqual(report.inserted, 10)
+        series = get_user_heart_rate_series(
+            self.session, 2, START + timedelta(days=5), START + timedelta(days=6), 10
+        )
+        self.assertEqual(
+            [tuple(bucket) for bucket in series],
+            [(START + timedelta(days=5), 60, 69, 64.5, 10)],
+        )
+
+    def test_ingest_leaves_a_backlog_to_catch_up(self):
+        catch_up_heart_rate_tiers(self.session)
+        # Samples written through the ORM wait for the next catch-up
+        self.add_samples(300)
+        self.session.commit()
+        sample = {"user_id": 1, "time_recorded": START, "heart_rate": 200}
+        for second in range(3):
+            sample["time_recorded"] = START + timedelta(days=5, seconds=second)
+            ingest_heart_rates(self.session, [dict(sample)])
+        # Each ingest rolled in one id of the backlog, none of its own sample
+        pending = self.session.execute(
+            select(func.count()).where(HeartRateLog.id > _watermark(self.session))
+        ).scalar()
+        self.assertEqual(pending, 300)
+
+        self.assertEqual(catch_up_heart_rate_tiers(self.session), 300)
+        for tier in TIERS:
+            self.assertEqual(self.tier_rows(tier), self.expected_tier_rows(tier))
+
+
+def _watermark(session):
+    return session.execute(
+        select(DownsampleState.last_id).where(
+            DownsampleState.source == HeartRateLog.__tablename__
+        )
+    ).scalar()
+
+
+if __name__ == "__main__":
+    unittest.main()
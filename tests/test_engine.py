@@ -0,0 +1,106 @@
+# tests/test_engine.py
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, User
+from app.engine import (
+    PROFILES,
+    create_app_engine,
+    get_active_pragmas,
+    resolve_settings,
+)
+
+
+class EngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'test.db')}"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_default_profile_pragmas_are_active(self):
+        engine = create_app_engine(self.url)
+        try:
+            with engine.connect() as connection:
+                active = get_active_pragmas(connection)
+        finally:
+            engine.dispose()
+        self.assertEqual(
+            active,
+            {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "cache_size": -64000,
+                "mmap_size": 268435456,
+                "temp_store": "MEMORY",
+                "busy_timeout": 5000,
+                "foreign_keys": 0,
+            },
+        )
+        self.assertEqual(engine.pool.size(), PROFILES["default"]["pool"]["pool_size"])
+
+    def test_bulk_load_profile_and_overrides(self):
+        engine = create_app_engine(
+            self.url, profile="bulk_load", pragmas={"cache_size": -1000}
+        )
+        try:
+            Base.metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+            session.add(User(username="bulk", age=30, email="bulk@example.com"))
+            session.commit()
+            active = get_active_pragmas(session)
+            session.close()
+        finally:
+            engine.dispose()
+        self.assertEqual(active["synchronous"], "OFF")
+        self.assertEqual(active["cache_size"], -1000)
+        self.assertEqual(active["journal_mode"], "WAL")
+
+    def test_environment_configuration(self):
+        environ = {
+            "HEALTH_APP_DATABASE_URL": self.url,
+            "HEALTH_APP_DB_PROFILE": "bulk_load",
+            "HEALTH_APP_PRAGMA_SYNCHRONOUS": "FULL",
+            "HEALTH_APP_PRAGMA_BUSY_TIMEOUT": "250",
+        }
+        url, pragmas, pool = resolve_settings(environ=environ)
+        self.assertEqual(url, self.url)
+        self.assertEqual(pragmas["synchronous"], "FULL")
+        self.assertEqual(pragmas["busy_timeout"], 250)
+        self.assertEqual(pool, PROFILES["bulk_load"]["pool"])
+
+        with mock.patch.dict(os.environ, environ):
+            engine = create_app_engine()
+        try:
+            with engine.connect() as connection:
+                active = get_active_pragmas(connection)
+        finally:
+            engine.dispose()
+        self.assertEqual((active["synchronous"], active["busy_timeout"]), ("FULL", 250))
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            resolve_settings(self.url, profile="fastest", environ={})
+        with self.assertRaises(ValueError):
+            resolve_settings(self.url, pragmas={"page_size": 4096}, environ={})
+        with self.assertRaises(ValueError):
+            resolve_settings(self.url, pragmas={"synchronous": "OFF; --"}, environ={})
+
+    def test_in_memory_database(self):
+        for url in ("sqlite:///:memory:", "sqlite://"):
+            engine = create_app_engine(url)
+            try:
+                with engine.connect() as connection:
+                    active = get_active_pragmas(connection)
+            finally:
+                engine.dispose()
+            self.assertEqual(active["journal_mode"], "MEMORY")
+            self.assertEqual(active["temp_store"], "MEMORY")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+# tests/test_export.py
+
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+from app.engine import create_app_engine
+from app.models.tables import Base, HeartRateLog, User, UserFitnessGoal, WorkoutLog
+from app.populate_db import bulk_populate_database
+from app.export import (
+    EXPORT_TABLES,
+    export_database,
+    export_path,
+    export_statement,
+    export_user,
+    stream_table,
+)
+
+
+def read_jsonl(path, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+        shutil.rmtree(self.directory)
+
+    def populate(self, num_users, num_logs_per_user):
+        bulk_populate_database(
+            self.session,
+            num_users=num_users,
+            num_logs_per_user=num_logs_per_user,
+            vectorized=True,
+            seed=6,
+        )
+
+    def test_every_user_table_is_exported(self):
+        self.populate(3, 4)
+        counts = export_user(self.session, 2, self.directory)
+        self.assertEqual(
+            set(counts),
+            {
+                "users",
+                "height_logs",
+                "weight_logs",
+                "workout_logs",
+                "nutrition_logs",
+                "sleep_logs",
+                "health_metrics",
+                "water_intake_logs",
+                "heart_rate_logs",
+                "user_fitness_goals",
+            },
+        )
+        for table in EXPORT_TABLES:
+            rows = read_jsonl(export_path(self.directory, table, "jsonl", False))
+            self.assertEqual(len(rows), counts[table.name])
+            user_ids = {
+                row["id" if table.name == "users" else "user_id"] for row in rows
+            }
+            self.assertEqual(user_ids, {2})
+
+        workouts = read_jsonl(
+            export_path(self.directory, WorkoutLog.__table__, "jsonl", False)
+        )
+        expected = (
+            self.session.query(WorkoutLog)
+            .filter_by(user_id=2)
+            .order_by(WorkoutLog.date, WorkoutLog.duration, WorkoutLog.id)
+            .all()
+        )
+        self.assertEqual([row["id"] for row in workouts], [log.id for log in expected])
+        self.assertEqual(workouts[0]["date"], expected[0].date.isoformat())
+        self.assertEqual(workouts[0]["duration"], expected[0].duration)
+
+    def test_gzipped_csv(self):
+        self.populate(2, 3)
+        counts = export_user(self.session, 1, self.directory, "csv", compress=True)
+        for table in EXPORT_TABLES:
+            path = export_path(self.directory, table, "csv", True)
+            self.assertTrue(path.endswith(".csv.gz"))
+            with gzip.open(path, "rt", encoding="utf-8", newline="") as file:
+                rows = list(csv.DictReader(file))
+            self.assertEqual(len(rows), counts[table.name])
+            if rows:
+                self.assertEqual(list(rows[0]), [column.name for column in table.c])
+
+        # JSON columns are written as JSON text
+        goals = export_path(self.directory, UserFitnessGoal.__table__, "csv", True)
+        with gzip.open(goals, "rt", encoding="utf-8", newline="") as file:
+            targets = [json.loads(row["target"]) for row in csv.DictReader(file)]
+        self.assertEqual(
+            targets,
+            [
+                goal.target
+                for goal in self.session.query(UserFitnessGoal)
+                .filter_by(user_id=1)
+                .order_by(UserFitnessGoal.id)
+            ],
+        )
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_user(self.session, 1, self.directory, "xml")
+
+    def test_rows_come_out_of_an_index_without_sorting(self):
+        for table in EXPORT_TABLES:
+            user_column = table.c.id if table is User.__table__ else table.c.user_id
+            for where in (user_column == 1, user_column.between(1, 5)):
+                statement = export_statement(table, where).compile(
+                    self.engine, compile_kwargs={"literal_binds": True}
+                )
+                plan = [
+                    row[-1]
+                    for row in self.session.execute(
+                        text(f"EXPLAIN QUERY PLAN {statement}")
+                    )
+                ]
+                self.assertTrue(all(detail.startswith("SEARCH") for detail in plan))
+                self.assertFalse(any("TEMP B-TREE" in detail for detail in plan))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc")
+    def test_memory_does_not_grow_with_the_history(self):
+        # The app engine keeps temporary tables and sorts in memory, where
+        # SQLite's allocations only show up in the resident set size
+        engine = create_app_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        connection = engine.connect()
+        start = datetime(2024, 1, 1)
+        connection.execute(
+            insert(HeartRateLog),
+            [
+                {
+                    "user_id": 1,
+                    "time_recorded": start + timedelta(seconds=i * 7919 % 200000),
+                    "heart_rate": 60,
+                }
+                for i in range(200000)
+            ]
+            + [{"user_id": 2, "time_recorded": start, "heart_rate": 60}],
+        )
+
+        def resident_bytes():
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+        def growth(user_id):
+            before = resident_bytes()
+            peak = 0
+            for _ in stream_table(
+                connection, HeartRateLog.__table__, HeartRateLog.user_id == user_id
+            ):
+                peak = max(peak, resident_bytes() - before)
+            return peak
+
+        try:
+            growth(2)  # warms up the compiled statement caches
+            short_history, long_history = growth(2), growth(1)
+        finally:
+            connection.close()
+            engine.dispose()
+        # Sorting the 200,000 rows would take several MB
+        self.assertLess(long_history, short_history + 1024 * 1024)
+
+
+class ExportDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self.directory, 'app.db')}"
+        )
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        bulk_populate_database(
+            self.session, num_users=7, num_logs_per_user=3, vectorized=True, seed=6
+        )
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_parts_cover_every_user_once(self):
+        output = os.path.join(self.directory, "export")
+        counts = export_database(self.session, output, num_workers=3)
+        users = []
+        for part in range(3):
+            users += read_jsonl(
+                export_path(output, User.__table__, "jsonl", False, part)
+            )
+        self.assertEqual(sorted(user["id"] for user in users), list(range(1, 8)))
+        self.assertEqual(
+            counts["workout_logs"],
+            self.session.execute(select(func.count(WorkoutLog.id))).scalar(),
+        )
+
+    def test_requires_a_file_database(self):
+        engine = create_engine("sqlite:///:memory:")
+        session = sessionmaker(bind=engine)()
+        try:
+            with self.assertRaises(ValueError):
+                export_database(session, self.directory)
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+# tests/test_fanout.py
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.engine import create_app_engine
+from app.fanout import ConcurrentQueries, get_user_dashboard
+from app.models.tables import Base
+from app.populate_db import bulk_populate_database
+from app.queries import get_user_summary
+from app.rollups import rebuild_daily_user_stats
+
+# Counts for minutes unless it is interrupted
+ENDLESS_QUERY = text(
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+    "SELECT count(*) FROM n"
+)
+
+
+def sleeping_call(session, seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def endless_call(session):
+    return session.execute(ENDLESS_QUERY).scalar()
+
+
+def failing_call(session):
+    raise ValueError("broken query")
+
+
+class ConcurrentQueriesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.engine = create_app_engine(
+            f"sqlite:///{os.path.join(cls.directory, 'app.db')}"
+        )
+        Base.metadata.create_all(cls.engine)
+        cls.Session = sessionmaker(bind=cls.engine)
+        with cls.Session() as session:
+            bulk_populate_database(
+                session, num_users=5, num_logs_per_user=20, vectorized=True, seed=8
+            )
+            rebuild_daily_user_stats(session)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.fanout = ConcurrentQueries(self.Session, max_workers=4)
+
+    def tearDown(self):
+        self.fanout.close()
+
+    def test_dashboard_matches_the_summary_query(self):
+        with self.Session() as session:
+            for user_id in [1, 3]:
+                expected = get_user_summary(
+                    session, user_id, "2000-01-01", "2100-01-01", "2020-01-01"
+                )
+                for use_rollup in [False, True]:
+                    dashboard = get_user_dashboard(
+                        self.fanout,
+                        user_id,
+                        "2000-01-01",
+                        "2100-01-01",
+                        "2020-01-01",
+                        use_rollup=use_rollup,
+                        timeout=10,
+                    )
+                    for field in ["weight_records", "recent_blood_pressure"]:
+                        records = getattr(dashboard, field)
+                        expected_records = getattr(expected, field)
+                        self.assertEqual(records, expected_records)
+                        self.assertEqual(
+                            [type(record) for record in records],
+                            [type(record) for record in expected_records],
+                        )
+                        self.assertTrue(expected_records)
+                    self.assertAlmostEqual(
+                        dashboard.avg_daily_caloric_intake,
+                        expected.avg_daily_caloric_intake,
+                    )
+                    self.assertEqual(
+                        dashboard.total_workout_duration,
+                        expected.total_workout_duration,
+                    )
+
+    def test_wall_time_is_the_slowest_call(self):
+        calls = {name: (sleeping_call, 0.2, name) for name in "abcd"}
+        started = time.perf_counter()
+        results = self.fanout.run(calls, timeout=5)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(results, {name: name for name in "abcd"})
+        self.assertLess(elapsed, 0.6)
+
+    def test_timeout_interrupts_running_queries(self):
+        request = self.fanout.start(
+            {
+                "endless": (endless_call,),
+                "quick": (sleeping_call, 0, 1),
+            }
+        )
+        started = time.perf_counter()
+        with self.assertRaisesRegex(TimeoutError, "endless"):
+            request.result(timeout=0.2)
+        future = request._futures["endless"]
+        with self.assertRaises(OperationalError):
+            future.result(timeout=5)
+        self.assertLess(time.perf_counter() - started, 5)
+        # The pool and its connections are usable again
+        self.assertEqual(
+            self.fanout.run({"quick": (sleeping_call, 0, 2)}), {"quick": 2}
+        )
+
+    def test_first_error_cancels_the_rest(self):
+        fanout = ConcurrentQueries(self.Session, max_workers=1)
+        try:
+            request = fanout.start(
+                {
+                    "broken": (failing_call,),
+                    "queued": (sleeping_call, 0, 1),
+                }
+            )
+            with self.assertRaisesRegex(ValueError, "broken query"):
+                request.result(timeout=5)
+            # Never started, or started and saw the cancellation
+            self.assertTrue(request._calls["queued"].cancelled)
+        finally:
+            fanout.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# tests/test_fast_reads.py
+
+import tracemalloc
+import unittest
+from datetime import date, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, HealthMetrics, HeartRateLog, WeightLog
+from app.populate_db import bulk_populate_database
+from app import fast_reads, queries
+
+
+class FastReadsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+        bulk_populate_database(
+            self.session, num_users=3, num_logs_per_user=300, vectorized=True, seed=4
+        )
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def orm_weight_records(self, user_id):
+        return [
+            (log.date_recorded, log.weight)
+            for log in self.session.query(WeightLog)
+            .filter_by(user_id=user_id)
+            .order_by(WeightLog.date_recorded)
+        ]
+
+    def test_tuples_match_the_orm_path(self):
+        for user_id in [1, 2, 3]:
+            records = fast_reads.get_user_weight_records(self.session, user_id)
+            self.assertEqual(records, self.orm_weight_records(user_id))
+            self.assertEqual(
+                records,
+                [
+                    tuple(row)
+                    for row in queries.get_user_weight_records(self.session, user_id)
+                ],
+            )
+            self.assertIs(type(records[0]), tuple)
+            self.assertEqual(
+                fast_reads.get_user_recent_blood_pressure(self.session, user_id, 7),
+                [
+                    tuple(row)
+                    for row in queries.get_user_recent_blood_pressure(
+                        self.session, user_id, 7
+                    )
+                ],
+            )
+
+    def test_rows_without_a_date(self):
+        self.session.add(WeightLog(user_id=1, weight=70.5))
+        self.session.add(HealthMetrics(user_id=1, blood_pressure="120/80"))
+        self.session.commit()
+        records = fast_reads.get_user_weight_records(self.session, 1)
+        self.assertIn((None, 70.5), records)
+        self.assertEqual(records, self.orm_weight_records(1))
+        readings = fast_reads.get_user_recent_blood_pressure(self.session, 1, 1000)
+        self.assertIn((None, "120/80"), readings)
+        self.assertEqual(
+            readings,
+            [
+                tuple(row)
+                for row in queries.get_user_recent_blood_pressure(self.session, 1, 1000)
+            ],
+        )
+
+    def test_series_match_the_orm_path(self):
+        for user_id in [1, 2, 3]:
+            series = fast_reads.get_user_weight_series(self.session, user_id)
+            self.assertEqual(series.days.typecode, "l")
+            self.assertEqual(series.weights.typecode, "d")
+            self.assertEqual(
+                [(date.fromordinal(day), weight) for day, weight in zip(*series)],
+                self.orm_weight_records(user_id),
+            )
+
+            heart_rate = fast_reads.get_user_heart_rate_series(self.session, user_id)
+            logs = (
+                self.session.query(HeartRateLog)
+                .filter_by(user_id=user_id)
+                .order_by(HeartRateLog.time_recorded)
+                .all()
+            )
+            self.assertEqual(
+                list(heart_rate.heart_rates), [log.heart_rate for log in logs]
+            )
+            for seconds, log in zip(heart_rate.times, logs):
+                expected = log.time_recorded.replace(tzinfo=timezone.utc).timestamp()
+                self.assertAlmostEqual(seconds, expected, delta=0.002)
+
+    def test_pending_changes_are_visible(self):
+        self.session.add(
+            WeightLog(user_id=1, date_recorded=date(2030, 1, 1), weight=1.5)
+        )
+        series = fast_reads.get_user_weight_series(self.session, 1)
+        self.assertEqual(
+            (series.days[-1], series.weights[-1]), (date(2030, 1, 1).toordinal(), 1.5)
+        )
+
+    def test_series_use_less_memory_than_orm_rows(self):
+        def peak(function):
+            self.session.expunge_all()
+            tracemalloc.start()
+            try:
+                result = function()
+                return tracemalloc.get_traced_memory()[1], result
+            finally:
+                tracemalloc.stop()
+
+        orm_peak, _ = peak(
+            lambda: self.session.query(WeightLog).filter_by(user_id=1).all()
+        )
+        series_peak, _ = peak(
+            lambda: fast_reads.get_user_weight_series(self.session, 1)
+        )
+        self.assertLess(series_peak * 4, orm_peak)
+
+
+if __name__ == "__main__":
+    unittest.main()
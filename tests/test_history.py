@@ -0,0 +1,128 @@
+# tests/test_history.py
+
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, tuple_
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, WeightLog
+from app.populate_db import bulk_populate_database
+from app.history import (
+    HISTORY_SOURCES,
+    decode_cursor,
+    get_history_page,
+    iter_history,
+    _history_statement,
+)
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+        bulk_populate_database(
+            self.session, num_users=3, num_logs_per_user=25, vectorized=True, seed=5
+        )
+        # Several rows on the same day, so pages must break ties on the id
+        self.session.add_all(
+            WeightLog(user_id=1, date_recorded=date(2022, 6, 1), weight=60 + index)
+            for index in range(5)
+        )
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def expected(self, history, user_id, newest_first):
+        model, key_column = HISTORY_SOURCES[history]
+        rows = self.session.query(model).filter_by(user_id=user_id).all()
+        rows = [row for row in rows if getattr(row, key_column.key) is not None]
+        rows.sort(
+            key=lambda row: (getattr(row, key_column.key), row.id),
+            reverse=newest_first,
+        )
+        return [row.id for row in rows]
+
+    def test_pages_cover_the_history_in_order(self):
+        for history in HISTORY_SOURCES:
+            for newest_first in [False, True]:
+                with self.subTest(history=history, newest_first=newest_first):
+                    ids, cursor = [], None
+                    while True:
+                        page = get_history_page(
+                            self.session,
+                            history,
+                            1,
+                            cursor,
+                            page_size=4,
+                            newest_first=newest_first,
+                        )
+                        self.assertLessEqual(len(page.rows), 4)
+                        ids.extend(row.id for row in page.rows)
+                        if page.next_cursor is None:
+                            break
+                        cursor = page.next_cursor
+                    self.assertEqual(ids, self.expected(history, 1, newest_first))
+
+    def test_stream_matches_the_pages(self):
+        for history in HISTORY_SOURCES:
+            for newest_first in [False, True]:
+                rows = list(
+                    iter_history(self.session, history, 1, newest_first, batch_size=3)
+                )
+                self.assertEqual(
+                    [row.id for row in rows],
+                    self.expected(history, 1, newest_first),
+                )
+
+    def test_rows_inserted_meanwhile_do_not_shift_pages(self):
+        first = get_history_page(self.session, "weight", 1, page_size=10)
+        self.session.add(
+            WeightLog(user_id=1, date_recorded=date(1900, 1, 1), weight=50)
+        )
+        self.session.commit()
+        second = get_history_page(
+            self.session, "weight", 1, first.next_cursor, page_size=10
+        )
+        self.assertEqual(
+            [row.id for row in first.rows + second.rows],
+            self.expected("weight", 1, False)[1:21],
+        )
+
+    def test_invalid_cursors(self):
+        cursor = get_history_page(self.session, "weight", 1, page_size=2).next_cursor
+        for bad, history, newest_first in [
+            ("not a cursor", "weight", False),
+            ("bm90IGpzb24", "weight", False),
+            (cursor, "water", False),
+            (cursor, "weight", True),
+        ]:
+            with self.assertRaises(ValueError):
+                get_history_page(self.session, history, 1, bad, 2, newest_first)
+        with self.assertRaises(ValueError):
+            get_history_page(self.session, "steps", 1)
+
+    def test_pages_seek_the_user_index(self):
+        connection = self.session.connection()
+        for history in HISTORY_SOURCES:
+            cursor = get_history_page(self.session, history, 1, page_size=2).next_cursor
+            statement, key, row_id = _history_statement(history, 1, False)
+            after = tuple_(*decode_cursor(cursor, history, False))
+            statement = statement.where(tuple_(key, row_id) > after).limit(3)
+            compiled = statement.compile(dialect=connection.dialect)
+            values = compiled.construct_params()
+            plan = connection.exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + compiled.string,
+                tuple(values[name] for name in compiled.positiontup),
+            ).fetchall()
+            details = [row[-1] for row in plan]
+            self.assertTrue(details[0].startswith("SEARCH"), details)
+            self.assertIn(f"{key.name}>?", details[0])
+            # At most a sort of the rows sharing a date, never of the history
+            self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", details)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+# tests/test_ingest.py
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, DailyUserStats, HeartRateLog, WorkoutLog
+from app.populate_db import bulk_populate_database
+from app.rollups import STAT_COLUMNS, rebuild_daily_user_stats
+from app.ingest import (
+    ingest_heart_rates,
+    ingest_jsonl,
+    ingest_water_intakes,
+)
+
+
+class IngestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        bulk_populate_database(
+            self.session, num_users=3, num_logs_per_user=5, vectorized=True, seed=7
+        )
+        rebuild_daily_user_stats(self.session)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def heart_rate_count(self, user_id):
+        return self.session.execute(
+            select(func.count()).where(HeartRateLog.user_id == user_id)
+        ).scalar()
+
+    def rollup(self):
+        columns = [DailyUserStats.user_id, DailyUserStats.day] + [
+            DailyUserStats.__table__.c[column] for column in STAT_COLUMNS
+        ]
+        return sorted(self.session.execute(select(*columns)).all())
+
+    def assert_rollup_is_current(self):
+        maintained = self.rollup()
+        rebuild_daily_user_stats(self.session)
+        self.assertEqual(maintained, self.rollup())
+
+    def test_heart_rates_are_deduplicated(self):
+        before = self.heart_rate_count(1)
+        samples = [
+            {"user_id": 1, "time_recorded": "2030-01-01T10:00:00", "heart_rate": 70},
+            {"user_id": 1, "time_recorded": "2030-01-01T10:00:05", "heart_rate": 72},
+            # The same instant as the first sample, as epoch seconds and as UTC
+            {
+                "user_id": 1,
+                "time_recorded": datetime(
+                    2030, 1, 1, 10, tzinfo=timezone.utc
+                ).timestamp(),
+                "heart_rate": 70,
+            },
+            {"user_id": 1, "time_recorded": "2030-01-01T10:00:00Z", "heart_rate": 70},
+            # Another user may record at the same time
+            {"user_id": 2, "time_recorded": "2030-01-01T10:00:00", "heart_rate": 90},
+        ]
+        report = ingest_heart_rates(self.session, samples)
+        self.assertEqual(
+            (report.received, report.inserted, report.duplicates, report.rejected),
+            (5, 3, 2, 0),
+        )
+        self.assertEqual(self.heart_rate_count(1), before + 2)
+        self.assertGreater(report.rows_per_second, 0)
+
+        report = ingest_heart_rates(self.session, samples)
+        self.assertEqual((report.inserted, report.duplicates), (0, 5))
+        stored = self.session.execute(
+            select(HeartRateLog.time_recorded)
+            .where(HeartRateLog.user_id == 1)
+            .order_by(HeartRateLog.time_recorded.desc())
+        ).scalars()
+        self.assertEqual(next(stored), datetime(2030, 1, 1, 10, 0, 5))
+        self.assert_rollup_is_current()
+
+        # The last row of the batch is skipped, the new one before it counts
+        report = ingest_heart_rates(
+            self.session,
+            [
+                {
+                    "user_id": 1,
+                    "time_recorded": "2030-01-01T10:00:10",
+                    "heart_rate": 80,
+                },
+                samples[1],
+            ],
+        )
+        self.assertEqual((report.inserted, report.duplicates), (1, 1))
+        self.assert_rollup_is_current()
+
+        # The database enforces it for other writers too
+        self.session.add(
+            HeartRateLog(
+                user_id=2, time_recorded=datetime(2030, 1, 1, 10), heart_rate=91
+            )
+        )
+        with self.assertRaises(IntegrityError):
+            self.session.commit()
+        self.session.rollback()
+
+    def test_invalid_samples_are_rejected(self):
+        other_workout = self.session.execute(
+            select(WorkoutLog.id).where(WorkoutLog.user_id == 2)
+        ).scalar()
+        own_workout = self.session.execute(
+            select(WorkoutLog.id).where(WorkoutLog.user_id == 1)
+        ).scalar()
+        samples = [
+            {"user_id": 1, "heart_rate": 70},
+            {"user_id": "1", "time_recorded": "2030-01-01", "heart_rate": 70},
+            {"user_id": 1, "time_recorded": "yesterday", "heart_rate": 70},
+            {"user_id": 1, "time_recorded": "2030-01-01", "heart_rate": 500},
+            {"user_id": 99, "time_recorded": "2030-01-01", "heart_rate": 70},
+            {
+                "user_id": 1,
+                "time_recorded": "2030-01-01",
+                "heart_rate": 70,
+                "workout_log_id": other_workout,
+            },
+            {
+                "user_id": 1,
+                "time_recorded": "2030-01-02",
+                "heart_rate": 130,
+                "workout_log_id": own_workout,
+            },
+        ]
+        report = ingest_heart_rates(self.session, samples)
+        self.assertEqual((report.inserted, report.rejected), (1, 6))
+        self.assertEqual(
+            [position for position, _ in report.errors], [0, 1, 2, 3, 4, 5]
+        )
+        self.assertIn("unknown user_id 99", report.errors[4][1])
+        self.assert_rollup_is_current()
+
+        report = ingest_water_intakes(
+            self.session,
+            [
+                {"user_id": 1, "date": "2030-01-01", "water_intake": 0},
+                {"user_id": 1, "date": "01/02/2030", "water_intake": 250},
+                {"user_id": 1, "date": date(2030, 1, 1), "water_intake": 250.5},
+            ],
+        )
+        self.assertEqual((report.inserted, report.rejected), (0, 3))
+
+    def test_water_intakes_update_the_rollup(self):
+        samples = [
+            {"user_id": 3, "date": "2030-01-01", "water_intake": 250},
+            {"user_id": 3, "date": "2030-01-01", "water_intake": 250},
+            {"user_id": 3, "date": date(2030, 1, 2), "water_intake": 500},
+        ]
+        report = ingest_water_intakes(self.session, samples, chunk_size=2)
+        self.assertEqual((report.inserted, report.duplicates), (3, 0))
+        water = self.session.execute(
+            select(DailyUserStats.water_intake).where(
+                DailyUserStats.user_id == 3, DailyUserStats.day == date(2030, 1, 1)
+            )
+        ).scalar()
+        self.assertEqual(water, 500)
+        self.assert_rollup_is_current()
+
+    def test_gzipped_jsonl_in_batches(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "samples.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            for second in range(10):
+                sample = {
+                    "user_id": 2,
+                    "time_recorded": f"2030-01-01T08:00:{second:02d}",
+                    "heart_rate": 60 + second,
+                }
+                file.write(json.dumps(sample) + "\n")
+            file.write("{not json\n")
+            file.write("\n")
+            file.write(json.dumps({"user_id": 2, "heart_rate": 60}) + "\n")
+            file.write(json.dumps(sample) + "\n")
+
+        before = self.heart_rate_count(2)
+        report = ingest_jsonl(self.session, path, "heart_rate", batch_size=3)
+        self.assertEqual(
+            (report.received, report.inserted, report.duplicates, report.rejected),
+            (13, 10, 1, 2),
+        )
+        self.assertEqual(
+            report.errors, [(11, "malformed JSON"), (13, "missing time_recorded")]
+        )
+        self.assertEqual(self.heart_rate_count(2), before + 10)
+        self.assert_rollup_is_current()
+
+    def test_unknown_jsonl_kind(self):
+        with self.assertRaises(ValueError):
+            ingest_jsonl(self.session, [], "steps")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# tests/test_instrumentation.py
+
+import threading
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, User
+from app.instrumentation import LatencyHistogram, profiling
+from app.populate_db import bulk_populate_database
+from app import queries
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+        for milliseconds in range(1, 101):
+            histogram.add(float(milliseconds), rows=2)
+        self.assertEqual(histogram.percentile(50), 50.0)
+        self.assertEqual(histogram.percentile(95), 95.0)
+        self.assertEqual(histogram.percentile(99), 99.0)
+        self.assertEqual(histogram.percentile(100), 100.0)
+        self.assertEqual(histogram.summary()["calls"], 100)
+        self.assertEqual(histogram.summary()["rows"], 200)
+
+    def test_memory_is_bounded(self):
+        histogram = LatencyHistogram(max_samples=1000)
+        for milliseconds in range(100000):
+            histogram.add(float(milliseconds % 100))
+        self.assertEqual(len(histogram.samples), 1000)
+        self.assertEqual(histogram.calls, 100000)
+        self.assertEqual(histogram.total, 4950000.0)
+        # Percentiles of the uniform 0-99 ms latencies, from the sample
+        self.assertAlmostEqual(histogram.percentile(50), 49, delta=5)
+        self.assertAlmostEqual(histogram.percentile(95), 94, delta=3)
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+        bulk_populate_database(
+            self.session, num_users=3, num_logs_per_user=4, vectorized=True, seed=1
+        )
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_query_functions_and_statements_are_timed(self):
+        original = queries.get_user_weight_records
+        with self.assertLogs("app.slow_queries", "WARNING") as logs:
+            with profiling(self.engine, queries, slow_query_ms=0) as stats:
+                for user_id in [1, 2, 3]:
+                    queries.get_user_weight_records(self.session, user_id)
+                queries.get_user_avg_sleep_duration(self.session, 1)
+                self.session.add(User(username="new", age=20, email="new@x.com"))
+                self.session.commit()
+
+        self.assertIs(queries.get_user_weight_records, original)
+        weight = stats.functions["get_user_weight_records"]
+        self.assertEqual(weight.calls, 3)
+        self.assertEqual(weight.rows, 12)
+        self.assertLessEqual(weight.percentile(50), weight.percentile(99))
+        self.assertEqual(stats.functions["get_user_avg_sleep_duration"].calls, 1)
+
+        selects = [
+            histogram
+            for statement, histogram in stats.statements.items()
+            if statement.startswith("SELECT weight_logs")
+        ]
+        self.assertEqual([histogram.calls for histogram in selects], [3])
+        self.assertIsNone(selects[0].rows)
+        inserts = [
+            histogram
+            for statement, histogram in stats.statements.items()
+            if statement.startswith("INSERT INTO users")
+        ]
+        self.assertEqual(inserts[0].rows, 1)
+
+        slow = stats.slow_queries[0]
+        self.assertEqual(slow["function"], "get_user_weight_records")
+        self.assertIn(1, slow["parameters"])
+        self.assertTrue(any("weight_logs" in detail for detail in slow["plan"]))
+        self.assertEqual(len(logs.records), len(stats.slow_queries))
+
+        table = stats.format_table()
+        self.assertIn("get_user_weight_records", table)
+        self.assertIn("p95 ms", table)
+
+    def test_slow_log_is_bounded(self):
+        rows = [(f"user{i}",) for i in range(500)]
+        with self.assertLogs("app.slow_queries", "WARNING") as logs:
+            with profiling(self.engine, slow_query_ms=0, max_slow_queries=3) as stats:
+                with self.engine.begin() as connection:
+                    connection.exec_driver_sql(
+                        "INSERT INTO users (username) VALUES (?)", rows
+                    )
+                    for user_id in range(10):
+                        queries.get_user_weight_records(self.session, user_id)
+
+        self.assertEqual(len(stats.slow_queries), 3)
+        self.assertEqual(stats.slow_query_count, 11)
+        self.assertIn("11 slow queries", stats.format_table())
+        self.assertEqual(len(logs.records), 11)
+        message = logs.records[0].getMessage()
+        self.assertIn("'rows': 500", message)
+        self.assertIn("'first': ('user0',)", message)
+        self.assertNotIn("user1'", message)
+
+    def test_concurrent_updates_are_counted(self):
+        with profiling(self.engine, slow_query_ms=None) as stats:
+            tracked = stats.track(lambda: None, "noop")
+            threads = [
+                threading.Thread(target=lambda: [tracked() for _ in range(5000)])
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(stats.functions["noop"].calls, 20000)
+        self.assertEqual(stats.functions["noop"].rows, 0)
+
+    def test_listeners_are_removed(self):
+        with profiling(self.engine, slow_query_ms=None) as stats:
+            queries.get_user_weight_records(self.session, 1)
+        queries.get_user_weight_records(self.session, 1)
+        self.assertEqual(sum(h.calls for h in stats.statements.values()), 1)
+        self.assertEqual(stats.functions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
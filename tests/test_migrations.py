@@ -0,0 +1,95 @@
+# tests/test_migrations.py
+
+import unittest
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base, SleepLog, UserFitnessGoalTarget
+from app.migrations import backfill_goal_targets, backfill_sleep_durations
+
+
+class MigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_backfill_sleep_durations_on_old_schema(self):
+        # Recreate sleep_logs the way it looked before the duration column
+        self.session.execute(text("DROP TABLE sleep_logs"))
+        self.session.execute(
+            text(
+                "CREATE TABLE sleep_logs (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                "start_time DATETIME, end_time DATETIME)"
+            )
+        )
+        self.session.execute(
+            text(
+                "INSERT INTO sleep_logs (user_id, start_time, end_time) VALUES "
+                "(1, '2021-01-01 22:00:00.000000', '2021-01-02 06:00:00.000000'), "
+                "(1, '2021-01-02 23:00:00.000000', '2021-01-03 06:30:00.000000'), "
+                "(2, '2021-01-01 21:00:00.000000', '2021-01-02 07:00:00.000000')"
+            )
+        )
+        self.session.commit()
+
+        self.assertEqual(backfill_sleep_durations(self.session, batch_size=2), 3)
+        self.assertEqual(backfill_sleep_durations(self.session), 0)
+
+        durations = [
+            round(duration, 6)
+            for (duration,) in self.session.query(SleepLog.duration).order_by(
+                SleepLog.id
+            )
+        ]
+        self.assertEqual(durations, [480.0, 450.0, 600.0])
+
+    def test_duration_follows_updates(self):
+        sleep_log = SleepLog(
+            user_id=1,
+            start_time=datetime(2021, 1, 1, 22, 0, 0),
+            end_time=datetime(2021, 1, 2, 6, 0, 0),
+        )
+        self.session.add(sleep_log)
+        self.session.commit()
+        self.assertEqual(sleep_log.duration, 480.0)
+
+        sleep_log.end_time = datetime(2021, 1, 2, 7, 15, 0)
+        self.session.commit()
+        self.assertEqual(sleep_log.duration, 555.0)
+
+    def test_backfill_goal_targets(self):
+        # Written with Core, so the ORM never filled the target table
+        self.session.execute(
+            text(
+                "INSERT INTO user_fitness_goals (id, user_id, target) VALUES "
+                "(1, 1, :object), (2, 2, :string), (3, 3, 'null'), (4, 4, 'oops')"
+            ),
+            {
+                "object": '{"sleep": 8, "weight": 70.5, "note": "x"}',
+                "string": '"{\\"sleep_hours\\": 7.5}"',
+            },
+        )
+        self.session.commit()
+
+        self.assertEqual(backfill_goal_targets(self.session), 3)
+        self.assertEqual(backfill_goal_targets(self.session), 3)
+        targets = self.session.query(
+            UserFitnessGoalTarget.goal_id,
+            UserFitnessGoalTarget.metric,
+            UserFitnessGoalTarget.user_id,
+            UserFitnessGoalTarget.value,
+        ).order_by(UserFitnessGoalTarget.goal_id, UserFitnessGoalTarget.metric)
+        self.assertEqual(
+            targets.all(),
+            [(1, "sleep", 1, 8.0), (1, "weight", 1, 70.5), (2, "sleep_hours", 2, 7.5)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+# tests/test_populate_db.py
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import (
+    Base,
+    User,
+    WorkoutLog,
+    SleepLog,
+    HeartRateLog,
+    WaterIntakeLog,
+    UserFitnessGoal,
+)  # noqa
+from app.populate_db import bulk_populate_database
+from app.parallel_populate import parallel_populate_database, split_user_ids
+
+
+class BulkPopulateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def count(self, model):
+        return self.session.query(func.count(model.id)).scalar()
+
+    def test_bulk_populate_row_counts(self):
+        bulk_populate_database(self.session, num_users=7, num_logs_per_user=3)
+
+        self.assertEqual(self.count(User), 7)
+        self.assertEqual(self.count(WorkoutLog), 21)
+        self.assertEqual(self.count(HeartRateLog), 21)
+        self.assertEqual(self.count(WaterIntakeLog), 21)
+        self.assertGreaterEqual(self.count(UserFitnessGoal), 7)
+
+    def test_bulk_populate_in_small_chunks_appends(self):
+        bulk_populate_database(self.session, num_users=3, num_logs_per_user=2)
+        bulk_populate_database(
+            self.session, num_users=5, num_logs_per_user=2, chunk_size=3
+        )
+
+        self.assertEqual(self.count(User), 8)
+        self.assertEqual(self.count(WorkoutLog), 16)
+
+    def test_bulk_populate_links_heart_rate_to_own_workout(self):
+        bulk_populate_database(
+            self.session, num_users=4, num_logs_per_user=5, chunk_size=4
+        )
+
+        linked = (
+            self.session.query(func.count(HeartRateLog.id))
+            .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
+            .filter(HeartRateLog.user_id == WorkoutLog.user_id)
+            .scalar()
+        )
+        self.assertEqual(linked, self.count(HeartRateLog))
+
+    def test_vectorized_bulk_populate(self):
+        bulk_populate_database(
+            self.session, num_users=6, num_logs_per_user=4, vectorized=True, seed=3
+        )
+
+        self.assertEqual(self.count(User), 6)
+        self.assertEqual(self.count(SleepLog), 24)
+        linked = (
+            self.session.query(func.count(HeartRateLog.id))
+            .join(WorkoutLog, HeartRateLog.workout_log_id == WorkoutLog.id)
+            .filter(HeartRateLog.user_id == WorkoutLog.user_id)
+            .scalar()
+        )
+        self.assertEqual(linked, 24)
+        for sleep_log in self.session.query(SleepLog):
+            self.assertLess(sleep_log.start_time, sleep_log.end_time)
+        for goal in self.session.query(UserFitnessGoal):
+            self.assertLessEqual(goal.start_date, goal.end_date)
+            self.assertIn("weight", goal.target)
+        water = self.session.query(func.min(WaterIntakeLog.water_intake)).scalar()
+        self.assertGreater(water, 0)
+
+
+class ParallelPopulateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def populate(self, name, vectorized=False, num_users=5, num_shards=2, **kwargs):
+        path = os.path.join(self.temp_dir.name, name)
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        parallel_populate_database(
+            session,
+            num_users=num_users,
+            num_logs_per_user=3,
+            num_shards=num_shards,
+            seed=7,
+            reference_time=datetime(2023, 6, 1),
+            vectorized=vectorized,
+            **kwargs,
+        )
+        session.close()
+        engine.dispose()
+
+        connection = sqlite3.connect(path)
+        tables = ["users", "workout_logs", "heart_rate_logs", "sleep_logs"]
+        dump = {
+            table: connection.execute(f"SELECT * FROM {table} ORDER BY id").fetchall()
+            for table in tables
+        }
+        connection.close()
+        return dump
+
+    def test_split_user_ids(self):
+        self.assertEqual(
+            split_user_ids(11, 5, 3), [range(11, 13), range(13, 15), range(15, 16)]
+        )
+        self.assertEqual(split_user_ids(1, 2, 4), [range(1, 2), range(2, 3)])
+
+    def test_parallel_populate_is_reproducible(self):
+        first = self.populate("first.db")
+        second = self.populate("second.db")
+
+        self.assertEqual(len(first["users"]), 5)
+        self.assertEqual(len(first["heart_rate_logs"]), 15)
+        self.assertEqual(first, second)
+
+    def test_vectorized_parallel_populate_is_reproducible(self):
+        first = self.populate("first.db", vectorized=True)
+        second = self.populate("second.db", vectorized=True)
+
+        self.assertEqual(len(first["sleep_logs"]), 15)
+        self.assertEqual(first, second)
+
+    def test_data_does_not_depend_on_the_shard_count(self):
+        for vectorized in (False, True):
+            two = self.populate(
+                f"two-{vectorized}.db", vectorized, 9, num_shards=2, block_size=2
+            )
+            four = self.populate(
+                f"four-{vectorized}.db", vectorized, 9, num_shards=4, block_size=2
+            )
+            self.assertEqual(len(two["users"]), 9)
+            self.assertEqual(two, four)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,277 @@
+# tests/test_queries.py
+
+import unittest
+import json
+from datetime import date
+from unittest import mock
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import (
+    Base,
+    HealthMetrics,
+    SleepLog,
+    User,
+    UserFitnessGoal,
+    UserFitnessGoalTarget,
+    WeightLog,
+)
+from app.populate_db import bulk_populate_database
+from app import queries
+
+
+class QueryTestCase(unittest.TestCase):
+    num_users = 12
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+        bulk_populate_database(
+            self.session,
+            num_users=self.num_users,
+            num_logs_per_user=6,
+            vectorized=True,
+            seed=11,
+        )
+        self.user_ids = list(range(1, self.num_users + 1))
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+
+class BatchQueryTestCase(QueryTestCase):
+    def assert_matches_single_user(self, batch_results, single_query, *args):
+        self.assertEqual(set(batch_results), set(self.user_ids))
+        for user_id in self.user_ids:
+            expected = single_query(self.session, user_id, *args)
+            self.assertEqual(batch_results[user_id], expected, user_id)
+
+    def test_batch_queries_match_single_user_queries(self):
+        start, end = date(2000, 1, 1), date(2100, 1, 1)
+        cases = [
+            (
+                queries.get_users_total_workout_duration,
+                queries.get_user_total_workout_duration,
+                (start, end),
+            ),
+            (
+                queries.get_users_avg_daily_caloric_intake,
+                queries.get_user_avg_daily_caloric_intake,
+                (),
+            ),
+            (
+                queries.get_users_avg_sleep_duration,
+                queries.get_user_avg_sleep_duration,
+                (),
+            ),
+            (queries.get_users_weight_records, queries.get_user_weight_records, ()),
+            (
+                queries.get_users_recent_blood_pressure,
+                queries.get_user_recent_blood_pressure,
+                (3,),
+            ),
+            (
+                queries.get_users_avg_heart_rate_during_workouts,
+                queries.get_user_avg_heart_rate_during_workouts,
+                (),
+            ),
+        ]
+        for batch_query, single_query, args in cases:
+            with self.subTest(batch_query.__name__):
+                self.assert_matches_single_user(
+                    batch_query(self.session, self.user_ids, *args),
+                    single_query,
+                    *args,
+                )
+
+    def test_batch_water_intake(self):
+        day = queries.get_users_weight_records(self.session, [1])[1][0][0]
+        results = queries.get_users_daily_water_intake(self.session, self.user_ids, day)
+        for user_id in self.user_ids:
+            self.assertEqual(
+                results[user_id],
+                queries.get_user_daily_water_intake(self.session, user_id, day),
+            )
+
+    def test_all_users_and_missing_users(self):
+        all_users = queries.get_users_avg_daily_caloric_intake(self.session, None)
+        self.assertEqual(set(all_users), set(self.user_ids))
+
+        results = queries.get_users_avg_heart_rate_during_workouts(
+            self.session, [1, 999]
+        )
+        self.assertEqual(results[999], 0)
+        self.assertEqual(
+            queries.get_users_weight_records(self.session, [999]), {999: []}
+        )
+
+    def test_large_id_lists_are_chunked(self):
+        expected = queries.get_users_avg_sleep_duration(self.session, self.user_ids)
+        with mock.patch.object(queries, "MAX_BOUND_PARAMETERS", 5):
+            chunked = queries.get_users_avg_sleep_duration(
+                self.session, self.user_ids + self.user_ids
+            )
+        self.assertEqual(chunked, expected)
+
+
+class SleepGoalTestCase(QueryTestCase):
+    def add_goal(self, user_id, target):
+        goal = UserFitnessGoal(
+            user_id=user_id,
+            goal_type_id=1,
+            target=target,
+            start_date=date(2020, 1, 1),
+            end_date=date(2020, 12, 31),
+            status="In Progress",
+        )
+        self.session.add(goal)
+        self.session.commit()
+        return goal
+
+    def expected(self, user_ids, hours):
+        averages = dict(
+            self.session.query(SleepLog.user_id, func.avg(SleepLog.duration))
+            .filter(SleepLog.user_id.in_(user_ids))
+            .group_by(SleepLog.user_id)
+        )
+        return {
+            self.session.get(User, user_id).username
+            for user_id, average in averages.items()
+            if average < hours * 60
+        }
+
+    def test_only_users_with_sleep_goals_are_checked(self):
+        self.assertEqual(
+            queries.get_users_not_meeting_sleep_goals(self.session, 24), []
+        )
+
+        dict_goal = self.add_goal(1, {"sleep": 8, "weight": 70})
+        self.add_goal(2, json.dumps({"sleep_hours": 7.5}))
+        # A second goal must not count the user's sleep logs twice
+        self.add_goal(2, {"sleep": 9})
+        for hours in [6, 8, 9, 24]:
+            with self.subTest(hours=hours):
+                self.assertEqual(
+                    sorted(
+                        queries.get_users_not_meeting_sleep_goals(self.session, hours)
+                    ),
+                    sorted(self.expected([1, 2], hours)),
+                )
+
+        dict_goal.target = {"weight": 70}
+        self.session.commit()
+        self.assertEqual(
+            queries.get_users_not_meeting_sleep_goals(self.session, 24), ["user_2"]
+        )
+        self.assertEqual(
+            self.session.query(UserFitnessGoalTarget.metric)
+            .filter_by(goal_id=dict_goal.id)
+            .all(),
+            [("weight",)],
+        )
+
+        for goal in self.session.query(UserFitnessGoal).filter_by(user_id=2):
+            self.session.delete(goal)
+        self.session.commit()
+        self.assertEqual(
+            queries.get_users_not_meeting_sleep_goals(self.session, 24), []
+        )
+
+
+class PrebuiltStatementTestCase(QueryTestCase):
+    def test_dates_can_be_iso_strings(self):
+        start, end, day = date(2015, 1, 1), date(2030, 1, 1), date(2020, 1, 1)
+        self.assertEqual(
+            queries.get_user_total_workout_duration(
+                self.session, 1, "2015-01-01", "2030-01-01"
+            ),
+            queries.get_user_total_workout_duration(self.session, 1, start, end),
+        )
+        self.assertEqual(
+            queries.get_user_summary(
+                self.session, 2, "2015-01-01", "2030-01-01", "2020-01-01"
+            ),
+            queries.get_user_summary(self.session, 2, start, end, day),
+        )
+
+    def test_pending_changes_are_flushed_first(self):
+        before = len(queries.get_user_weight_records(self.session, 1))
+        self.session.add(
+            WeightLog(user_id=1, date_recorded=date(2021, 1, 1), weight=70)
+        )
+        self.assertEqual(
+            len(queries.get_user_weight_records(self.session, 1)), before + 1
+        )
+
+
+class UserSummaryTestCase(QueryTestCase):
+    def test_summary_matches_individual_queries(self):
+        start, end = date(2018, 1, 1), date(2024, 12, 31)
+        water_day = queries.get_user_weight_records(self.session, 1)[0][0]
+        for user_id in [1, 5, self.num_users, 999]:
+            summary = queries.get_user_summary(
+                self.session, user_id, start, end, water_day, number_of_records=3
+            )
+            self.assertEqual(
+                summary,
+                queries.UserSummary(
+                    user_id=user_id,
+                    total_workout_duration=queries.get_user_total_workout_duration(
+                        self.session, user_id, start, end
+                    ),
+                    avg_daily_caloric_intake=queries.get_user_avg_daily_caloric_intake(
+                        self.session, user_id
+                    ),
+                    avg_sleep_duration=queries.get_user_avg_sleep_duration(
+                        self.session, user_id
+                    ),
+                    weight_records=queries.get_user_weight_records(
+                        self.session, user_id
+                    ),
+                    daily_water_intake=queries.get_user_daily_water_intake(
+                        self.session, user_id, water_day
+                    ),
+                    recent_blood_pressure=queries.get_user_recent_blood_pressure(
+                        self.session, user_id, 3
+                    ),
+                    avg_heart_rate_during_workouts=(
+                        queries.get_user_avg_heart_rate_during_workouts(
+                            self.session, user_id
+                        )
+                    ),
+                ),
+            )
+
+    def test_rows_without_a_date(self):
+        self.session.add(WeightLog(user_id=1, weight=70.5))
+        self.session.add(HealthMetrics(user_id=1, blood_pressure="120/80"))
+        self.session.commit()
+        start, end, day = date(2018, 1, 1), date(2024, 12, 31), date(2020, 1, 1)
+        summary = queries.get_user_summary(
+            self.session, 1, start, end, day, number_of_records=1000
+        )
+        self.assertIn((None, 70.5), summary.weight_records)
+        self.assertIn((None, "120/80"), summary.recent_blood_pressure)
+        self.assertEqual(
+            summary.weight_records, queries.get_user_weight_records(self.session, 1)
+        )
+        self.assertEqual(
+            summary.recent_blood_pressure,
+            queries.get_user_recent_blood_pressure(self.session, 1, 1000),
+        )
+
+    def test_rows_without_a_weight(self):
+        self.session.add(WeightLog(user_id=1, date_recorded=date(2020, 1, 1)))
+        self.session.commit()
+        start, end, day = date(2018, 1, 1), date(2024, 12, 31), date(2020, 1, 1)
+        summary = queries.get_user_summary(self.session, 1, start, end, day)
+        self.assertIn((date(2020, 1, 1), None), summary.weight_records)
+        self.assertEqual(
+            summary.weight_records, queries.get_user_weight_records(self.session, 1)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
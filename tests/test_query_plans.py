@@ -0,0 +1,151 @@
+# tests/test_query_plans.py
+
+import inspect
+import re
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import Base
+from app.populate_db import bulk_populate_database
+from app import queries
+
+START, END, DAY = date(2018, 1, 1), date(2020, 12, 31), date(2019, 6, 1)
+
+# Arguments used to call every query function, after the session
+QUERY_ARGS = {
+    "get_user_total_workout_duration": (1, START, END),
+    "get_user_avg_daily_caloric_intake": (1,),
+    "get_user_avg_sleep_duration": (1,),
+    "get_user_weight_records": (1,),
+    "get_users_not_meeting_sleep_goals": (8,),
+    "get_user_daily_water_intake": (1, DAY),
+    "get_user_recent_blood_pressure": (1,),
+    "get_user_avg_heart_rate_during_workouts": (1,),
+    "get_user_heart_rate_by_exercise_type": (1,),
+    "get_user_summary": (1, START, END, DAY),
+    "get_users_total_workout_duration": ([1, 2, 3], START, END),
+    "get_users_avg_daily_caloric_intake": ([1, 2, 3],),
+    "get_users_avg_sleep_duration": ([1, 2, 3],),
+    "get_users_weight_records": ([1, 2, 3],),
+    "get_users_daily_water_intake": ([1, 2, 3], DAY),
+    "get_users_recent_blood_pressure": ([1, 2, 3],),
+    "get_users_avg_heart_rate_during_workouts": ([1, 2, 3],),
+}
+
+# Query functions that can read the daily_user_stats rollup instead
+ROLLUP_QUERIES = [
+    "get_user_total_workout_duration",
+    "get_user_avg_daily_caloric_intake",
+    "get_user_avg_sleep_duration",
+    "get_user_daily_water_intake",
+    "get_user_avg_heart_rate_during_workouts",
+]
+
+# Query functions that can read workout_heart_rate_summaries instead
+WORKOUT_SUMMARY_QUERIES = [
+    "get_user_avg_heart_rate_during_workouts",
+    "get_users_avg_heart_rate_during_workouts",
+]
+
+
+def query_functions():
+    return {
+        name: function
+        for name, function in inspect.getmembers(queries, inspect.isfunction)
+        if name.startswith("get_") and function.__module__ == queries.__name__
+    }
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Every query must be answered with index searches and no temp B-tree sort."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(cls.engine)
+        cls.session = sessionmaker(bind=cls.engine)()
+        bulk_populate_database(
+            cls.session, num_users=20, num_logs_per_user=5, vectorized=True, seed=5
+        )
+        cls.table_names = set(Base.metadata.tables)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+        cls.engine.dispose()
+
+    def capture_statements(self, function, args, kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+            statements.append((statement, parameters))
+
+        event.listen(self.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            function(self.session, *args, **kwargs)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", before_cursor_execute)
+        return statements
+
+    def query_plan(self, statement, parameters):
+        connection = self.session.connection()
+        rows = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).fetchall()
+        return [row[-1] for row in rows]
+
+    def plan_problems(self, plan):
+        problems = []
+        for detail in plan:
+            if "TEMP B-TREE" in detail:
+                problems.append(detail)
+            # SQLite before 3.36 writes "SCAN TABLE weight_logs"
+            match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+            if match and match.group(1) in self.table_names:
+                problems.append(detail)
+        return problems
+
+    def test_full_scans_are_detected_in_both_plan_formats(self):
+        for detail in ("SCAN weight_logs", "SCAN TABLE weight_logs"):
+            self.assertEqual(self.plan_problems([detail]), [detail])
+        self.assertEqual(
+            self.plan_problems(["SCAN TABLE weight_logs USING COVERING INDEX x"]),
+            ["SCAN TABLE weight_logs USING COVERING INDEX x"],
+        )
+        self.assertEqual(self.plan_problems(["SCAN CONSTANT ROW"]), [])
+
+    def test_every_query_function_is_covered(self):
+        self.assertEqual(set(query_functions()), set(QUERY_ARGS))
+
+    def assert_uses_indexes(self, function, args, kwargs=None):
+        statements = self.capture_statements(function, args, kwargs or {})
+        self.assertTrue(statements)
+        for statement, parameters in statements:
+            plan = self.query_plan(statement, parameters)
+            self.assertEqual(self.plan_problems(plan), [], f"{statement}\n{plan}")
+
+    def test_query_plans_use_indexes(self):
+        for name, function in sorted(query_functions().items()):
+            with self.subTest(name):
+                self.assert_uses_indexes(function, QUERY_ARGS[name])
+
+    def test_rollup_query_plans_use_indexes(self):
+        functions = query_functions()
+        for name in ROLLUP_QUERIES:
+            with self.subTest(name):
+                self.assert_uses_indexes(
+                    functions[name], QUERY_ARGS[name], {"use_rollup": True}
+                )
+
+    def test_workout_summary_query_plans_use_indexes(self):
+        functions = query_functions()
+        for name in WORKOUT_SUMMARY_QUERIES:
+            with self.subTest(name):
+                self.assert_uses_indexes(
+                    functions[name], QUERY_ARGS[name], {"use_workout_summaries": True}
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
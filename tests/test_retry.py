@@ -0,0 +1,127 @@
+# tests/test_retry.py
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.engine import create_app_engine
+from app.models.tables import Base, User, WaterIntakeLog
+from app.retry import RetryPolicy, is_lock_error, run_in_transaction
+from app.write_buffer import WriteBuffer
+
+
+def lock_error():
+    return OperationalError(
+        "INSERT ...", {}, sqlite3.OperationalError("database is locked")
+    )
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.waits = []
+        self.policy = RetryPolicy(attempts=3, sleep=self.waits.append)
+
+    def test_lock_errors_are_retried(self):
+        outcomes = [lock_error(), lock_error(), "done"]
+
+        def transaction():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(self.policy.call(transaction), "done")
+        self.assertEqual(len(self.waits), 2)
+        self.assertLessEqual(self.waits[1], self.policy.base_delay * 2)
+        self.assertEqual(self.policy.stats(), {"calls": 1, "retries": 2, "failures": 0})
+
+    def test_other_errors_and_exhaustion(self):
+        def broken():
+            raise ValueError("not a lock")
+
+        with self.assertRaises(ValueError):
+            self.policy.call(broken)
+        self.assertEqual(self.waits, [])
+
+        def locked():
+            raise lock_error()
+
+        with self.assertRaises(OperationalError):
+            self.policy.call(locked)
+        self.assertEqual(self.policy.stats()["failures"], 1)
+        self.assertEqual(len(self.waits), 2)
+
+    def test_delays_are_bounded(self):
+        policy = RetryPolicy(base_delay=0.01, max_delay=0.05)
+        for retry in range(20):
+            self.assertLessEqual(policy.delay(retry), 0.05)
+        self.assertTrue(is_lock_error(lock_error()))
+        self.assertFalse(is_lock_error(OperationalError("x", {}, Exception("no"))))
+
+
+class LockedDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "app.db")
+        # Fail at once instead of waiting for the lock
+        self.engine = create_app_engine(
+            f"sqlite:///{self.path}", pragmas={"busy_timeout": 0}
+        )
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as session:
+            session.add(User(id=1, username="user1", email="1@x.org"))
+            session.commit()
+
+        self.blocker = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self.blocker.execute("BEGIN IMMEDIATE")
+        self.waits = []
+
+        def release_on_first_wait(seconds):
+            self.waits.append(seconds)
+            if self.blocker.in_transaction:
+                self.blocker.execute("COMMIT")
+
+        self.policy = RetryPolicy(sleep=release_on_first_wait)
+
+    def tearDown(self):
+        self.blocker.close()
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def count(self):
+        with self.Session() as session:
+            return session.execute(select(func.count(WaterIntakeLog.id))).scalar()
+
+    def water_log(self):
+        return WaterIntakeLog(user_id=1, date=date(2024, 1, 1), water_intake=250)
+
+    def test_transaction_waits_for_the_lock(self):
+        def add_log(session):
+            log = self.water_log()
+            session.add(log)
+            session.flush()
+            return log.id
+
+        log_id = run_in_transaction(self.Session, add_log, policy=self.policy)
+        self.assertEqual(log_id, 1)
+        self.assertEqual(len(self.waits), 1)
+        self.assertEqual(self.count(), 1)
+
+    def test_write_buffer_retries_the_batch(self):
+        with WriteBuffer(self.Session, retry_policy=self.policy) as buffer:
+            futures = [buffer.add(self.water_log()) for _ in range(3)]
+        self.assertEqual(len({future.result(0) for future in futures}), 3)
+        self.assertEqual(self.policy.stats()["retries"], 1)
+        self.assertEqual(self.count(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
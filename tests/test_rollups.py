@@ -0,0 +1,251 @@
+# tests/test_rollups.py
+
+import unittest
+from datetime import date, datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.tables import (
+    Base,
+    User,
+    WorkoutLog,
+    NutritionLog,
+    SleepLog,
+    HeartRateLog,
+    WaterIntakeLog,
+    DailyUserStats,
+)  # noqa
+from app.populate_db import bulk_populate_database, populate_database
+from app.rollups import STAT_COLUMNS, install_rollup_hooks, rebuild_daily_user_stats
+from app import queries
+
+
+class RollupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        install_rollup_hooks(Session)
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def stats(self):
+        return {
+            (row.user_id, row.day): tuple(
+                round(getattr(row, column), 6) for column in STAT_COLUMNS
+            )
+            for row in self.session.query(DailyUserStats)
+            if any(getattr(row, column) for column in STAT_COLUMNS)
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.stats()
+        rebuild_daily_user_stats(self.session)
+        self.assertEqual(incremental, self.stats())
+
+    def test_inserts_updates_and_deletes_are_rolled_up(self):
+        user = User(username="rollup", age=30, email="rollup@example.com")
+        workout = WorkoutLog(
+            user=user, date=date(2021, 1, 1), exercise_type="Yoga", duration=45.0
+        )
+        sleep = SleepLog(
+            user=user,
+            start_time=datetime(2021, 1, 1, 22, 0),
+            end_time=datetime(2021, 1, 2, 6, 30),
+        )
+        meal = NutritionLog(user=user, date=date(2021, 1, 1), food="Rice", calories=600)
+        self.session.add_all(
+            [
+                workout,
+                sleep,
+                meal,
+                WaterIntakeLog(user=user, date=date(2021, 1, 1), water_intake=750),
+                HeartRateLog(
+                    user=user,
+                    workout_log=workout,
+                    time_recorded=datetime(2021, 1, 1, 7, 0),
+                    heart_rate=150,
+                ),
+                HeartRateLog(
+                    user=user, time_recorded=datetime(2021, 1, 1, 9, 0), heart_rate=70
+                ),
+            ]
+        )
+        self.session.commit()
+
+        row = self.session.get(DailyUserStats, (user.id, date(2021, 1, 1)))
+        self.assertEqual(row.workout_minutes, 45.0)
+        self.assertEqual(row.sleep_minutes, 510.0)
+        self.assertEqual(row.water_intake, 750)
+        self.assertEqual((row.heart_rate_sum, row.heart_rate_count), (220, 2))
+        self.assertEqual(
+            (row.workout_heart_rate_sum, row.workout_heart_rate_count), (150, 1)
+        )
+
+        workout.duration = 60.0
+        workout.date = date(2021, 1, 3)
+        sleep.end_time = datetime(2021, 1, 2, 5, 0)
+        self.session.delete(meal)
+        self.session.commit()
+        self.assert_matches_rebuild()
+
+        row = self.session.get(DailyUserStats, (user.id, date(2021, 1, 1)))
+        self.assertEqual((row.workout_minutes, row.calories, row.meal_count), (0, 0, 0))
+        self.assertAlmostEqual(row.sleep_minutes, 420.0, places=4)
+
+    def test_workout_heart_rate_counts_for_the_workout_user(self):
+        owner = User(username="owner", age=30, email="owner@example.com")
+        other = User(username="other", age=31, email="other@example.com")
+        workout = WorkoutLog(
+            user=owner, date=date(2021, 1, 1), exercise_type="Run", duration=30.0
+        )
+        # A sample logged under another user than its workout's
+        sample = HeartRateLog(
+            user=other,
+            workout_log=workout,
+            time_recorded=datetime(2021, 1, 1, 7, 0),
+            heart_rate=140,
+        )
+        self.session.add_all([owner, other, workout, sample])
+        self.session.commit()
+
+        def averages():
+            return [
+                (
+                    queries.get_user_avg_heart_rate_during_workouts(
+                        self.session, user.id, use_rollup=True
+                    ),
+                    queries.get_user_avg_heart_rate_during_workouts(
+                        self.session, user.id
+                    ),
+                )
+                for user in [owner, other]
+            ]
+
+        self.assertEqual(averages(), [(140, 140), (0, 0)])
+        workout.user = other
+        self.session.commit()
+        self.assertEqual(averages(), [(0, 0), (140, 140)])
+        self.assert_matches_rebuild()
+
+        self.session.delete(workout)
+        self.session.commit()
+        self.assertEqual(averages(), [(0, 0), (0, 0)])
+        self.assert_matches_rebuild()
+
+    def test_rows_without_a_date_are_left_out(self):
+        user = User(username="undated", age=30, email="undated@example.com")
+        self.session.add_all(
+            [
+                NutritionLog(user=user, date=date(2021, 1, 1), calories=600),
+                NutritionLog(user=user, date=None, calories=900),
+                WorkoutLog(
+                    id=1, user=user, date=date(2021, 1, 1), exercise_type="Yoga"
+                ),
+                HeartRateLog(
+                    user=user,
+                    workout_log_id=1,
+                    time_recorded=datetime(2021, 1, 1, 7, 0),
+                    heart_rate=100,
+                ),
+                HeartRateLog(
+                    user=user, workout_log_id=1, time_recorded=None, heart_rate=160
+                ),
+            ]
+        )
+        self.session.commit()
+        self.assertEqual(
+            queries.get_user_avg_daily_caloric_intake(self.session, user.id), 750
+        )
+        self.assertEqual(
+            queries.get_user_avg_daily_caloric_intake(
+                self.session, user.id, use_rollup=True
+            ),
+            600,
+        )
+        self.assertEqual(
+            queries.get_user_avg_heart_rate_during_workouts(self.session, user.id), 130
+        )
+        self.assertEqual(
+            queries.get_user_avg_heart_rate_during_workouts(
+                self.session, user.id, use_rollup=True
+            ),
+            100,
+        )
+        self.assert_matches_rebuild()
+
+    def test_rollup_queries_match_raw_queries(self):
+        populate_database(self.session, num_users=3, num_logs_per_user=8)
+        self.assert_matches_rebuild()
+
+        for user_id in [1, 2, 3]:
+            self.assertAlmostEqual(
+                queries.get_user_avg_daily_caloric_intake(
+                    self.session, user_id, use_rollup=True
+                ),
+                queries.get_user_avg_daily_caloric_intake(self.session, user_id),
+            )
+            self.assertAlmostEqual(
+                queries.get_user_avg_sleep_duration(
+                    self.session, user_id, use_rollup=True
+                ),
+                queries.get_user_avg_sleep_duration(self.session, user_id),
+                places=4,
+            )
+            self.assertAlmostEqual(
+                queries.get_user_total_workout_duration(
+                    self.session,
+                    user_id,
+                    date(2000, 1, 1),
+                    date(2100, 1, 1),
+                    use_rollup=True,
+                ),
+                queries.get_user_total_workout_duration(
+                    self.session, user_id, date(2000, 1, 1), date(2100, 1, 1)
+                ),
+            )
+            self.assertAlmostEqual(
+                queries.get_user_avg_heart_rate_during_workouts(
+                    self.session, user_id, use_rollup=True
+                ),
+                queries.get_user_avg_heart_rate_during_workouts(self.session, user_id),
+            )
+            day = self.session.query(WaterIntakeLog.date).filter_by(user_id=user_id)[0]
+            self.assertEqual(
+                queries.get_user_daily_water_intake(
+                    self.session, user_id, day.date, use_rollup=True
+                ),
+                queries.get_user_daily_water_intake(self.session, user_id, day.date),
+            )
+
+    def test_hooks_are_installed_once_per_factory(self):
+        for _ in range(50):
+            # New factories can reuse the id of collected ones
+            Session = sessionmaker(bind=self.engine)
+            install_rollup_hooks(Session)
+            install_rollup_hooks(Session)
+            with Session() as session:
+                session.add(
+                    WaterIntakeLog(user_id=1, date=date(2021, 1, 1), water_intake=1)
+                )
+                session.commit()
+        row = self.session.get(DailyUserStats, (1, date(2021, 1, 1)))
+        self.assertEqual(row.water_intake, 50)
+
+    def test_rebuild_after_bulk_load(self):
+        bulk_populate_database(
+            self.session, num_users=4, num_logs_per_user=5, vectorized=True, seed=2
+        )
+        self.assertEqual(self.stats(), {})
+
+        rebuild_daily_user_stats(self.session, user_ids=[2])
+        self.assertEqual({user_id for user_id, _ in self.stats()}, {2})
+
+        rebuild_daily_user_stats(self.session)
+        self.assertEqual({user_id for user_id, _ in self.stats()}, {1, 2, 3, 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+# tests/test_workout_summaries.py
+
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import queries
+from app.ingest import ingest_heart_rates
+from app.models.tables import (
+    Base,
+    HeartRateLog,
+    User,
+    WorkoutHeartRateSummary,
+    WorkoutLog,
+)
+from app.populate_db import bulk_populate_database
+from app.workout_summaries import (
+    close_workouts,
+    max_heart_rate,
+    rebuild_workout_summaries,
+)
+
+START = datetime(2024, 5, 1, 7)
+
+
+class WorkoutSummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        # Zones start at 100, 120, 140, 160 and 180 bpm
+        self.session.add(User(id=1, username="runner", age=20))
+        self.session.add_all(
+            [
+                WorkoutLog(id=1, user_id=1, date=START.date(), exercise_type="Running"),
+                WorkoutLog(id=2, user_id=1, date=START.date(), exercise_type="Yoga"),
+                WorkoutLog(id=3, user_id=1, date=START.date(), exercise_type="Running"),
+            ]
+        )
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def add_samples(self, workout_id, samples):
+        # One workout per hour, a user has one sample per instant
+        started = START + timedelta(hours=workout_id - 1)
+        self.session.add_all(
+            HeartRateLog(
+                user_id=1,
+                workout_log_id=workout_id,
+                time_recorded=started + timedelta(seconds=seconds),
+                heart_rate=heart_rate,
+            )
+            for seconds, heart_rate in samples
+        )
+
+    def summary(self, workout_id):
+        return self.session.get(WorkoutHeartRateSummary, workout_id)
+
+    def test_summary_of_a_closed_workout(self):
+        self.assertEqual(max_heart_rate(20), 200)
+        self.add_samples(
+            1, [(0, 90), (10, 110), (20, 130), (30, 150), (200, 170), (210, 190)]
+        )
+        self.assertEqual(close_workouts(self.session, [1, 2]), 1)
+
+        summary = self.summary(1)
+        self.assertEqual(
+            (
+                summary.user_id,
+                summary.exercise_type,
+                summary.sample_count,
+                summary.heart_rate_sum,
+                summary.min_heart_rate,
+                summary.max_heart_rate,
+            ),
+            (1, "Running", 6, 840, 90, 190),
+        )
+        # The 170 s gap counts 60 s, the last sample counts nothing and the
+        # first is below zone 1
+        zones = [
+            summary.zone_1_seconds,
+            summary.zone_2_seconds,
+            summary.zone_3_seconds,
+            summary.zone_4_seconds,
+            summary.zone_5_seconds,
+        ]
+        for seconds, expected in zip(zones, [10, 10, 60, 10, 0]):
+            self.assertAlmostEqual(seconds, expected, places=3)
+        self.assertIsNone(self.summary(2))
+
+    def test_queries_read_the_summaries(self):
+        self.add_samples(1, [(0, 120), (30, 150)])
+        self.add_samples(2, [(0, 80), (30, 90), (60, 100)])
+        self.add_samples(3, [(0, 170)])
+        close_workouts(self.session, [1, 2, 3])
+
+        raw = queries.get_user_avg_heart_rate_during_workouts(self.session, 1)
+        self.assertAlmostEqual(raw, 710 / 6)
+        self.assertAlmostEqual(
+            queries.get_user_avg_heart_rate_during_workouts(
+                self.session, 1, use_workout_summaries=True
+            ),
+            raw,
+        )
+        self.assertEqual(
+            queries.get_users_avg_heart_rate_during_workouts(
+                self.session, [1, 2], use_workout_summaries=True
+            ),
+            {1: raw, 2: 0},
+        )
+
+        running, yoga = queries.get_user_heart_rate_by_exercise_type(self.session, 1)
+        self.assertEqual(
+            running,
+            queries.ExerciseHeartRate("Running", 2, 440 / 3, 170, (0, 30.0, 0, 0, 0)),
+        )
+        self.assertEqual((yoga.exercise_type, yoga.workouts), ("Yoga", 1))
+        # Below zone 1 the whole time
+        self.assertEqual(yoga.zone_seconds, (0, 0, 0, 0, 0))
+
+    def test_ingest_updates_the_workout_summary(self):
+        self.add_samples(1, [(0, 120)])
+        close_workouts(self.session, [1])
+        report = ingest_heart_rates(
+            self.session,
+            [
+                {
+                    "user_id": 1,
+                    "workout_log_id": 1,
+                    "time_recorded": START + timedelta(seconds=20),
+                    "heart_rate": 150,
+                },
+                {"user_id": 1, "time_recorded": START, "heart_rate": 60},
+            ],
+        )
+        self.assertEqual(report.inserted, 1)
+        summary = self.summary(1)
+        self.assertEqual((summary.sample_count, summary.max_heart_rate), (2, 150))
+        self.assertAlmostEqual(summary.zone_2_seconds, 20, places=3)
+
+    def test_rebuild_matches_the_raw_queries(self):
+        Base.metadata.drop_all(self.engine)
+        Base.metadata.create_all(self.engine)
+        bulk_populate_database(
+            self.session, num_users=10, num_logs_per_user=20, vectorized=True, seed=3
+        )
+        rebuild_workout_summaries(self.session)
+        user_ids = list(range(1, 11))
+        raw = queries.get_users_avg_heart_rate_during_workouts(self.session, user_ids)
+        summarized = queries.get_users_avg_heart_rate_during_workouts(
+            self.session, user_ids, use_workout_summaries=True
+        )
+        for user_id in user_ids:
+            self.assertAlmostEqual(summarized[user_id], raw[user_id])
+
+        rebuild_workout_summaries(self.session, user_ids=[1, 2])
+        self.assertEqual(
+            queries.get_users_avg_heart_rate_during_workouts(
+                self.session, user_ids, use_workout_summaries=True
+            ),
+            summarized,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
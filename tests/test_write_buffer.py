@@ -0,0 +1,158 @@
+# tests/test_write_buffer.py
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app.engine import create_app_engine
+from app.models.tables import Base, DailyUserStats, User, WaterIntakeLog
+from app.rollups import install_rollup_hooks, rebuild_daily_user_stats
+from app.write_buffer import WriteBuffer
+
+
+class WriteBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_app_engine(
+            f"sqlite:///{os.path.join(self.directory, 'app.db')}"
+        )
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        install_rollup_hooks(self.Session)
+        with self.Session() as session:
+            session.add_all(
+                User(id=user_id, username=f"user{user_id}", email=f"{user_id}@x.org")
+                for user_id in range(1, 5)
+            )
+            session.commit()
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def water_log(self, user_id, water_intake=250):
+        return WaterIntakeLog(
+            user_id=user_id, date=date(2024, 1, 1), water_intake=water_intake
+        )
+
+    def test_concurrent_writers_share_commits(self):
+        futures = []
+        lock = threading.Lock()
+
+        def writer(user_id):
+            for _ in range(100):
+                future = buffer.add(self.water_log(user_id))
+                with lock:
+                    futures.append(future)
+
+        with WriteBuffer(self.Session, max_batch_rows=500, max_delay_ms=20) as buffer:
+            threads = [
+                threading.Thread(target=writer, args=(user_id,))
+                for user_id in range(1, 5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        ids = [future.result(timeout=0) for future in futures]
+        self.assertEqual(len(set(ids)), 400)
+        stats = buffer.stats()
+        self.assertEqual(stats["rows"], 400)
+        self.assertLess(stats["transactions"], 40)
+
+        with self.Session() as session:
+            self.assertEqual(
+                session.execute(select(func.count(WaterIntakeLog.id))).scalar(), 400
+            )
+            maintained = session.execute(
+                select(DailyUserStats.user_id, DailyUserStats.water_intake)
+            ).all()
+            rebuild_daily_user_stats(session)
+            self.assertEqual(
+                sorted(maintained),
+                sorted(
+                    session.execute(
+                        select(DailyUserStats.user_id, DailyUserStats.water_intake)
+                    ).all()
+                ),
+            )
+
+    def test_only_failing_rows_get_the_error(self):
+        with WriteBuffer(self.Session, max_delay_ms=50) as buffer:
+            good = [buffer.add(self.water_log(1)) for _ in range(3)]
+            bad = buffer.add(self.water_log(1, water_intake=-5))
+            good.append(buffer.add(self.water_log(2)))
+
+        self.assertIsInstance(bad.exception(timeout=0), IntegrityError)
+        self.assertTrue(all(isinstance(future.result(0), int) for future in good))
+        self.assertEqual(buffer.stats()["failed"], 1)
+        self.assertEqual(buffer.stats()["rows"], 4)
+
+    def test_backpressure_and_shutdown(self):
+        release = threading.Event()
+
+        def slow_session():
+            release.wait()
+            return self.Session()
+
+        buffer = WriteBuffer(slow_session, max_delay_ms=0, max_queue_rows=1)
+        first = buffer.add(self.water_log(1))
+        second = None
+        # The writer takes the first object and blocks, the second fills the queue
+        for _ in range(100):
+            try:
+                second = buffer.add(self.water_log(1), timeout=0.05)
+                break
+            except queue.Full:
+                pass
+        self.assertIsNotNone(second)
+        with self.assertRaises(queue.Full):
+            buffer.add(self.water_log(1), timeout=0.05)
+
+        release.set()
+        buffer.close()
+        self.assertTrue(first.done() and second.done())
+        self.assertNotEqual(first.result(), second.result())
+        with self.assertRaises(RuntimeError):
+            buffer.add(self.water_log(1))
+
+    def test_cancelled_futures_are_skipped(self):
+        release = threading.Event()
+
+        def slow_session():
+            release.wait()
+            return self.Session()
+
+        buffer = WriteBuffer(slow_session, max_delay_ms=0)
+        first = buffer.add(self.water_log(1))
+        # Wait for the writer to take the first object and block on its session
+        for _ in range(500):
+            if first.running():
+                break
+            release.wait(0.01)
+        queued = [buffer.add(self.water_log(1)) for _ in range(3)]
+        self.assertFalse(first.cancel())
+        self.assertTrue(queued[1].cancel())
+        release.set()
+
+        self.assertIsInstance(first.result(timeout=5), int)
+        self.assertIsInstance(queued[0].result(timeout=5), int)
+        self.assertIsInstance(queued[2].result(timeout=5), int)
+        self.assertIsInstance(buffer.add(self.water_log(2)).result(timeout=5), int)
+        buffer.close()
+        self.assertEqual(buffer.stats()["rows"], 4)
+        with self.Session() as session:
+            self.assertEqual(
+                session.execute(select(func.count(WaterIntakeLog.id))).scalar(), 4
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()